@@ -0,0 +1,130 @@
+""" background frame prefetching for the tracker loop """
+import threading
+import time
+from collections import deque
+
+
+class FramePrefetcher(object):
+    """ decode upcoming frames of an MCVideo on a background thread into
+        a bounded ring buffer so disk reads overlap the filter """
+
+    def __init__(self, video, start_frame, end_frame, depth=4):
+        self._video = video
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.depth = max(1, int(depth))
+
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._stopped = False
+        # exception the background reader stopped on
+        self._error = None
+        self._next_read = start_frame
+        self._next_serve = start_frame
+
+        # sizing counters
+        self.frames_served = 0
+        self.frames_missed = 0
+        self.stall_count = 0
+        self.stall_time = 0.0
+        self.max_depth = 0
+        self._depth_total = 0
+
+        self._thread = threading.Thread(
+            target=self._worker, name='frame_prefetch', daemon=True)
+        self._thread.start()
+
+    def _worker(self):
+        """ producer loop, reads frames until the range is exhausted """
+        while True:
+            with self._lock:
+                while len(self._buffer) >= self.depth and not self._stopped:
+                    self._not_full.wait()
+                if self._stopped or self._next_read >= self.end_frame:
+                    self._stopped = True
+                    self._not_empty.notify_all()
+                    return
+                frame_num = self._next_read
+                self._next_read += 1
+
+            # decode outside of the lock so the consumer is never blocked
+            try:
+                frame = self._video.get_pix_frame(frame_num)
+            except Exception as error:  # pylint: disable=W0703
+                # stop reading, the consumer raises it for this frame
+                with self._lock:
+                    self._error = error
+                    self._stopped = True
+                    self._not_empty.notify_all()
+                return
+
+            with self._lock:
+                self._buffer.append((frame_num, frame))
+                self._not_empty.notify()
+
+    def get_pix_frame(self, frame_num):
+        """ retrieve pixel-domain frame, blocking only if the
+            background reader has not produced it yet """
+        with self._lock:
+            depth = len(self._buffer)
+            self._depth_total += depth
+            self.max_depth = max(self.max_depth, depth)
+
+            if self._next_serve <= frame_num < self.end_frame:
+                stall_start = None
+                while True:
+                    # drop frames the caller skipped over
+                    while self._buffer and self._buffer[0][0] < frame_num:
+                        self._buffer.popleft()
+                        self._not_full.notify()
+                    if self._buffer or self._stopped:
+                        break
+                    if stall_start is None:
+                        self.stall_count += 1
+                        stall_start = time.perf_counter()
+                    self._not_empty.wait()
+                if stall_start is not None:
+                    self.stall_time += time.perf_counter() - stall_start
+
+                if self._buffer and self._buffer[0][0] == frame_num:
+                    _, frame = self._buffer.popleft()
+                    self._not_full.notify()
+                    self._next_serve = frame_num + 1
+                    self.frames_served += 1
+                    return frame
+                if self._error is not None:
+                    raise self._error
+
+        # outside the prefetched range, read synchronously
+        self.frames_missed += 1
+        return self._video.get_pix_frame(frame_num)
+
+    def queue_depth(self):
+        """ number of decoded frames currently waiting in the buffer """
+        with self._lock:
+            return len(self._buffer)
+
+    def stats(self):
+        """ counters for sizing the prefetch depth """
+        requests = self.frames_served + self.frames_missed
+        return {
+            'depth': self.depth,
+            'frames_served': self.frames_served,
+            'frames_missed': self.frames_missed,
+            'stall_count': self.stall_count,
+            'stall_time': self.stall_time,
+            'max_queue_depth': self.max_depth,
+            'mean_queue_depth':
+                self._depth_total / requests if requests else 0.0
+        }
+
+    def close(self):
+        """ stop the background reader and release buffered frames """
+        with self._lock:
+            self._stopped = True
+            self._buffer.clear()
+            self._not_full.notify_all()
+            self._not_empty.notify_all()
+        self._thread.join()
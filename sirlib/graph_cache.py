@@ -0,0 +1,169 @@
+""" on-disk cache of built sir filter graphs, a new worker process imports
+    the serialized graph of a configuration instead of rebuilding it
+
+    each entry is a meta graph, <key>.meta, and the SIRGraph attributes
+    build_graph set, <key>.json, as names of the tensors, operations and
+    variables they refer to; the key hashes the options, and entries sit
+    in a subdirectory named by a digest of the graph building sources and
+    the tensorflow version, so checkouts of other code share the cache
+    directory without reading or removing each other's entries """
+from os import path, environ, getpid, makedirs, replace
+from functools import lru_cache
+import hashlib
+import json
+import numpy as np
+import tensorflow as tf
+from google.protobuf.message import DecodeError
+from template_updating import TemplateHistory
+from graph_pool import RESET_OPTIONS, stateless_draws
+
+DEFAULT_CACHE_DIR = environ.get(
+    'SIR_GRAPH_CACHE',
+    path.join(path.expanduser('~'), '.cache', 'sir_graphs'))
+
+# modules whose code shapes a built graph
+_SOURCES = ('sir_graph.py', 'template_updating.py', 'redetect.py',
+            'sir_energy.py', 'graph_cache.py')
+
+
+def cache_dir(option):
+    """ directory of a graph_cache option, true for the default """
+    return DEFAULT_CACHE_DIR if option is True else option
+
+
+@lru_cache(maxsize=None)
+def code_version():
+    """ digest of the graph building sources and tensorflow version """
+    digest = hashlib.sha256(tf.__version__.encode('utf-8'))
+    for source in _SOURCES:
+        with open(path.join(path.dirname(__file__), source), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def cache_key(sir_options, video_options, template_options):
+    """ entry name of a graph built with these options, cached graphs
+        draw statelessly so jobs differing only in the seeds and template
+        size they are fed share an entry """
+    options = {k: v for k, v in sir_options.items()
+               if k != 'graph_cache' and
+               not (stateless_draws(sir_options) and k in RESET_OPTIONS)}
+    run_count = len(sir_options.get('seeds') or [sir_options['seed']])
+    return hashlib.sha256(json.dumps(
+        [options, run_count, video_options, template_options],
+        sort_keys=True, default=str).encode('utf-8')).hexdigest()[:32]
+
+
+def _entry_paths(sir_graph, directory):
+    """ meta graph and attribute file of the entry of sir_graph """
+    key = cache_key(sir_graph.sir_options, sir_graph.video_options,
+                    sir_graph.template_options)
+    version_dir = path.join(directory, code_version()[:16])
+    return (path.join(version_dir, key + '.meta'),
+            path.join(version_dir, key + '.json'))
+
+
+def _encode(value):
+    """ json description of a built attribute, None if it has no
+        meaning outside this process """
+    if isinstance(value, tf.Variable):
+        return {'variable': value.name}
+    if isinstance(value, tf.Tensor):
+        return {'tensor': value.name}
+    if isinstance(value, tf.Operation):
+        return {'operation': value.name}
+    if isinstance(value, tf.Graph):
+        return {'graph': None}
+    if isinstance(value, TemplateHistory):
+        return {'template_history': _encode(vars(value))}
+    if isinstance(value, tf.Dimension):
+        return {'value': value.value}
+    if isinstance(value, np.generic):
+        return {'value': value.item()}
+    if isinstance(value, dict):
+        encoded = {k: _encode(v) for k, v in value.items()}
+        if any(v is None for v in encoded.values()):
+            return None
+        return {'dict': encoded}
+    if isinstance(value, (list, tuple)):
+        encoded = [_encode(v) for v in value]
+        if any(v is None for v in encoded):
+            return None
+        return {'list': encoded}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return {'value': value}
+    return None
+
+
+def _decode(encoded, graph, variables):
+    """ the attribute an _encode description names in graph """
+    kind, value = next(iter(encoded.items()))
+    if kind == 'variable':
+        return variables[value]
+    if kind == 'tensor':
+        return graph.get_tensor_by_name(value)
+    if kind == 'operation':
+        return graph.get_operation_by_name(value)
+    if kind == 'graph':
+        return graph
+    if kind == 'template_history':
+        history = TemplateHistory.__new__(TemplateHistory)
+        history.__dict__.update(_decode(value, graph, variables))
+        return history
+    if kind == 'dict':
+        return {k: _decode(v, graph, variables) for k, v in value.items()}
+    if kind == 'list':
+        return [_decode(v, graph, variables) for v in value]
+    return value
+
+
+def restore(sir_graph, directory):
+    """ set the built attributes of sir_graph from its cache entry,
+        returns False when there is none or it can not be read, a removed
+        or partly written entry included """
+    meta_path, attributes_path = _entry_paths(sir_graph, directory)
+    if not (path.exists(meta_path) and path.exists(attributes_path)):
+        return False
+    try:
+        with open(attributes_path, 'r') as f:
+            attributes = json.load(f)['attributes']
+        graph = tf.Graph()
+        with graph.as_default():
+            tf.train.import_meta_graph(meta_path)
+        variables = {v.name: v for v in graph.get_collection(
+            tf.GraphKeys.GLOBAL_VARIABLES)}
+        restored = {name: _decode(encoded, graph, variables)
+                    for name, encoded in attributes.items()}
+    except (OSError, ValueError, KeyError, DecodeError,
+            tf.errors.OpError):
+        return False
+    for name, value in restored.items():
+        setattr(sir_graph, name, value)
+    return True
+
+
+def store(sir_graph, directory, built):
+    """ write the cache entry of sir_graph, built names the attributes
+        build_graph set; returns False, storing nothing, when one of them
+        can not be named in an imported graph or the directory can not be
+        written """
+    attributes = {name: _encode(getattr(sir_graph, name)) for name in built}
+    if any(v is None for v in attributes.values()):
+        return False
+    meta_path, attributes_path = _entry_paths(sir_graph, directory)
+
+    # write beside the entry and move into place once complete, workers
+    # storing the same key race harmlessly
+    suffix = '.{}.tmp'.format(getpid())
+    try:
+        makedirs(path.dirname(meta_path), exist_ok=True)
+        tf.train.export_meta_graph(filename=meta_path + suffix,
+                                   graph=sir_graph.graph)
+        with open(attributes_path + suffix, 'w') as f:
+            json.dump({'code_version': code_version(),
+                       'attributes': attributes}, f)
+        replace(meta_path + suffix, meta_path)
+        replace(attributes_path + suffix, attributes_path)
+    except (OSError, tf.errors.OpError):
+        return False
+    return True
@@ -0,0 +1,122 @@
+""" process-wide pool of built filter engines and their open sessions,
+    reused by jobs with the same shapes and options """
+from collections import OrderedDict
+from os import environ
+import atexit
+import json
+import threading
+
+DEFAULT_POOL_SIZE = int(environ.get('SIR_GRAPH_POOL_SIZE', 4))
+
+# options an engine takes at reset rather than at build
+RESET_OPTIONS = ('seed', 'seeds', 'template_size')
+
+
+def stateless_draws(sir_options):
+    """ whether an engine draws from fed seeds, as pooled and cached
+        graphs do so jobs with other seeds share them """
+    return bool(sir_options.get('graph_pool', False) or
+                sir_options.get('graph_cache', False))
+
+
+def signature(engine, sir_options, video_options, template_options):
+    """ pool key of an engine built with these options, every option but
+        those reset feeds """
+    return json.dumps({
+        'engine': engine.__module__ + '.' + engine.__name__,
+        'sir_options': {k: v for k, v in sir_options.items()
+                        if k not in RESET_OPTIONS},
+        'run_count': len(
+            sir_options.get('seeds') or [sir_options['seed']]),
+        'video_options': video_options,
+        'template_options': template_options},
+        sort_keys=True, default=str)
+
+
+def _close(session):
+    """ close a tensorflow session, numpy stand-ins have nothing to do """
+    close = getattr(session, 'close', None)
+    if close is not None:
+        close()
+
+
+class GraphPool(object):
+    """ idle engines with an open session each, keyed by signature; an
+        engine is lent to one job at a time and reset for its seeds """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE):
+        self.size = size
+        self._idle = OrderedDict()
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def idle_count(self):
+        """ engines waiting for a job """
+        return sum(len(pairs) for pairs in self._idle.values())
+
+    def acquire(self, engine, sir_options, video_options, template_options):
+        """ an (engine, session) pair for the options, an idle one of the
+            same signature reset to the options or a new one """
+        key = signature(engine, sir_options, video_options, template_options)
+        with self._lock:
+            pairs = self._idle.get(key)
+            pair = pairs.pop() if pairs else None
+            if pairs == []:
+                del self._idle[key]
+
+        if pair is None:
+            sir_graph = engine(sir_options, video_options, template_options)
+            session = sir_graph.session()
+        else:
+            sir_graph, session = pair
+            sir_graph.reset(session, sir_options)
+
+        with self._lock:
+            self._keys[id(sir_graph)] = key
+        return sir_graph, session
+
+    def release(self, sir_graph, session):
+        """ return a pair lent by acquire, the least recently used idle
+            pairs beyond size are closed """
+        with self._lock:
+            key = self._keys.pop(id(sir_graph))
+            self._idle.setdefault(key, []).append((sir_graph, session))
+            self._idle.move_to_end(key)
+            self._evict()
+
+    def set_size(self, size):
+        """ change how many idle pairs are kept, closing any over it """
+        with self._lock:
+            self.size = size
+            self._evict()
+
+    def clear(self):
+        """ close every idle pair """
+        with self._lock:
+            for pairs in self._idle.values():
+                for _, session in pairs:
+                    _close(session)
+            self._idle.clear()
+
+    def _evict(self):
+        """ close least recently released pairs until size are idle """
+        while self.idle_count() > self.size:
+            key = next(iter(self._idle))
+            pairs = self._idle[key]
+            _close(pairs.pop(0)[1])
+            if not pairs:
+                del self._idle[key]
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool():
+    """ the process-wide graph pool """
+    global _POOL  # pylint: disable=W0603
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = GraphPool()
+            atexit.register(_POOL.clear)
+        return _POOL
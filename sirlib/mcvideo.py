@@ -1,41 +1,113 @@
 """ video import wrapper for legacy pre-generated video files """
 import struct
 import numpy as np
-import h5py
+from sequence_store import SequenceStore
+from sequence_catalog import read_video_params
 
 
 class MCVideo(object):
     """An object to abstractify pre-generated multi-channel video"""
 
-    def __init__(self, pix_path, mod_path, gt_path):
+    def __init__(self, pix_path, mod_path, gt_path, use_mmap=False,
+                 store_path=None, metadata=None):
         self.pix_path = pix_path
         self.mod_path = mod_path
         self.gt_path = gt_path
-
-        # load all information from the ground-truth file
-        self.load_gt(gt_path)
+        self.use_mmap = use_mmap
+        self.store_path = store_path
+
+        # load all information from the ground-truth file, unless the
+        # sequence catalog already supplied it
+        if metadata is None:
+            self.load_gt(gt_path)
+        else:
+            self.set_metadata(metadata)
         self.pix_read_size = self.width*self.height * 8
         self.mod_read_size = self.width*self.height*self.n_channels*8
 
+        # memory maps are opened lazily on first frame access
+        self._pix_map = None
+        self._mod_map = None
+
+        # decoded frames shared through the sequence cache
+        self._cached_pix = None
+
+        # compact preprocessed store takes precedence over legacy files
+        self._store = None
+        if store_path is not None:
+            self._store = SequenceStore(store_path)
+            if (self._store.length, self._store.height, self._store.width) \
+                    != (self.length, self.height, self.width):
+                raise ValueError(
+                    '{} does not match ground truth dimensions'.format(
+                        store_path))
+
     def __del__(self):
-        pass
+        self.close()
+
+    def attach_frames(self, frames):
+        """ serve pixel frames from an already decoded
+            [length, height, width] buffer, None to detach """
+        self._cached_pix = frames
+
+    def close(self):
+        """ release memory maps over the video files """
+        self._cached_pix = None
+        self._pix_map = None
+        self._mod_map = None
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def _map_pix(self):
+        """ map the pixel file as [length, width, height] float64 frames """
+        if self._pix_map is None:
+            self._pix_map = np.memmap(
+                self.pix_path, dtype=np.float64, mode='r',
+                shape=(self.length, self.width, self.height))
+        return self._pix_map
+
+    def _map_mod(self):
+        """ map the modulation file as
+            [length, channels, width, height] float64 frames """
+        if self._mod_map is None:
+            self._mod_map = np.memmap(
+                self.mod_path, dtype=np.float64, mode='r',
+                shape=(self.length, self.n_channels,
+                       self.width, self.height))
+        return self._mod_map
 
     def load_gt(self, gt_path):
         """ load ground truth """
-        with h5py.File(gt_path) as gt_file:
-            self.g_t = np.array(gt_file.get('gt/save_gt'))
-            self.n_levels = int(gt_file.get('numLevels')[0][0])
-            self.n_orien = int(gt_file.get('numOrien')[0][0])
-            self.height = int(gt_file.get('video_height')[0][0])
-            self.width = int(gt_file.get('video_width')[0][0])
-            self.length = int(gt_file.get('video_length')[0][0])
-        self.n_channels = self.n_levels * self.n_orien
+        self.set_metadata(read_video_params(gt_path))
+
+    def set_metadata(self, metadata):
+        """ set dimensions and ground truth from a metadata dictionary """
+        self.g_t = metadata['g_t']
+        self.n_levels = metadata['n_levels']
+        self.n_orien = metadata['n_orien']
+        self.height = metadata['height']
+        self.width = metadata['width']
+        self.length = metadata['length']
+        self.n_channels = metadata['n_channels']
 
     def get_pix_frame(self, frame_num):
         """Retrieve pixel-domain frame by number"""
         if frame_num > self.length - 1:
             return []
 
+        if self._cached_pix is not None:
+            return self._cached_pix[frame_num]
+
+        if self._store is not None:
+            return self._store.get_pix_frame(frame_num)
+
+        if self.use_mmap:
+            # file is stored column-major, transposing the mapped frame
+            # yields a [height, width] view without copying
+            data = self._map_pix()[frame_num].T
+            return np.multiply(data, 255).astype(np.uint8)
+
         seek_pos = self.pix_read_size * frame_num     # zero indexed
         with open(self.pix_path, 'rb') as pix_file:
             pix_file.seek(seek_pos)
@@ -53,6 +125,12 @@ class MCVideo(object):
         if frame_num > self.length - 1:
             return []
 
+        if self._store is not None and self._store.n_channels:
+            return self._store.get_mod_frame(frame_num)
+
+        if self.use_mmap:
+            return self._map_mod()[frame_num].transpose((0, 2, 1))
+
         seek_pos = self.mod_read_size * frame_num     # zero indexed
         with open(self.mod_path, 'rb') as mod_file:
             mod_file.seek(seek_pos)
@@ -0,0 +1,78 @@
+""" dense template re-detection for lost tracks, the numpy normalized
+    cross-correlation mirrors the one SIRGraph builds """
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def search_window(centers, window, frame_shape, template_shape):
+    """ (height, width) of the search window, redetect_window or the whole
+        frame, and the [runs, 2] top-left corners centred on centers and
+        kept inside the frame """
+    height, width = window or frame_shape
+    size = np.array([min(max(height, template_shape[0]), frame_shape[0]),
+                     min(max(width, template_shape[1]), frame_shape[1])])
+    origins = np.clip(np.round(np.asarray(centers) - size / 2), 0,
+                      np.array(frame_shape) - size).astype(np.int32)
+    return size, origins
+
+
+def ncc_peaks(frame, templates, centers, window, peak_count, radius):
+    """ normalized cross-correlation of each run's [runs, h, w] template
+        over its search window by FFT, returns the [runs, peak_count, 2]
+        frame positions of the template centres at the best local maxima
+        and their [runs, peak_count] correlations, -inf past the last
+        maximum """
+    t_h, t_w = templates.shape[1:]
+    size, origins = search_window(centers, window, frame.shape, (t_h, t_w))
+    windows = np.stack([frame[row:row + size[0], col:col + size[1]]
+                        for row, col in origins]).astype(np.float64)
+    windows -= windows.mean(axis=(1, 2), keepdims=True)
+
+    mean_shifted = templates - templates.mean(axis=(1, 2), keepdims=True)
+    cross = np.fft.irfft2(
+        np.fft.rfft2(windows) * np.conj(np.fft.rfft2(mean_shifted, s=size)),
+        s=size)
+    valid_h, valid_w = size[0] - t_h + 1, size[1] - t_w + 1
+    cross = cross[:, 0:valid_h, 0:valid_w]
+
+    def box_sums(images):
+        integral = np.pad(images, [[0, 0], [1, 0], [1, 0]]).cumsum(
+            axis=1).cumsum(axis=2)
+        return (integral[:, t_h:, t_w:] - integral[:, :-t_h, t_w:] -
+                integral[:, t_h:, :-t_w] + integral[:, :-t_h, :-t_w])
+
+    sums = box_sums(windows)
+    energy = np.maximum(box_sums(windows ** 2) - sums ** 2 / (t_h * t_w), 0)
+    e_template = (mean_shifted ** 2).sum(axis=(1, 2))[:, None, None]
+    ncc = cross / (np.sqrt(energy * e_template) + 1e-12)
+
+    # local maxima within radius, best first
+    neighbourhood = np.pad(ncc, [[0, 0], [radius, radius], [radius, radius]],
+                           constant_values=-np.inf)
+    local_max = sliding_window_view(
+        neighbourhood, (2 * radius + 1, 2 * radius + 1),
+        axis=(1, 2)).max(axis=(3, 4))
+    maxima = np.where(ncc == local_max, ncc, -np.inf).reshape(len(ncc), -1)
+    flat = np.argsort(-maxima, axis=1, kind='stable')[:, 0:peak_count]
+    values = np.take_along_axis(maxima, flat, axis=1)
+    positions = np.stack([flat // valid_w, flat % valid_w], axis=2) + \
+        origins[:, None, :] + [(t_h - 1) / 2, (t_w - 1) / 2]
+    return positions.astype(np.float32), values.astype(np.float32)
+
+
+def reseeded(sir_p, sir_w, active, peaks, values, runs):
+    """ particles and weights with those of runs moved onto their peaks,
+        spread round-robin so every prefix of the particles covers them,
+        at rest and uniformly weighted over the active particles; runs
+        without a peak are left alone """
+    sir_p = sir_p.copy()
+    sir_w = sir_w.copy()
+    particle_count = sir_p.shape[1]
+    for run in runs:
+        found = peaks[run][np.isfinite(values[run])]
+        if len(found) == 0:
+            continue
+        sir_p[run, :, 0:2] = found[np.arange(particle_count) % len(found)]
+        sir_p[run, :, 2:4] = 0
+        sir_w[run] = (np.arange(particle_count) < active[run]) / active[run]
+    return sir_p, sir_w
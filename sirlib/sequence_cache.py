@@ -0,0 +1,328 @@
+""" process-wide cache of decoded sequence frames shared between jobs """
+from collections import OrderedDict
+from contextlib import contextmanager
+from os import path, environ, getpid, kill
+import atexit
+import hashlib
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:  # python < 3.8, fall back to process-private buffers
+    shared_memory = None
+try:
+    import fcntl
+except ImportError:  # windows frees a segment with its last handle
+    fcntl = None
+
+DEFAULT_BUDGET_MB = int(environ.get('SIR_CACHE_BUDGET_MB', 2048))
+
+# shared segment header: ready flag, frame dimensions, the pid of the
+# decoding process and the number of processes holding the segment
+_HEADER_BYTES = 64
+_READY = 1
+_PID = 4
+_REFERENCES = 5
+_ATTACH_TIMEOUT = 600.0
+
+# python < 3.13 registers attached segments with the resource tracker,
+# which unlinks them when the attaching process exits
+_TRACKS_ATTACHED = sys.version_info < (3, 13) and sys.platform != 'win32'
+
+
+def _segment_name(key):
+    """ shared memory name derived from the sequence key """
+    digest = hashlib.sha1(path.abspath(key).encode('utf-8')).hexdigest()
+    return 'sirseq_' + digest[:20]
+
+
+@contextmanager
+def _segment_lock(name):
+    """ hold the lock file of a segment, serializing the header reference
+        counts and unlinking of every process """
+    if fcntl is None:
+        yield
+        return
+    with open(path.join(tempfile.gettempdir(), name + '.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _header(segment):
+    """ int64 header view of a segment """
+    return np.ndarray(
+        (_HEADER_BYTES // 8,), dtype=np.int64, buffer=segment.buf)
+
+
+def _attach(name):
+    """ attach to an existing segment without tracking it, the header
+        reference count decides when it is unlinked """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    segment = shared_memory.SharedMemory(name=name)
+    if _TRACKS_ATTACHED:
+        resource_tracker.unregister(
+            segment._name, 'shared_memory')  # pylint: disable=W0212
+    return segment
+
+
+def _unlink(segment):
+    """ unlink a segment; python < 3.13 unregisters it from the resource
+        tracker on unlink, so it is registered first whether this process
+        created it or attached to it """
+    if _TRACKS_ATTACHED:
+        resource_tracker.register(
+            segment._name, 'shared_memory')  # pylint: disable=W0212
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        if _TRACKS_ATTACHED:
+            resource_tracker.unregister(
+                segment._name, 'shared_memory')  # pylint: disable=W0212
+
+
+def _alive(pid):
+    """ whether the process that created a segment still runs, a pid not
+        yet written or not checkable counts as running """
+    if pid == 0 or sys.platform == 'win32':
+        return True
+    try:
+        kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _CacheEntry(object):
+    """ decoded frames of one sequence and their backing buffer """
+
+    def __init__(self, frames, segment=None):
+        self.frames = frames
+        self.segment = segment
+        self.references = 0
+        self.nbytes = frames.nbytes
+
+    def free(self):
+        """ drop the frames and detach from shared memory, the last
+            process holding the segment unlinks it """
+        self.frames = None
+        if self.segment is not None:
+            with _segment_lock(self.segment.name):
+                header = _header(self.segment)
+                header[_REFERENCES] = max(header[_REFERENCES] - 1, 0)
+                if header[_REFERENCES] == 0:
+                    _unlink(self.segment)
+                del header
+            try:
+                self.segment.close()
+            except BufferError:
+                # a frame view is still alive, the mapping is released
+                # once it is garbage collected
+                pass
+            self.segment = None
+
+
+class SequenceCache(object):
+    """ decode each sequence once into read-only frame buffers, shared
+        across threads and, via shared memory, worker processes """
+
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_MB * 2**20,
+                 use_shared_memory=True):
+        self.budget_bytes = budget_bytes
+        self.use_shared_memory = \
+            use_shared_memory and shared_memory is not None
+        self._entries = OrderedDict()
+        # keys being decoded, with the event set once they are done
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def cached_bytes(self):
+        """ total size of decoded frames held by this process """
+        return sum(e.nbytes for e in self._entries.values())
+
+    def acquire(self, key, video):
+        """ retrieve [length, height, width] uint8 frames for a sequence,
+            decoding them from video on first use; the decoding runs
+            outside the lock, other threads wait only for the same key """
+        shape = (video.length, video.height, video.width)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    entry.references += 1
+                    return entry.frames
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    self._evict(int(np.prod(shape)))
+                    break
+            # another thread decodes it, retried should that fail
+            loading.wait()
+
+        entry = None
+        try:
+            entry = self._load(key, video, shape)
+        finally:
+            with self._lock:
+                if entry is not None:
+                    entry.references += 1
+                    self._entries[key] = entry
+                del self._loading[key]
+            loading.set()
+        return entry.frames
+
+    def release(self, key):
+        """ drop a reference, unreferenced entries stay until evicted """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.references > 0:
+                entry.references -= 1
+            self._evict(0)
+
+    def set_budget(self, budget_bytes):
+        """ change the memory budget, evicting if now over it """
+        with self._lock:
+            self.budget_bytes = budget_bytes
+            self._evict(0)
+
+    def clear(self):
+        """ free every entry regardless of references """
+        with self._lock:
+            for entry in self._entries.values():
+                entry.free()
+            self._entries.clear()
+
+    def _evict(self, incoming_bytes):
+        """ free least recently used, unreferenced entries until the
+            incoming sequence fits the budget """
+        total = self.cached_bytes() + incoming_bytes
+        for key in list(self._entries):
+            if total <= self.budget_bytes:
+                break
+            entry = self._entries[key]
+            if entry.references == 0:
+                total -= entry.nbytes
+                entry.free()
+                del self._entries[key]
+
+    def _load(self, key, video, shape):
+        """ create or attach the backing buffer for a sequence """
+        if self.use_shared_memory:
+            entry = self._load_shared(key, video, shape)
+            if entry is not None:
+                return entry
+        frames = np.empty(shape, dtype=np.uint8)
+        self._decode(video, frames)
+        frames.flags.writeable = False
+        return _CacheEntry(frames)
+
+    def _load_shared(self, key, video, shape):
+        """ decode into a new shared segment, or attach to the segment
+            another process already decoded, replacing it when its
+            decoding process died or never finished; None if neither
+            works """
+        name = _segment_name(key)
+        size = _HEADER_BYTES + int(np.prod(shape))
+        for _ in range(3):
+            try:
+                # created and counted under the lock, a segment without
+                # references is one its last holder unlinked
+                with _segment_lock(name):
+                    segment = shared_memory.SharedMemory(
+                        name=name, create=True, size=size)
+                    header = _header(segment)
+                    header[_PID] = getpid()
+                    header[_REFERENCES] = 1
+                    header[1:4] = shape
+                owner = True
+            except FileExistsError:
+                try:
+                    segment = _attach(name)
+                except FileNotFoundError:
+                    continue
+                header = _header(segment)
+                owner = False
+            except OSError:
+                return None
+            frames = np.ndarray(shape, dtype=np.uint8, buffer=segment.buf,
+                                offset=_HEADER_BYTES)
+
+            if owner:
+                try:
+                    self._decode(video, frames)
+                except BaseException:
+                    with _segment_lock(name):
+                        header[_REFERENCES] = 0
+                        _unlink(segment)
+                    del header, frames
+                    segment.close()
+                    raise
+                header[0] = _READY
+                break
+
+            ready = self._wait_ready(header)
+            with _segment_lock(name):
+                if header[_REFERENCES] > 0:
+                    if ready and tuple(header[1:4]) == shape:
+                        header[_REFERENCES] += 1
+                        break
+                    if ready:
+                        # mismatched segment, decode privately instead
+                        del header, frames
+                        segment.close()
+                        return None
+                    # its decoding process is gone, replace the segment
+                    header[_REFERENCES] = 0
+                    _unlink(segment)
+            # unlinked by its last holder or replaced, create it anew
+            del header, frames
+            segment.close()
+        else:
+            return None
+
+        del header
+        frames.flags.writeable = False
+        return _CacheEntry(frames, segment)
+
+    @staticmethod
+    def _wait_ready(header):
+        """ wait for the decoding process to mark a segment ready, False
+            when it died, gave up and unlinked it or the wait timed out """
+        deadline = time.monotonic() + _ATTACH_TIMEOUT
+        while header[0] != _READY:
+            if header[_REFERENCES] <= 0:
+                return False
+            if time.monotonic() > deadline or \
+                    not _alive(header[_PID]):
+                return False
+            time.sleep(0.05)
+        return True
+
+    @staticmethod
+    def _decode(video, frames):
+        """ fill frames from the video source """
+        for frame_num in range(frames.shape[0]):
+            frames[frame_num] = video.get_pix_frame(frame_num)
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache():
+    """ the process-wide sequence cache """
+    global _CACHE  # pylint: disable=W0603
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = SequenceCache()
+            atexit.register(_CACHE.clear)
+        return _CACHE
@@ -0,0 +1,121 @@
+""" cached catalog of sequence metadata and ground truth """
+from os import path, getpid, remove, replace, stat
+import pickle
+import threading
+import uuid
+import numpy as np
+
+CATALOG_FILE = 'sequence_catalog.pkl'
+CATALOG_VERSION = 1
+
+
+def gt_path_for(root_path, seq_name):
+    """ location of the legacy video parameter file for a sequence """
+    return path.join(root_path, seq_name, 'video_params_' + seq_name + '.mat')
+
+
+def read_video_params(gt_path):
+    """ read dimensions, lengths and ground truth from a
+        video_params_<seq>.mat file """
+    import h5py  # pylint: disable=C0415
+    with h5py.File(gt_path, 'r') as gt_file:
+        params = {
+            'g_t': np.array(gt_file.get('gt/save_gt')),
+            'n_levels': int(gt_file.get('numLevels')[0][0]),
+            'n_orien': int(gt_file.get('numOrien')[0][0]),
+            'height': int(gt_file.get('video_height')[0][0]),
+            'width': int(gt_file.get('video_width')[0][0]),
+            'length': int(gt_file.get('video_length')[0][0])
+        }
+    params['n_channels'] = params['n_levels'] * params['n_orien']
+    return params
+
+
+class SequenceCatalog(object):
+    """ metadata for every sequence under root_path, scanned once and
+        kept in an index file invalidated by the parameter file mtime """
+
+    def __init__(self, root_path, index_path=None):
+        self.root_path = root_path
+        self.index_path = index_path or path.join(root_path, CATALOG_FILE)
+        self._lock = threading.Lock()
+        self._entries = self._load_index()
+
+    def _load_index(self):
+        """ read the index file, an unreadable index is rebuilt """
+        try:
+            with open(self.index_path, 'rb') as index_file:
+                index = pickle.load(index_file)
+            if index.get('version') == CATALOG_VERSION:
+                for entry in index['entries'].values():
+                    entry['g_t'].flags.writeable = False
+                return index['entries']
+        except (OSError, EOFError, pickle.UnpicklingError,
+                AttributeError, KeyError):
+            pass
+        return {}
+
+    def save(self):
+        """ write the index, silently skipped for read-only roots """
+        # write beside the index and move into place once complete, a
+        # name of its own per writer so concurrent saves never interleave
+        temp_path = '{}.{}.{}.tmp'.format(
+            self.index_path, getpid(), uuid.uuid4().hex[:8])
+        try:
+            with open(temp_path, 'wb') as index_file:
+                pickle.dump(
+                    {'version': CATALOG_VERSION, 'entries': self._entries},
+                    index_file, protocol=pickle.HIGHEST_PROTOCOL)
+            replace(temp_path, self.index_path)
+        except OSError:
+            try:
+                remove(temp_path)
+            except OSError:
+                pass
+
+    def _lookup(self, seq_name):
+        """ entry for seq_name, rescanned if its parameter file changed;
+            returns the entry and whether it was rescanned """
+        gt_path = gt_path_for(self.root_path, seq_name)
+        gt_stat = stat(gt_path)
+        signature = (gt_stat.st_mtime_ns, gt_stat.st_size)
+
+        entry = self._entries.get(seq_name)
+        if entry is not None and entry['signature'] == signature:
+            return entry, False
+
+        entry = read_video_params(gt_path)
+        entry['signature'] = signature
+        entry['g_t'].flags.writeable = False
+        self._entries[seq_name] = entry
+        return entry, True
+
+    def get(self, seq_name):
+        """ metadata dictionary for a sequence: height, width, length,
+            n_levels, n_orien, n_channels and g_t (read-only) """
+        with self._lock:
+            entry, scanned = self._lookup(seq_name)
+            if scanned:
+                self.save()
+        return entry
+
+    def scan(self, seq_names):
+        """ make sure every named sequence is in the index """
+        with self._lock:
+            scanned = [self._lookup(s)[1] for s in seq_names]
+            if any(scanned):
+                self.save()
+
+
+_CATALOGS = {}
+_CATALOGS_LOCK = threading.Lock()
+
+
+def get_catalog(root_path):
+    """ the shared catalog for a sequence root """
+    with _CATALOGS_LOCK:
+        catalog = _CATALOGS.get(root_path)
+        if catalog is None:
+            catalog = SequenceCatalog(root_path)
+            _CATALOGS[root_path] = catalog
+        return catalog
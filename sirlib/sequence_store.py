@@ -0,0 +1,131 @@
+""" compact preprocessed sequence store and legacy converter
+
+    file layout (little-endian):
+        magic        8 bytes  b'SIRSEQ\\x00\\x01'
+        header       int64[8] version, length, height, width,
+                              n_channels, chunk_size, index_offset, 0
+        index        int64[length] byte offset of each frame chunk
+        chunks       per frame, 64-byte aligned:
+                         uint8[height, width] pixel frame
+                         float32[n_channels, height, width] modulation
+"""
+from os import path, replace
+import numpy as np
+
+STORE_MAGIC = b'SIRSEQ\x00\x01'
+STORE_VERSION = 1
+_HEADER_FIELDS = 8
+_ALIGNMENT = 64
+
+
+def _align(offset):
+    """ round offset up to the chunk alignment """
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def store_path_for(seq_path, seq_name):
+    """ location of the compact store next to the legacy files """
+    return path.join(seq_path, 'compact_' + seq_name + '.seq')
+
+
+class SequenceStore(object):
+    """ read-only, memory-mapped access to a compact sequence store """
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self._map = np.memmap(store_path, dtype=np.uint8, mode='r')
+
+        if bytes(self._map[0:len(STORE_MAGIC)]) != STORE_MAGIC:
+            raise ValueError(
+                '{} is not a compact sequence store'.format(store_path))
+        header = np.frombuffer(
+            self._map, dtype='<i8', count=_HEADER_FIELDS,
+            offset=len(STORE_MAGIC))
+        if header[0] != STORE_VERSION:
+            raise ValueError(
+                '{} has unsupported store version {}'.format(
+                    store_path, header[0]))
+
+        self.length, self.height, self.width, self.n_channels, \
+            self.chunk_size, index_offset = (int(h) for h in header[1:7])
+        self._index = np.frombuffer(
+            self._map, dtype='<i8', count=self.length, offset=index_offset)
+        self._pix_size = self.height * self.width
+        self._mod_offset = _align(self._pix_size)
+
+    def close(self):
+        """ release the memory map """
+        self._map = None
+        self._index = None
+
+    def get_pix_frame(self, frame_num):
+        """ uint8 [height, width] view of a pixel-domain frame """
+        start = int(self._index[frame_num])
+        return self._map[start:start + self._pix_size].reshape(
+            self.height, self.width)
+
+    def get_mod_frame(self, frame_num):
+        """ float32 [channels, height, width] view of a modulation frame """
+        start = int(self._index[frame_num]) + self._mod_offset
+        return np.frombuffer(
+            self._map, dtype='<f4',
+            count=self.n_channels * self._pix_size,
+            offset=start).reshape(self.n_channels, self.height, self.width)
+
+
+def convert_sequence(video, store_path, include_mod=True):
+    """ one-time conversion of a legacy MCVideo into a compact store """
+    n_channels = video.n_channels if include_mod else 0
+    pix_size = video.height * video.width
+    chunk_size = _align(_align(pix_size) + n_channels * pix_size * 4)
+    index_offset = len(STORE_MAGIC) + _HEADER_FIELDS * 8
+    data_offset = _align(index_offset + video.length * 8)
+
+    header = np.array(
+        [STORE_VERSION, video.length, video.height, video.width,
+         n_channels, chunk_size, index_offset, 0], dtype='<i8')
+    index = data_offset + chunk_size * np.arange(video.length, dtype='<i8')
+
+    # write beside the target and move into place once complete
+    temp_path = store_path + '.tmp'
+    with open(temp_path, 'wb') as store_file:
+        store_file.write(STORE_MAGIC)
+        store_file.write(header.tobytes())
+        store_file.write(index.tobytes())
+        for frame_num in range(video.length):
+            chunk = bytearray(chunk_size)
+            pix = np.ascontiguousarray(video.get_pix_frame(frame_num))
+            chunk[0:pix_size] = pix.tobytes()
+            if n_channels:
+                mod = np.ascontiguousarray(
+                    video.get_mod_frame(frame_num), dtype='<f4')
+                mod_start = _align(pix_size)
+                chunk[mod_start:mod_start + mod.nbytes] = mod.tobytes()
+            store_file.seek(int(index[frame_num]))
+            store_file.write(chunk)
+    replace(temp_path, store_path)
+    return store_path
+
+
+if __name__ == '__main__':
+    import argparse
+    from mcvideo import MCVideo
+
+    PARSER = argparse.ArgumentParser(
+        description='convert legacy sequences into compact stores')
+    PARSER.add_argument('root_path', help='processed sequence root')
+    PARSER.add_argument('names', nargs='+', help='sequence names')
+    PARSER.add_argument('--no-mod', action='store_true',
+                        help='skip modulation channels')
+    ARGS = PARSER.parse_args()
+
+    for seq_name in ARGS.names:
+        seq_path = path.join(ARGS.root_path, seq_name)
+        legacy = MCVideo(
+            path.join(seq_path, 'frames_' + seq_name + '.bin'),
+            path.join(seq_path, 'amfm_' + seq_name + '.bin'),
+            path.join(seq_path, 'video_params_' + seq_name + '.mat'),
+            use_mmap=True)
+        print('converting {} ({} frames)'.format(seq_name, legacy.length))
+        convert_sequence(legacy, store_path_for(seq_path, seq_name),
+                         include_mod=not ARGS.no_mod)
@@ -11,6 +11,8 @@ from PyQt5.QtWidgets import (
     QFileDialog,
     QMessageBox)
 from sir_tracker import SIRTracker, SIRWindow
+from sir_job import configure_process, expand_jobs
+from sequence_catalog import get_catalog
 
 
 BATCH_CREATOR_FILE = 'sirlib/sir_batch.ui'
@@ -72,40 +74,22 @@ class BatchWindow(QMainWindow, BATCH_WIDGET):
         )
         self.lbl_batch_details.setText(batch_details)
 
+        # scan sequence metadata once for every job of the batch
+        get_catalog(self.options['root_path']).scan(
+            [s['name'] for s in self.options['sequences']])
+
+        configure_process(self.options)
+
+        # attach tracker objects
         self.runs = [
             {
-                'job_options':
-                {
-                    'name': sequence['name'],
-                    'start_frame': sequence['start_frame'],
-                    'end_frame': sequence['end_frame'],
-                    'particle_count': particle_count,
-                    'score_type': score_type,
-                    'filter_mode': filter_mode,
-                    'update_interval': update_interval,
-                    'update_method': update_method,
-                    'historical_length': historical_length,
-                    'run': run,
-                    'root_path': self.options['root_path'],
-                    'save_path': self.options['save_path'],
-                },
-                'status': 'Not started'
+                'job_options': job_options,
+                'status': 'Not started',
+                'tracker': SIRTracker(job_options)
             }
-            for sequence in self.options['sequences']
-            for particle_count in self.options['particle_counts']
-            for score_type in self.options['score_types']
-            for filter_mode in self.options['filter_modes']
-            for update_interval in self.options['update_intervals']
-            for update_method in self.options['update_methods']
-            for historical_length in self.options['historical_lengths']
-            for run in range(self.options['number_runs'])
+            for job_options in expand_jobs(self.options)
         ]
-
-        # attach run ids, seed, and tracker objects
-        for index, r in enumerate(self.runs):
-            r['job_options']['job_id'] = index
-            r['job_options']['seed'] = r['job_options']['run']
-            r['tracker'] = SIRTracker(r['job_options'])
+        for r in self.runs:
             r['tracker'].signals.status_changed.connect(self.on_status_change)
 
         # add to display
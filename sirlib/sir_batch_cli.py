@@ -0,0 +1,106 @@
+""" run a batch of sir filter jobs headless, in a pool of worker processes
+
+    takes the batch_config.json of sir_batch.py and expands it into the
+    same jobs and result paths:
+
+        python sirlib/sir_batch_cli.py sirlib/batch_config.json -p 4 """
+from os import environ
+import argparse
+import json
+import multiprocessing
+from multiprocessing.util import Finalize
+import sys
+import time
+import traceback
+from sequence_cache import get_cache
+from graph_pool import get_pool
+from sequence_catalog import get_catalog
+from sir_job import SIRJob, configure_process, expand_jobs
+
+
+def _init_worker(batch_options):
+    """ worker process setup, sessions of concurrent workers grow their
+        gpu memory instead of each claiming all of it """
+    environ.setdefault('TF_FORCE_GPU_ALLOW_GROWTH', 'true')
+    configure_process(batch_options)
+    # pool workers skip atexit, free shared frames and sessions on exit
+    Finalize(None, _close_worker, exitpriority=10)
+
+
+def _close_worker():
+    get_pool().clear()
+    get_cache().clear()
+
+
+def run_job(job_options):
+    """ run one job in a worker, returns its job_id, final status, wall
+        time and the traceback of a failure """
+    job = SIRJob(job_options)
+    statuses = []
+    job.signals.status_changed.connect(
+        lambda job_id, status: statuses.append(status))
+    start = time.time()
+    try:
+        job.run()
+    except Exception:  # pylint: disable=W0703
+        return (job_options['job_id'], 'Failed', time.time() - start,
+                traceback.format_exc())
+    return job_options['job_id'], statuses[-1], time.time() - start, None
+
+
+def describe(job_options):
+    """ one line summary of a job for progress output """
+    runs = job_options['runs']
+    return (f"{job_options['name']} pc_{job_options['particle_count']} "
+            f"{job_options['score_type']} {job_options['filter_mode']} "
+            f"ui_{job_options['update_interval']} "
+            f"{job_options['update_method']} "
+            f"hl_{job_options['historical_length']} "
+            f"runs {runs[0]}-{runs[-1]}")
+
+
+def run_batch(batch_options, processes):
+    """ run every job of a batch on processes workers, printing each job
+        as it ends, returns the number of failed jobs """
+    # scan sequence metadata once, the workers read the saved index
+    get_catalog(batch_options['root_path']).scan(
+        [s['name'] for s in batch_options['sequences']])
+
+    jobs = expand_jobs(batch_options)
+    print(f"{len(jobs)} jobs on {processes} worker processes", flush=True)
+
+    # spawned workers start without the parent's threads or gpu context
+    context = multiprocessing.get_context('spawn')
+    failed = 0
+    start = time.time()
+    with context.Pool(processes, initializer=_init_worker,
+                      initargs=(batch_options,)) as pool:
+        for done, (job_id, status, elapsed, error) in enumerate(
+                pool.imap_unordered(run_job, jobs), 1):
+            print(f"[{done}/{len(jobs)} {time.time() - start:.0f}s] "
+                  f"job {job_id} {describe(jobs[job_id])}: {status} "
+                  f"({elapsed:.1f}s)", flush=True)
+            if error is not None:
+                failed += 1
+                print(error, file=sys.stderr, flush=True)
+        # workers exiting on their own run their finalizers
+        pool.close()
+        pool.join()
+    return failed
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(
+        description='run a batch of sir filter jobs without the gui')
+    PARSER.add_argument('config', help='batch options json file')
+    PARSER.add_argument('-p', '--processes', type=int, default=1,
+                        help='concurrent worker processes')
+    ARGS = PARSER.parse_args()
+
+    with open(ARGS.config, 'r') as bo_file:
+        BATCH_OPTIONS = json.load(bo_file)
+
+    FAILED = run_batch(BATCH_OPTIONS, ARGS.processes)
+    if FAILED:
+        print(f"{FAILED} jobs failed", file=sys.stderr)
+    sys.exit(1 if FAILED else 0)
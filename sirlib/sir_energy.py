@@ -0,0 +1,58 @@
+""" energy history layout, template history, particle count, scoring,
+    precision and re-detection constants shared by the sir filter
+    engines """
+
+# number of accumulated energy terms used by each score type
+SCORE_ORDERS = {'NCC': 1, 'ASV': 2, 'ASVHO': 3}
+
+# energy history entries: template energy and the per-particle
+# spatial-support and template-spatial support cross energies
+ENERGY_NAMES = ('template', 'ss', 'template_ss')
+
+# extra singular directions tracked by the incremental template history
+# SVD beyond the composite rank, absorbing truncation error of its
+# rank-one updates
+SVD_OVERSAMPLING = 2
+
+# defaults of the adaptive particle count: lower bound on the active
+# particles, KLD error bound and normal quantile of its confidence, and
+# the (row, column) bin size in pixels over which the posterior is counted
+KLD_DEFAULTS = {
+    'min_particle_count': 100,
+    'kld_epsilon': 0.05,
+    'kld_z': 2.326,
+    'kld_bin_size': 2.0}
+
+# working set of one interpolated template pixel of one particle in bytes
+# (transformed grid, bilinear corners and weights), and the default budget
+# that score_chunk 'auto' fits one chunk of particles into
+SAMPLE_BYTES = 64
+SCORE_MEMORY_MB = 256
+
+# defaults of the coarse-to-fine scoring: block size of the pyramid level
+# and the fraction of particles, best by coarse correlation, refined at
+# full resolution
+PYRAMID_DEFAULTS = {
+    'pyramid_factor': 2,
+    'pyramid_keep': 0.25}
+
+# defaults of the template re-detection: number of correlation peaks the
+# particles are reseeded at and the radius within which a peak suppresses
+# weaker ones
+REDETECT_DEFAULTS = {
+    'redetect_peaks': 3,
+    'redetect_radius': 4}
+
+# dtypes the interpolation and energy products can run in, and the power
+# of two pixel values are scaled by before reduced precision products so
+# the square of an 8-bit pixel difference stays well inside float16 range
+SCORE_PRECISIONS = ('float32', 'float16', 'bfloat16')
+PRECISION_SCALE = 1 / 8
+
+# frames between reports of reduced precision scores against float32, the
+# first tracked frame is always reported
+PRECISION_REPORT_INTERVAL = 50
+
+# template sides the template_buckets option pads templates up to when
+# given as true, sides beyond the largest are left unpadded
+TEMPLATE_BUCKETS = (16, 24, 32, 48, 64, 96, 128, 192, 256)
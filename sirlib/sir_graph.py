@@ -1,27 +1,97 @@
 """ sir filter graph container with functions to interact with it """
+from contextlib import nullcontext
+import time
 import numpy as np
 import tensorflow as tf
 # pylint: disable=E0611
+from tensorflow.contrib import stateless
+from tensorflow.contrib.compiler import jit
 from tensorflow.contrib.image.python.ops.dense_image_warp \
     import _interpolate_bilinear
 from template_updating import TemplateHistory
+import graph_cache
+from graph_pool import stateless_draws
+from redetect import reseeded, search_window
+from sir_energy import (
+    ENERGY_NAMES, KLD_DEFAULTS, PRECISION_SCALE, PYRAMID_DEFAULTS,
+    REDETECT_DEFAULTS, SAMPLE_BYTES, SCORE_MEMORY_MB, SCORE_ORDERS,
+    SCORE_PRECISIONS)
+
+# random ops kept out of xla clusters, compiled they would draw from
+# xla's generator instead of each run's seeded stream
+_RANDOM_OPS = frozenset((
+    'RandomStandardNormal', 'RandomUniform', 'RandomUniformInt',
+    'Multinomial', 'TruncatedNormal', 'RandomShuffle',
+    'StatelessRandomNormal', 'StatelessRandomUniform',
+    'StatelessMultinomial'))
+
+# random op stride of the seeds, above the number of random ops a graph
+# builds so each op (and, stateless, each filter step) of a run gets its
+# own seed
+_DRAW_SITES = 256
 
 
 class SIRGraph:
-    """ graph class containing tensorflow graph and access methods """
+    """ graph class containing tensorflow graph and access methods
+
+        state variables have a leading run dimension, one per seed in
+        sir_options['seeds'] (or the single sir_options['seed']), so
+        independent runs share the frame and one batched interpolation
+
+        with sir_options['adaptive_particles'] particle_count is the
+        capacity of the particle buffers and each run keeps an active
+        prefix of them, resized at every resampling
+
+        with sir_options['graph_pool'] or sir_options['graph_cache'] the
+        random draws are stateless, seeded by a seed variable and the
+        filter step count, so reset can hand the graph and its open
+        session to a job with other seeds and the cache entry serves
+        every seed
+
+        with sir_options['template_buckets'] template_options is the
+        padded bucket size and the template_size variable holds the
+        template's own size, the padding is masked out of every mean and
+        energy so jobs of any template size within the bucket share the
+        graph
+
+        with sir_options['graph_cache'], a directory or True for the
+        default, the built graph is imported from the on-disk cache when
+        an entry for these options and this code exists and stored to it
+        otherwise """
 
     def __init__(self, sir_options, video_options, template_options):
         self.sir_options = sir_options
         self.video_options = video_options
         self.template_options = template_options
+        self.seeds = list(
+            sir_options.get('seeds') or [sir_options['seed']])
+        self.run_count = len(self.seeds)
+        self.adaptive = sir_options.get('adaptive_particles', False)
+        self.pyramid = sir_options.get('pyramid', False)
+        self.stateless = stateless_draws(sir_options)
+        self.bucketed = bool(sir_options.get('template_buckets', False))
+        # whether the last frame was loaded as a crop
+        self._cropped = False
+        # random ops built so far, numbering the stateless draws
+        self._draw_sites = 0
+        cache = sir_options.get('graph_cache', False)
+        if cache and graph_cache.restore(self, graph_cache.cache_dir(cache)):
+            return
+        unbuilt = set(vars(self))
         self.build_graph()
+        if cache:
+            graph_cache.store(self, graph_cache.cache_dir(cache),
+                              set(vars(self)) - unbuilt)
 
     def build_graph(self):
         """ build sir filter tensorflow graph, returns a dictionary
             containing necessary contact points for sir filter algorithms """
 
         self.graph = tf.Graph()
-        self.graph.seed = self.sir_options['seed']
+        run_count = self.run_count
+        particle_count = self.sir_options['particle_count']
+        score_order = self.sir_options.get(
+            'score_order', SCORE_ORDERS[self.sir_options['score_type']])
         # pylint: disable=E1129
         with self.graph.as_default():
             with tf.variable_scope("sir"):
@@ -43,67 +113,69 @@ class SIRGraph:
                 self.template = tf.get_variable(
                     'template',
                     [
+                        run_count,
                         self.template_options['height'],
                         self.template_options['width']],
                     dtype=tf.float32,
                     initializer=tf.zeros_initializer)
 
                 with tf.variable_scope("grid_coordinates"):
-                    rspace = tf.linspace(
-                        np.float32(-self.template_options['height']/2.0),
-                        np.float32(self.template_options['height']/2.0),
-                        self.template_options['height'], name='rspace')
+                    if self.bucketed:
+                        self._build_template_size()
+                        rspace = self._lattice_axis(
+                            self.template_size[0],
+                            self.template_options['height'])
+                        cspace = self._lattice_axis(
+                            self.template_size[1],
+                            self.template_options['width'])
+                    else:
+                        rspace = tf.linspace(
+                            np.float32(-self.template_options['height']/2.0),
+                            np.float32(self.template_options['height']/2.0),
+                            self.template_options['height'], name='rspace')
 
-                    cspace = tf.linspace(
-                        np.float32(-self.template_options['width']/2.0),
-                        np.float32(self.template_options['width']/2.0),
-                        self.template_options['width'], name='cspace')
+                        cspace = tf.linspace(
+                            np.float32(-self.template_options['width']/2.0),
+                            np.float32(self.template_options['width']/2.0),
+                            self.template_options['width'], name='cspace')
 
                     tgrid = tf.meshgrid(rspace, cspace, indexing='ij')
-                    tgrid = tf.stack(tgrid, axis=2, name='tgrid')
+                    self.tgrid = tf.stack(tgrid, axis=2, name='tgrid')
+
+                    # block centres of the grid at the pyramid level
+                    if self.pyramid:
+                        self.coarse_tgrid = tf.transpose(self._pooled(
+                            tf.transpose(self.tgrid, [2, 0, 1])), [1, 2, 0])
 
                 with tf.variable_scope("roi"):
                     self.roi_x = tf.get_variable(
                         "roi_X",
-                        [4],
+                        [run_count, 4],
                         dtype=tf.float32,
                         initializer=tf.zeros_initializer)
 
-                    # build magnification and rotation transformation
-                    roi_c = tf.cos(self.roi_x[3])
-                    roi_s = tf.sin(self.roi_x[3])
-                    roi_rot = [[roi_c, -roi_s], [roi_s, roi_c]]
-                    roi_rot_mag = roi_rot*self.roi_x[2]
-
-                    # perform transformation contraction
-                    roi_grid = tf.einsum('mnz,zk->mnk', tgrid, roi_rot_mag)
-
-                    # translate
-                    roi_grid = roi_grid + self.roi_x[0:2]
-
-                    # shape tensors for _interpolate_bilinear batch
-                    roi_grid = tf.reshape(
-                        roi_grid,
-                        [1,
-                         (self.template_options['height'] *
-                          self.template_options['width']),
-                         2])
-                    roi_frame = tf.reshape(
-                        self.frame,
-                        [1,
-                         self.video_options['height'],
-                         self.video_options['width'],
-                         1])
-
-                    # bilinear interpolate and reshape
-                    roi_out = tf.squeeze(
-                        _interpolate_bilinear(roi_frame, roi_grid))
-                    roi_out = tf.reshape(
-                        roi_out,
-                        [self.template_options['height'],
-                         self.template_options['width']],
+                    roi_out = tf.identity(
+                        self._sample_roi(self.roi_x, self.frame),
                         name='roi_out')
 
+                # per-run seeds and filter step count of stateless draws
+                if self.stateless:
+                    self.seed_values = tf.get_variable(
+                        "seed_values",
+                        [run_count],
+                        dtype=tf.int64,
+                        initializer=tf.constant_initializer(self.seeds))
+                    self.seeds_input = tf.placeholder(
+                        dtype=tf.int64, shape=[run_count])
+                    self.set_seeds = self.seed_values.assign(
+                        self.seeds_input)
+                    self.step_count = tf.get_variable(
+                        "step_count",
+                        [],
+                        dtype=tf.int64,
+                        initializer=tf.zeros_initializer)
+                    self._draw_step = self.step_count
+
                 # system dynamics
                 self.system_a = tf.constant(
                     [[1, 0, 1, 0, 0, 0],
@@ -119,13 +191,13 @@ class SIRGraph:
 
                 self.sir_p = tf.get_variable(
                     "P",
-                    [self.sir_options['particle_count'], 6],
+                    [run_count, particle_count, 6],
                     dtype=tf.float32,
                     initializer=tf.zeros_initializer)
 
                 self.p_aux = tf.get_variable(
                     "P_aux",
-                    [self.sir_options['particle_count'], 6],
+                    [run_count, particle_count, 6],
                     dtype=tf.float32,
                     initializer=tf.zeros_initializer)
 
@@ -134,279 +206,105 @@ class SIRGraph:
                     shape=self.sir_p.shape)
                 self.seed_p = self.sir_p.assign(self.p_seed)
 
-                sir_w = tf.get_variable("W",
-                                        [self.sir_options['particle_count']],
-                                        dtype=tf.float32,
-                                        initializer=tf.ones_initializer)
-
-                self.reset_w = sir_w.assign(
-                    tf.fill(
-                        tf.shape(sir_w),
-                        1/self.sir_options['particle_count']))
-
-                self.noise_p = tf.multiply(
-                    tf.random_normal(self.sir_p.shape),
-                    tf.reshape(self.system_u, [1, 6]), name='noise')
-                prediction_p = tf.matmul(
-                    self.sir_p,
-                    self.system_a,
-                    transpose_b=True) + self.noise_p
-
-                self.predict_from_p = self.sir_p.assign(prediction_p)
-
-                with tf.variable_scope("transform"):
-
-                    # build magnification and rotation transformations
-                    transform_c = tf.cos(self.sir_p[:, 5])
-                    transform_s = tf.sin(self.sir_p[:, 5])
-                    transform_rot = tf.stack(
-                        [tf.stack([transform_c, -transform_s], axis=1),
-                         tf.stack([transform_s, transform_c], axis=1)], axis=2)
-                    transform_rot_mag = transform_rot * \
-                        tf.reshape(
-                            self.sir_p[:, 4],
-                            [self.sir_options['particle_count'], 1, 1])
-
-                    # perform transformation contraction
-                    transform_grid = tf.einsum(
-                        'mnz,pzk->pmnk', tgrid, transform_rot_mag)
-
-                    # translate
-                    transform_grid = transform_grid + \
-                        tf.reshape(
-                            self.sir_p[:, 0:2],
-                            [self.sir_options['particle_count'], 1, 1, 2])
-
-                with tf.variable_scope("interpolations"):
-                    score_grid = tf.reshape(transform_grid, [1, -1, 2])
-                    score_frame = tf.reshape(
-                        self.frame,
-                        [1,
-                         self.video_options['height'],
-                         self.video_options['width'],
-                         1])
-                    interpolations = _interpolate_bilinear(
-                        score_frame, score_grid)
-                    interpolations = tf.reshape(
-                        interpolations,
-                        [self.sir_options['particle_count'],
-                         self.template_options['height'],
-                         self.template_options['width']])
+                self.sir_w = tf.get_variable(
+                    "W",
+                    [run_count, particle_count],
+                    dtype=tf.float32,
+                    initializer=tf.ones_initializer)
+                sir_w = self.sir_w
+
+                self.w_seed = tf.placeholder(
+                    dtype=tf.float32,
+                    shape=self.sir_w.shape)
+                self.seed_w = self.sir_w.assign(self.w_seed)
+
+                # particles of each run in use, the prefix of the buffers
+                self.active_count = tf.get_variable(
+                    "active_count",
+                    [run_count],
+                    dtype=tf.int32,
+                    initializer=tf.constant_initializer(particle_count))
+                active_mask = self._active_mask(self.active_count)
+
+                self.reset_w = tf.group(
+                    sir_w.assign(self._uniform_weights()),
+                    self.active_count.assign(
+                        tf.fill([run_count], particle_count)))
+
+                self.predict_from_p = self.sir_p.assign(
+                    self._predict(self.sir_p))
 
                 with tf.variable_scope("Score"):
-                    template_mean = tf.reduce_mean(
-                        self.template, axis=[0, 1], keepdims=True)
-                    mean_shifted_template = self.template-template_mean
-                    e_template = tf.einsum(
-                        'mn,mn->',
-                        mean_shifted_template,
-                        mean_shifted_template)
-
-                    ss_mean = tf.reduce_mean(
-                        interpolations,
-                        axis=[1, 2],
-                        keepdims=True)
-                    mean_shifted_ss = interpolations-ss_mean
-                    e_ss = tf.einsum(
-                        'pmn,pmn->p', mean_shifted_ss, mean_shifted_ss)
-
-                    # spatial-support and template products
-                    e_template_ss = tf.einsum(
-                        'pmn,mn->p', mean_shifted_ss, mean_shifted_template)
-
-                    def score_init_time_0():
-                        # template energy
-                        e0_template = tf.get_variable(
-                            "e0_template",
-                            [],
-                            dtype=tf.float32,
-                            initializer=tf.ones_initializer)
-                        store_e0_template = e0_template.assign(e_template)
-                        # spatial-support energy
-                        e0_ss = tf.get_variable(
-                            "e0_ss",
-                            [self.sir_options['particle_count']],
-                            dtype=tf.float32,
-                            initializer=tf.ones_initializer)
-                        store_e0_ss = e0_ss.assign(e_ss)
-                        # template-spatial support cross energy
-                        e0_template_ss = tf.get_variable(
-                            "e0_template_ss",
-                            [self.sir_options['particle_count']],
-                            dtype=tf.float32,
-                            initializer=tf.ones_initializer)
-                        store_e0_template_ss = \
-                            e0_template_ss.assign(e_template_ss)
-                        return e0_template, store_e0_template, e0_ss, \
-                            store_e0_ss, e0_template_ss, \
-                            store_e0_template_ss
-
-                    def score_init_time_1():
-                        # template
-                        e1_template = tf.get_variable(
-                            "e1_template",
-                            [],
-                            dtype=tf.float32,
-                            initializer=tf.ones_initializer)
-                        shift_e1_template = e1_template.assign(e_template)
-                        # spatial-support energy
-                        e1_ss = tf.get_variable(
-                            "e1_ss",
-                            [self.sir_options['particle_count']],
-                            dtype=tf.float32,
-                            initializer=tf.ones_initializer)
-                        shift_e1_ss = e1_ss.assign(e1_ss)
-                        # template-spatial support cross energy
-                        e1_template_ss = tf.get_variable(
-                            "e1_template_ss",
-                            [self.sir_options['particle_count']],
-                            dtype=tf.float32,
-                            initializer=tf.ones_initializer)
-                        shift_e1_template_ss = e1_template_ss.assign(
-                            e1_template_ss)
-                        return e1_template, shift_e1_template, e1_ss, \
-                            shift_e1_ss, e1_template_ss, shift_e1_template_ss
-
-                    def score_init_time_2():
-                        # template energy
-                        e2_template = tf.get_variable(
-                            "e2_template",
-                            [],
-                            dtype=tf.float32,
-                            initializer=tf.ones_initializer)
-                        shift_e2_template = e2_template.assign(e1_template)
-                        # spatial-support energy
-                        e2_ss = tf.get_variable(
-                            "e2_ss",
-                            [self.sir_options['particle_count']],
-                            dtype=tf.float32,
-                            initializer=tf.ones_initializer)
-                        shift_e2_ss = e2_ss.assign(e1_ss)
-                        # template-spatial support cross energy
-                        e2_template_ss = tf.get_variable(
-                            "e2_template_ss",
-                            [self.sir_options['particle_count']],
+                    mean_shifted_template, e_template = \
+                        self._template_energy(
+                            self.template, self._template_mask())
+                    e_ss, e_template_ss = self._particle_energies(
+                        self.sir_p, self.frame, mean_shifted_template)
+
+                    # energy history stacked over the last dimension,
+                    # order 0 holds the current frame and order k the
+                    # frame k back, template energies broadcast over the
+                    # particles
+                    self.energy_history = {
+                        name: tf.get_variable(
+                            'e_' + name,
+                            [run_count,
+                             1 if name == 'template' else particle_count,
+                             score_order],
                             dtype=tf.float32,
                             initializer=tf.ones_initializer)
-                        shift_e2_template_ss = e2_template_ss.assign(
-                            e1_template_ss)
-                        return e2_template, shift_e2_template, e2_ss, \
-                            shift_e2_ss, e2_template_ss, shift_e2_template_ss
-
-                    if self.sir_options['score_type'] == 'NCC':
-                        e0_template, \
-                            self.store_e0_template, \
-                            e0_ss, \
-                            self.store_e0_ss, \
-                            e0_template_ss, \
-                            self.store_e0_template_ss = \
-                            score_init_time_0()
-
-                        corr = (e0_template_ss /
-                                (tf.sqrt(e0_template)*tf.sqrt(e0_ss)))
-
-                    elif self.sir_options['score_type'] == 'ASV':
-                        e0_template, \
-                            self.store_e0_template, \
-                            e0_ss, \
-                            self.store_e0_ss, \
-                            e0_template_ss, \
-                            self.store_e0_template_ss = \
-                            score_init_time_0()
-                        e1_template, \
-                            self.shift_e1_template, \
-                            e1_ss, self.shift_e1_ss, \
-                            e1_template_ss, \
-                            self.shift_e1_template_ss = \
-                            score_init_time_1()
-
-                        corr = ((e0_template_ss+e1_template_ss) /
-                                (tf.sqrt(e0_template+e1_template) *
-                                 tf.sqrt(e0_ss+e1_ss)))
-
-                    elif self.sir_options['score_type'] == 'ASVHO':
-                        e0_template, \
-                            self.store_e0_template, \
-                            e0_ss, \
-                            self.store_e0_ss, \
-                            e0_template_ss, \
-                            self.store_e0_template_ss = \
-                            score_init_time_0()
-                        e1_template, \
-                            self.shift_e1_template, \
-                            e1_ss, self.shift_e1_ss, \
-                            e1_template_ss, \
-                            self.shift_e1_template_ss = \
-                            score_init_time_1()
-                        e2_template, \
-                            self.shift_e2_template, \
-                            e2_ss, \
-                            self.shift_e2_ss, \
-                            e2_template_ss, \
-                            self.shift_e2_template_ss = \
-                            score_init_time_2()
-
-                        corr = ((e0_template_ss +
-                                 e1_template_ss +
-                                 e2_template_ss) /
-                                (tf.sqrt(
-                                    e0_template +
-                                    e1_template +
-                                    e2_template) *
-                                 tf.sqrt(
-                                     e0_ss +
-                                     e1_ss +
-                                     e2_ss)))
-
-                    score = tf.exp(-100*(1.0-corr))
-                    score = score / (tf.reduce_sum(score))
+                        for name in ENERGY_NAMES}
+
+                    stored = self._with_current(
+                        self.energy_history,
+                        {'template': e_template,
+                         'ss': e_ss,
+                         'template_ss': e_template_ss})
+                    self._store_energies = tf.group(*[
+                        self.energy_history[name].assign(stored[name])
+                        for name in ENERGY_NAMES])
+
+                    shifted = self._shift_history(self.energy_history)
+                    self._shift_energies = tf.group(*[
+                        self.energy_history[name].assign(shifted[name])
+                        for name in ENERGY_NAMES])
+
+                    corr = self._correlation(self.energy_history)
+                    score = self._score(corr, active_mask)
+                    self.best_corr = tf.reduce_max(
+                        corr if active_mask is None else tf.where(
+                            active_mask, corr,
+                            tf.fill(tf.shape(corr), -np.inf)), axis=-1)
                     score_out = tf.get_variable(
                         "score_out",
-                        [self.sir_options['particle_count']],
+                        [run_count, particle_count],
                         dtype=tf.float32,
                         initializer=tf.ones_initializer)
                     self.store_score = score_out.assign(score)
 
                 with tf.variable_scope("resampling"):
-                    logprobs_w = tf.reshape(tf.log(sir_w), [1, -1])
-                    ridx_w = tf.squeeze(
-                        tf.multinomial(
-                            logprobs_w,
-                            num_samples=self.sir_options['particle_count']))
-
                     resample_indices = tf.get_variable(
                         "resample_indices",
-                        [self.sir_options['particle_count']],
+                        [run_count, particle_count],
                         dtype=tf.int64,
                         initializer=tf.zeros_initializer)
-                    self.store_ridx = resample_indices.assign(ridx_w)
+                    self.store_ridx = resample_indices.assign(
+                        self._resample_indices(sir_w))
 
-                    r_p = tf.gather(self.sir_p, resample_indices)
+                    r_p = self._gather_particles(
+                        self.sir_p, resample_indices)
                     self.resample_p = self.sir_p.assign(r_p)
-                    if self.sir_options['score_type'] == 'ASV':
-                        self.resample_e1_template_ss = e1_template_ss.assign(
-                            tf.gather(e1_template_ss, resample_indices))
-                        self.resample_e1_ss = e1_ss.assign(
-                            tf.gather(e1_ss, resample_indices))
-                    if self.sir_options['score_type'] == 'ASVHO':
-                        self.resample_e1_template_ss = e1_template_ss.assign(
-                            tf.gather(e1_template_ss, resample_indices))
-                        self.resample_e1_ss = e1_ss.assign(
-                            tf.gather(e1_ss, resample_indices))
-                        self.resample_e2_template_ss = e2_template_ss.assign(
-                            tf.gather(e2_template_ss, resample_indices))
-                        self.resample_e2_ss = e2_ss.assign(
-                            tf.gather(e2_ss, resample_indices))
-
-                self.w_update = score_out * sir_w
-                self.w_update = (self.w_update /
-                                 tf.reduce_sum(self.w_update, axis=0))
+
+                    resampled = self._resample_history(
+                        self.energy_history, resample_indices)
+                    self._resample_energies = tf.group(*[
+                        self.energy_history[name].assign(resampled[name])
+                        for name in ('ss', 'template_ss')])
+
+                self.w_update = self._normalize(score_out * sir_w)
                 self.update_w = sir_w.assign(self.w_update)
 
-                self.estimate = tf.reduce_sum(
-                    tf.reshape(
-                        self.w_update,
-                        [-1, 1])*self.sir_p, axis=0, name='estimate')
+                self.estimate = self._estimate(self.w_update, self.sir_p)
 
                 with tf.variable_scope('template_update'):
 
@@ -414,31 +312,30 @@ class SIRGraph:
 
                     # establish best template history if not using estimate
                     if 'ESTIMATE' not in self.sir_options['update_method']:
-                        if 'WEIGHT' in self.sir_options['update_method']:
-                            max_source = sir_w
-                        elif 'SCORE' in self.sir_options['update_method']:
-                            max_source = score
-                        elif 'CORRELATION' in \
-                             self.sir_options['update_method']:
-                            max_source = corr
-
-                        # max among current particles
-                        max_idx = tf.argmax(max_source)
-                        best_current_template = interpolations[max_idx]
-                        best_current_value = max_source[max_idx]
+                        max_source = self._max_source(
+                            sir_w, score, corr, active_mask)
+
+                        # max among current particles of each run
+                        max_idx = tf.expand_dims(
+                            tf.argmax(max_source, axis=-1), 1)
+                        best_current_template = self._masked(self._sample(
+                            self._gather_particles(self.sir_p, max_idx),
+                            self.frame)[:, 0])
+                        best_current_value = self._gather_particles(
+                            max_source, max_idx)[:, 0]
                         self.template_history = TemplateHistory(
                             self.graph,
                             self.sir_options['historical_length'],
                             best_current_template,
-                            best_current_value
+                            best_current_value,
+                            rank=self.sir_options.get('svd_rank', 1),
+                            incremental=self.sir_options.get(
+                                'svd_mode', 'full') == 'incremental'
                         )
 
-                        if 'SVD' in self.sir_options['update_method']:
-                            best_historical_template = \
-                                self.template_history.get_svd()
-                        else:
-                            best_historical_template = \
-                                self.template_history.get_best()
+                        best_historical_template = \
+                            self._historical_template(
+                                self.template_history.state)
 
                         self.update_from_best = self.template.assign(
                             best_historical_template)
@@ -447,10 +344,1228 @@ class SIRGraph:
                 self.store_aux_p = self.p_aux.assign(self.sir_p)
                 self.restore_p_from_aux = self.sir_p.assign(self.p_aux)
                 # number of effective particles calculation
-                self.neff = 1.0/tf.einsum('p,p->', sir_w, sir_w)
+                self.neff = self._neff(sir_w)
+
+                with tf.variable_scope('fused_step'), self._jit_scope():
+                    self.fused_step = self._build_fused_step(
+                        score_out, resample_indices, self.frame)
+
+                # upload and sample only the window around the particles
+                if self.sir_options.get('roi_crop', False):
+                    with tf.variable_scope('roi_crop'):
+                        self._build_crop()
+                        with self._jit_scope():
+                            self.fused_crop_step = self._build_fused_step(
+                                score_out, resample_indices, self.crop,
+                                self.crop_origin)
+
+                # template search over the frame for lost tracks
+                if self.sir_options.get('redetect_neff') is not None or \
+                        self.sir_options.get('redetect_corr') is not None:
+                    with tf.variable_scope('redetect'):
+                        self._build_redetect()
+
+                # reduced precision scoring checked against float32
+                if self._score_dtype() != tf.float32:
+                    with tf.variable_scope('precision_report'):
+                        self._build_precision_report()
+
+                # on-device loop over a stack of frames
+                if self.sir_options.get('frames_per_call', 1) > 1:
+                    with tf.variable_scope('multi_step'):
+                        self.frames_input = tf.placeholder(
+                            dtype=tf.float32,
+                            shape=[None,
+                                   self.video_options['height'],
+                                   self.video_options['width']])
+                        self.frame_numbers_input = tf.placeholder(
+                            dtype=tf.int32, shape=[None])
+                        self.gt_input = tf.placeholder(
+                            dtype=tf.float32, shape=[None, 2])
+                        with self._jit_scope():
+                            self.multi_step = self._build_multi_step(
+                                score_out)
+
+                self.init_op = tf.global_variables_initializer()
+
+    def _jit_scope(self):
+        """ scope whose ops are compiled together by xla when the xla
+            option is set, so the step's kernels fuse and its
+            intermediates stay on chip """
+        if not self.sir_options.get('xla', False):
+            return nullcontext()
+        return jit.experimental_jit_scope(
+            compile_ops=lambda node_def: node_def.op not in _RANDOM_OPS)
+
+    def _per_run(self, random_fn):
+        """ stack random_fn(run, seed) over runs so each run draws from
+            its own seeded stream, the op seed is unique to the run seed
+            and this op so a run draws the same whether tracked alone or
+            batched; stateless seeds are [2] tensors of the run seed and a
+            counter unique to this op and the filter step """
+        site = self._draw_sites
+        self._draw_sites += 1
+        # seeds of ops numbered past the stride would repeat other ops'
+        assert site < _DRAW_SITES, 'graph has more random ops than seeds'
+        if self.stateless:
+            return tf.stack([
+                random_fn(run, tf.stack(
+                    [self.seed_values[run],
+                     self._draw_step * _DRAW_SITES + site]))
+                for run in range(self.run_count)])
+        return tf.stack([random_fn(run, seed * _DRAW_SITES + site)
+                         for run, seed in enumerate(self.seeds)])
+
+    def _random_normal(self, shape, seed):
+        if self.stateless:
+            return stateless.stateless_random_normal(shape, seed)
+        return tf.random_normal(shape, seed=seed)
+
+    def _random_uniform(self, shape, seed):
+        if self.stateless:
+            return stateless.stateless_random_uniform(shape, seed)
+        return tf.random_uniform(shape, seed=seed)
+
+    def _multinomial(self, logits, num_samples, seed):
+        if self.stateless:
+            return stateless.stateless_multinomial(logits, num_samples, seed)
+        return tf.multinomial(logits, num_samples=num_samples, seed=seed)
+
+    def _uniform_weights(self, active=None):
+        """ equal weights for every particle, or for the active particles
+            of each run when given with adaptive_particles """
+        if not self.adaptive or active is None:
+            return tf.fill(
+                [self.run_count, self.sir_options['particle_count']],
+                1/self.sir_options['particle_count'])
+        return tf.to_float(self._active_mask(active)) / \
+            tf.to_float(tf.expand_dims(active, 1))
+
+    def _active_mask(self, active):
+        """ [runs, particles] mask of the active particles, None with a
+            fixed particle count """
+        if not self.adaptive:
+            return None
+        return tf.sequence_mask(active, self.sir_options['particle_count'])
+
+    def _predict(self, sir_p):
+        """ propagate particles through the system dynamics """
+        noise_p = tf.multiply(
+            self._per_run(lambda run, seed: self._random_normal(
+                [self.sir_options['particle_count'], 6], seed)),
+            tf.reshape(self.system_u, [1, 1, 6]), name='noise')
+        return tf.einsum('rpj,kj->rpk', sir_p, self.system_a) + noise_p
+
+    @staticmethod
+    def _gather_particles(values, indices):
+        """ gather [runs, particles, ...] values by per-run particle
+            indices of shape [runs, count] """
+        shape = tf.shape(values)
+        offsets = tf.reshape(tf.range(shape[0]) * shape[1], [-1, 1])
+        flat_values = tf.reshape(
+            values, tf.concat([[-1], shape[2:]], axis=0))
+        return tf.gather(flat_values, tf.to_int32(indices) + offsets)
+
+    def _sample(self, sir_p, frame, origin=None, level=0):
+        """ bilinear interpolate the template grid transformed by each
+            particle of every run, returns [runs, particles, height, width]
+
+            frame may be a window of the video frame whose first pixel is
+            at origin (row, column), at level 1 frame is pooled by
+            _pooled and the coarse grid is sampled """
+        grid = self.tgrid if level == 0 else self.coarse_tgrid
+        with tf.name_scope("transform"):
+            sir_p = tf.reshape(sir_p, [-1, 6])
+
+            # build magnification and rotation transformations
+            transform_c = tf.cos(sir_p[:, 5])
+            transform_s = tf.sin(sir_p[:, 5])
+            transform_rot = tf.stack(
+                [tf.stack([transform_c, -transform_s], axis=1),
+                 tf.stack([transform_s, transform_c], axis=1)], axis=2)
+            transform_rot_mag = transform_rot * \
+                tf.reshape(sir_p[:, 4], [-1, 1, 1])
+
+            translation = sir_p[:, 0:2]
+            if origin is not None:
+                translation = translation - origin
+
+            if self._affine_sampler():
+                return tf.reshape(
+                    self._warp(frame, transform_rot_mag, translation, level),
+                    [self.run_count, -1] + grid.shape.as_list()[0:2])
+
+            # perform transformation contraction
+            transform_grid = tf.einsum(
+                'mnz,pzk->pmnk', grid, transform_rot_mag)
+
+            # translate
+            transform_grid = transform_grid + \
+                tf.reshape(translation, [-1, 1, 1, 2])
+
+            # pooled pixel i is centred on frame pixel factor*i+(factor-1)/2
+            if level:
+                factor = self._pyramid_option('pyramid_factor')
+                transform_grid = (transform_grid - (factor - 1) / 2) / factor
+
+        # one interpolation over the shared frame for every run
+        score_grid = tf.reshape(transform_grid, [1, -1, 2])
+        score_frame = tf.reshape(frame, [1] + frame.shape.as_list() + [1])
+        interpolations = _interpolate_bilinear(score_frame, score_grid)
+        return tf.reshape(
+            interpolations, [self.run_count, -1] + grid.shape.as_list()[0:2])
+
+    def _sample_roi(self, roi_x, frame):
+        """ bilinear interpolate the template grid at a region of interest
+            per run given as row, column, magnification and rotation,
+            returns [runs, height, width] """
+        # build magnification and rotation transformation
+        roi_c = tf.cos(roi_x[:, 3])
+        roi_s = tf.sin(roi_x[:, 3])
+        roi_rot = tf.stack(
+            [tf.stack([roi_c, -roi_s], axis=1),
+             tf.stack([roi_s, roi_c], axis=1)], axis=1)
+        roi_rot_mag = roi_rot*tf.reshape(roi_x[:, 2], [-1, 1, 1])
+
+        if self._affine_sampler():
+            return self._warp(frame, roi_rot_mag, roi_x[:, 0:2])
+
+        # perform transformation contraction
+        roi_grid = tf.einsum('mnz,rzk->rmnk', self.tgrid, roi_rot_mag)
+
+        # translate
+        roi_grid = roi_grid + tf.reshape(roi_x[:, 0:2], [-1, 1, 1, 2])
+
+        # shape tensors for _interpolate_bilinear batch
+        roi_grid = tf.reshape(roi_grid, [1, -1, 2])
+        roi_frame = tf.reshape(
+            frame,
+            [1,
+             self.video_options['height'],
+             self.video_options['width'],
+             1])
+
+        # bilinear interpolate and reshape
+        roi_out = _interpolate_bilinear(roi_frame, roi_grid)
+        return tf.reshape(
+            roi_out,
+            [-1,
+             self.template_options['height'],
+             self.template_options['width']])
+
+    def _affine_sampler(self):
+        sampler = self.sir_options.get('sampler', 'grid')
+        if sampler not in ('grid', 'affine'):
+            raise ValueError("sampler must be 'grid' or 'affine'")
+        return sampler == 'affine'
+
+    def _warp(self, frame, transform, translation, level=0):
+        """ bilinear interpolate frame at the template lattice mapped by
+            [count, 2, 2] transforms (lattice row and column to frame row
+            and column) and [count, 2] translations, returns [count,
+            height, width] clamped at the borders like
+            _interpolate_bilinear
+
+            the frame coordinates are formed by broadcasting the lattice
+            axes rather than contracting the [height, width, 2] grid;
+            transforms that do not rotate are gathered apart and their
+            coordinates stay [count, height, 1] and [count, 1, width]
+            until the corners are gathered, only the rotated ones form
+            dense [count, height, width] coordinates """
+        grid = self.tgrid if level == 0 else self.coarse_tgrid
+        rows = tf.reshape(grid[:, 0, 0], [1, -1, 1])
+        cols = tf.reshape(grid[0, :, 1], [1, 1, -1])
+        if level:
+            # pooled pixel i is centred on frame pixel factor*i+(factor-1)/2
+            factor = self._pyramid_option('pyramid_factor')
+            transform = transform / factor
+            translation = (translation - (factor - 1) / 2) / factor
+
+        def coefficient(part, row, col):
+            return tf.reshape(part[:, row, col], [-1, 1, 1])
+
+        def axis(part, k):
+            return tf.reshape(part[:, k], [-1, 1, 1])
+
+        def separable(part, shift):
+            return (coefficient(part, 0, 0) * rows + axis(shift, 0),
+                    coefficient(part, 1, 1) * cols + axis(shift, 1))
+
+        def rotated(part, shift):
+            return (coefficient(part, 0, 0) * rows +
+                    coefficient(part, 1, 0) * cols + axis(shift, 0),
+                    coefficient(part, 0, 1) * rows +
+                    coefficient(part, 1, 1) * cols + axis(shift, 1))
+
+        height, width = frame.shape.as_list()
+        flat_frame = tf.reshape(frame, [-1])
+
+        def interpolate(coordinates):
+            row_queries, col_queries = coordinates
+
+            def corner(queries, size):
+                floor = tf.clip_by_value(tf.floor(queries), 0., size - 2.)
+                alpha = tf.cast(tf.clip_by_value(queries - floor, 0., 1.),
+                                frame.dtype)
+                return tf.to_int32(floor), alpha
+
+            row_floor, row_alpha = corner(row_queries, height)
+            col_floor, col_alpha = corner(col_queries, width)
+            index = row_floor * width + col_floor
+            top_left = tf.gather(flat_frame, index)
+            top_right = tf.gather(flat_frame, index + 1)
+            bottom_left = tf.gather(flat_frame, index + width)
+            bottom_right = tf.gather(flat_frame, index + width + 1)
+
+            interp_top = col_alpha * (top_right - top_left) + top_left
+            interp_bottom = \
+                col_alpha * (bottom_right - bottom_left) + bottom_left
+            return row_alpha * (interp_bottom - interp_top) + interp_top
+
+        # partition 1 holds the transforms without rotation
+        unrotated = tf.to_int32(tf.logical_and(
+            tf.equal(transform[:, 0, 1], 0), tf.equal(transform[:, 1, 0], 0)))
+        parts = tf.dynamic_partition(
+            tf.range(tf.shape(transform)[0]), unrotated, 2)
+        interpolations = tf.dynamic_stitch(parts, [
+            interpolate(sample(tf.gather(transform, part),
+                               tf.gather(translation, part)))
+            for sample, part in zip((rotated, separable), parts)])
+        interpolations.set_shape(
+            transform.shape[0:1].concatenate([height, width]))
+        return interpolations
+
+    def _build_template_size(self):
+        """ (height, width) of the template within its bucket, fed at
+            reset or set_template_size """
+        self.template_size = tf.get_variable(
+            "template_size",
+            [2],
+            dtype=tf.int32,
+            initializer=tf.constant_initializer(self.sir_options.get(
+                'template_size', [self.template_options['height'],
+                                  self.template_options['width']])))
+        self.template_size_input = tf.placeholder(dtype=tf.int32, shape=[2])
+        self.set_size = self.template_size.assign(self.template_size_input)
+
+    @staticmethod
+    def _lattice_axis(size, bucket):
+        """ the size points tf.linspace(-size/2, size/2, size) places,
+            continued at the same spacing over the bucket """
+        size = tf.to_float(size)
+        return -size / 2 + tf.range(bucket, dtype=tf.float32) * \
+            size / (size - 1)
+
+    def _template_mask(self, level=0):
+        """ [height, width] mask of the template within its bucket at the
+            pyramid level, None without template_buckets """
+        if not self.bucketed:
+            return None
+        grid = self.tgrid if level == 0 else self.coarse_tgrid
+        height, width = grid.shape.as_list()[0:2]
+        size = self.template_size
+        if level:
+            size = size // self._pyramid_option('pyramid_factor')
+        return tf.to_float(tf.logical_and(
+            tf.expand_dims(tf.range(height) < size[0], 1),
+            tf.expand_dims(tf.range(width) < size[1], 0)))
+
+    def _masked(self, template):
+        """ [runs, height, width] templates zeroed outside the mask, so
+            the padding adds nothing to the template history """
+        if not self.bucketed:
+            return template
+        return template * self._template_mask()
+
+    @staticmethod
+    def _template_energy(template, mask=None):
+        """ mean shifted template and its [runs, 1] energy, over mask
+            when given """
+        if mask is None:
+            template_mean = tf.reduce_mean(
+                template, axis=[1, 2], keepdims=True)
+            mean_shifted_template = template-template_mean
+        else:
+            template_mean = tf.reduce_sum(
+                template * mask, axis=[1, 2], keepdims=True) / \
+                tf.reduce_sum(mask)
+            mean_shifted_template = (template-template_mean) * mask
+        e_template = tf.einsum(
+            'rmn,rmn->r', mean_shifted_template, mean_shifted_template)
+        return mean_shifted_template, tf.reshape(e_template, [-1, 1])
+
+    @staticmethod
+    def _energies(interpolations, mean_shifted_template, mask=None):
+        """ spatial-support energy and template cross energy per particle,
+            over mask when given, reduced precision products are summed
+            in float32 """
+        if mask is not None:
+            ss_mean = tf.reduce_sum(
+                tf.to_float(interpolations) * mask, axis=[2, 3],
+                keepdims=True) / tf.reduce_sum(mask)
+            mean_shifted_ss = (
+                interpolations - tf.cast(ss_mean, interpolations.dtype)) * \
+                tf.cast(mask, interpolations.dtype)
+        elif interpolations.dtype != tf.float32:
+            ss_mean = tf.cast(tf.reduce_mean(
+                tf.to_float(interpolations), axis=[2, 3], keepdims=True),
+                interpolations.dtype)
+            mean_shifted_ss = interpolations-ss_mean
+        else:
+            ss_mean = tf.reduce_mean(
+                interpolations, axis=[2, 3], keepdims=True)
+            mean_shifted_ss = interpolations-ss_mean
+
+        if interpolations.dtype != tf.float32:
+            e_ss = tf.reduce_sum(
+                tf.to_float(tf.square(mean_shifted_ss)), axis=[2, 3])
+            e_template_ss = tf.reduce_sum(tf.to_float(
+                mean_shifted_ss * tf.expand_dims(mean_shifted_template, 1)),
+                axis=[2, 3])
+            return e_ss, e_template_ss
+
+        e_ss = tf.einsum('rpmn,rpmn->rp', mean_shifted_ss, mean_shifted_ss)
+
+        # spatial-support and template products
+        e_template_ss = tf.einsum(
+            'rpmn,rmn->rp', mean_shifted_ss, mean_shifted_template)
+        return e_ss, e_template_ss
+
+    def _chunk_size(self):
+        """ particles interpolated at once, None for all of them """
+        chunk = self.sir_options.get('score_chunk')
+        if chunk == 'auto':
+            budget = self.sir_options.get(
+                'score_memory_mb', SCORE_MEMORY_MB) * 2**20
+            sample_bytes = self.run_count * SAMPLE_BYTES * \
+                self.template_options['height'] * \
+                self.template_options['width']
+            chunk = max(1, int(budget // sample_bytes))
+        return chunk
+
+    def _score_dtype(self):
+        """ dtype of the interpolation and energy products """
+        precision = self.sir_options.get('score_precision', 'float32')
+        if precision not in SCORE_PRECISIONS:
+            raise ValueError(
+                f"score_precision must be one of {SCORE_PRECISIONS}")
+        return tf.as_dtype(precision)
+
+    def _particle_energies(self, sir_p, frame, mean_shifted_template,
+                           origin=None, level=0, dtype=None):
+        """ energies of [runs, particles, 6] particles, with score_chunk
+            set the particles are interpolated a chunk at a time and only
+            their energies are kept, bounding the live samples
+
+            below float32 the frame and template are scaled by
+            PRECISION_SCALE and interpolated and multiplied in the
+            score_precision dtype (or dtype), the particle coordinates
+            and the returned energies stay float32 """
+        dtype = dtype or self._score_dtype()
+        mask = self._template_mask(level)
+        if dtype != tf.float32:
+            frame = tf.cast(frame * PRECISION_SCALE, dtype)
+            mean_shifted_template = tf.cast(
+                mean_shifted_template * PRECISION_SCALE, dtype)
+
+        def energies(particles):
+            e_ss, e_template_ss = self._energies(
+                self._sample(particles, frame, origin, level),
+                mean_shifted_template, mask)
+            if dtype == tf.float32:
+                return e_ss, e_template_ss
+            return (tf.to_float(e_ss) / PRECISION_SCALE**2,
+                    tf.to_float(e_template_ss) / PRECISION_SCALE**2)
+
+        chunk = self._chunk_size()
+        if not chunk or chunk >= self.sir_options['particle_count']:
+            return energies(sir_p)
+
+        count = tf.shape(sir_p)[1]
+        chunks = (count + chunk - 1) // chunk
+        tiles = tf.transpose(tf.reshape(
+            tf.pad(sir_p, [[0, 0], [0, chunks * chunk - count], [0, 0]]),
+            [self.run_count, chunks, chunk, 6]), [1, 0, 2, 3])
+
+        # one chunk in flight at a time
+        e_ss, e_template_ss = tf.map_fn(
+            energies, tiles, dtype=(tf.float32, tf.float32),
+            parallel_iterations=1, back_prop=False)
+
+        def untiled(energies):
+            return tf.reshape(tf.transpose(energies, [1, 0, 2]),
+                              [self.run_count, -1])[:, 0:count]
+        return untiled(e_ss), untiled(e_template_ss)
+
+    def _pyramid_option(self, name):
+        return self.sir_options.get(name, PYRAMID_DEFAULTS.get(name))
+
+    def _pooled(self, images):
+        """ [batch, height, width] images averaged over blocks of
+            pyramid_factor pixels, partial blocks are dropped """
+        factor = self._pyramid_option('pyramid_factor')
+        return tf.nn.avg_pool(
+            tf.expand_dims(images, -1), [1, factor, factor, 1],
+            [1, factor, factor, 1], 'VALID')[..., 0]
+
+    def _coarse(self, frame, template):
+        """ pyramid level of the frame and the mean shifted template with
+            its energy, None without pyramid scoring """
+        if not self.pyramid:
+            return None
+        mean_shifted_template, e_template = self._template_energy(
+            self._pooled(template), self._template_mask(level=1))
+        return (self._pooled(tf.expand_dims(frame, 0))[0],
+                mean_shifted_template, e_template)
+
+    def _scored_energies(self, sir_p, frame, mean_shifted_template,
+                         e_template, origin=None, coarse=None):
+        """ particle energies, with coarse given every particle is scored
+            at the pyramid level and only the best by coarse correlation
+            (pyramid_keep of them, or those reaching pyramid_threshold)
+            are refined at full resolution
+
+            pruned particles keep their coarse energies scaled by the
+            ratio of full to coarse template energy, which gives them
+            their coarse correlation; also returns the mean absolute
+            difference of coarse and full correlation over the refined
+            particles of each run, None without coarse """
+        if coarse is None:
+            return self._particle_energies(
+                sir_p, frame, mean_shifted_template, origin) + (None,)
+
+        coarse_frame, coarse_template, coarse_e_template = coarse
+        coarse_ss, coarse_template_ss = self._particle_energies(
+            sir_p, coarse_frame, coarse_template, origin, level=1)
+        coarse_corr = coarse_template_ss / tf.sqrt(
+            coarse_e_template * coarse_ss)
+
+        count = tf.shape(sir_p)[1]
+        threshold = self._pyramid_option('pyramid_threshold')
+        if threshold is None:
+            refined = tf.to_int32(tf.ceil(
+                self._pyramid_option('pyramid_keep') * tf.to_float(count)))
+        else:
+            refined = tf.maximum(tf.reduce_max(tf.reduce_sum(
+                tf.to_int32(coarse_corr >= threshold), axis=1)), 1)
+        top = tf.nn.top_k(coarse_corr, k=count).indices[:, 0:refined]
+        full_ss, full_template_ss = self._particle_energies(
+            self._gather_particles(sir_p, top), frame,
+            mean_shifted_template, origin)
+
+        indices = tf.stack(
+            [tf.tile(tf.expand_dims(tf.range(self.run_count), 1),
+                     [1, refined]), top], axis=2)
+        shape = tf.stack([self.run_count, count])
+        is_refined = tf.scatter_nd(
+            indices, tf.ones_like(full_ss), shape) > 0
+        ratio = e_template / coarse_e_template
+        e_ss = tf.where(is_refined, tf.scatter_nd(indices, full_ss, shape),
+                        coarse_ss * ratio)
+        e_template_ss = tf.where(
+            is_refined, tf.scatter_nd(indices, full_template_ss, shape),
+            coarse_template_ss * ratio)
+
+        error = tf.reduce_mean(tf.abs(
+            self._gather_particles(coarse_corr, top) -
+            full_template_ss / tf.sqrt(e_template * full_ss)), axis=1)
+        return e_ss, e_template_ss, error
+
+    @staticmethod
+    def _with_current(history, current):
+        """ energy history with order 0 replaced by the current energies """
+        return {name: tf.concat([tf.expand_dims(current[name], -1),
+                                 history[name][..., 1:]], axis=-1)
+                for name in ENERGY_NAMES}
+
+    @staticmethod
+    def _shift_history(history):
+        """ roll the energy history back one frame, order k receives
+            order k-1 and order 0 is left to be overwritten """
+        return {name: tf.concat([energies[..., 0:1], energies[..., 0:-1]],
+                                axis=-1)
+                for name, energies in history.items()}
+
+    def _resample_history(self, history, indices):
+        """ gather the particle energies of every order at once """
+        return {
+            'template': history['template'],
+            'ss': self._gather_particles(history['ss'], indices),
+            'template_ss': self._gather_particles(
+                history['template_ss'], indices)}
+
+    @staticmethod
+    def _correlation(history):
+        """ accumulated normalized correlation over the energy history """
+        return (tf.reduce_sum(history['template_ss'], axis=-1) /
+                (tf.sqrt(tf.reduce_sum(history['template'], axis=-1)) *
+                 tf.sqrt(tf.reduce_sum(history['ss'], axis=-1))))
+
+    @staticmethod
+    def _score(corr, mask=None):
+        """ normalized exponential score from correlation, zero outside
+            mask when given """
+        score = tf.exp(-100*(1.0-corr))
+        if mask is not None:
+            score = tf.where(mask, score, tf.zeros_like(score))
+        return score / (tf.reduce_sum(score, axis=-1, keepdims=True))
+
+    @staticmethod
+    def _normalize(weights):
+        """ scale the weights of each run to sum to one """
+        return weights / tf.reduce_sum(weights, axis=-1, keepdims=True)
+
+    @staticmethod
+    def _estimate(weights, sir_p):
+        """ weighted particle mean of each run """
+        return tf.einsum('rp,rpk->rk', weights, sir_p, name='estimate')
+
+    @staticmethod
+    def _neff(weights):
+        """ number of effective particles of each run """
+        return 1.0/tf.einsum('rp,rp->r', weights, weights)
+
+    def _resample_indices(self, weights):
+        """ draw particle indices proportional to weight with the
+            configured resampler: 'multinomial' (default), or the O(N)
+            'systematic' and 'stratified' resamplers """
+        particle_count = self.sir_options['particle_count']
+        resampler = self.sir_options.get('resampler', 'multinomial')
+        if resampler == 'multinomial':
+            logprobs_w = tf.log(weights)
+            return self._per_run(lambda run, seed: tf.squeeze(
+                self._multinomial(
+                    logprobs_w[run:run+1], particle_count, seed), axis=0))
+
+        # one uniform offset shared by every stratum, or one per stratum
+        if resampler == 'systematic':
+            offset_shape = [1]
+        elif resampler == 'stratified':
+            offset_shape = [particle_count]
+        else:
+            raise ValueError('unknown resampler {}'.format(resampler))
+        offsets = self._per_run(
+            lambda run, seed: self._random_uniform(offset_shape, seed))
+        positions = (tf.range(particle_count, dtype=tf.float32) +
+                     offsets) / particle_count
+
+        cdf = tf.cumsum(weights, axis=-1)
+        cdf = cdf / cdf[:, -1:]
+        indices = tf.searchsorted(cdf, positions, side='right')
+        return tf.to_int64(tf.minimum(indices, particle_count - 1))
+
+    def _kld_count(self, particles):
+        """ KLD-sampling particle count of each run: enough particles for
+            the sample to approximate the posterior over the (row, column)
+            bins it occupies within kld_epsilon, with the confidence of
+            the normal quantile kld_z, clamped to the configured bounds """
+        options = dict(KLD_DEFAULTS, **self.sir_options)
+        particle_count = options['particle_count']
+
+        # one key per bin, offset so negative positions keep unique keys
+        bins = tf.clip_by_value(
+            tf.to_int32(tf.floor(particles[..., 0:2] /
+                                 options['kld_bin_size'])) + 2**14,
+            0, 2**15 - 1)
+        keys = bins[..., 0] * 2**15 + bins[..., 1]
+        ordered = tf.nn.top_k(keys, k=particle_count).values
+        occupied = 1 + tf.reduce_sum(tf.to_int32(
+            tf.not_equal(ordered[:, 1:], ordered[:, :-1])), axis=1)
+
+        # wilson-hilferty approximation of the chi-square quantile
+        dof = tf.to_float(tf.maximum(occupied - 1, 1))
+        spread = 2.0 / (9.0 * dof)
+        bound = dof / (2.0 * options['kld_epsilon']) * (
+            1.0 - spread + tf.sqrt(spread) * options['kld_z']) ** 3
+        count = tf.where(occupied > 1, tf.to_int32(tf.ceil(bound)),
+                         tf.zeros_like(occupied))
+        return tf.clip_by_value(
+            count, min(options['min_particle_count'], particle_count),
+            particle_count)
+
+    def _draw(self, sir_p, sir_w, active):
+        """ resample indices and the active particle count that follows,
+            with adaptive_particles the draws are shuffled so that their
+            active prefix is a fair sample of the weights """
+        ridx = self._resample_indices(sir_w)
+        if not self.adaptive:
+            return ridx, active
+        particle_count = self.sir_options['particle_count']
+        keys = self._per_run(lambda run, seed: self._random_uniform(
+            [particle_count], seed))
+        shuffle = tf.nn.top_k(keys, k=particle_count).indices
+        ridx = self._gather_particles(ridx, shuffle)
+        return ridx, self._kld_count(self._gather_particles(sir_p, ridx))
+
+    def _resample(self, sir_p, sir_w, history, active, kept_w=None):
+        """ resample particles, weights and particle energies, returns them
+            with the resample indices and active particle counts; with
+            resample_threshold set only runs whose neff fell below that
+            fraction of their active particles are resampled and the
+            work is skipped when none did, the others keep kept_w
+            (default sir_w) """
+        kept_w = sir_w if kept_w is None else kept_w
+        particle_count = self.sir_options['particle_count']
+        threshold = self.sir_options.get('resample_threshold')
+
+        if not threshold:
+            ridx, active = self._draw(sir_p, sir_w, active)
+            return (self._gather_particles(sir_p, ridx),
+                    self._uniform_weights(active),
+                    self._resample_history(history, ridx), ridx, active)
+
+        needed = self._neff(sir_w) < threshold * tf.to_float(active)
+        in_place = tf.to_int64(tf.tile(
+            tf.expand_dims(tf.range(particle_count), 0),
+            [self.run_count, 1]))
+
+        def resample():
+            # particles of healthy runs stay in place with their weights
+            drawn, drawn_active = self._draw(sir_p, sir_w, active)
+            ridx = tf.where(needed, drawn, in_place)
+            new_active = tf.where(needed, drawn_active, active)
+            return (self._gather_particles(sir_p, ridx),
+                    tf.where(needed, self._uniform_weights(new_active),
+                             kept_w),
+                    self._resample_history(history, ridx), ridx, new_active)
+
+        return tf.cond(tf.reduce_any(needed), resample,
+                       lambda: (sir_p, kept_w, history, in_place, active))
+
+    def _max_source(self, sir_w, score, corr, mask=None):
+        """ per-particle value ranking templates for the history, only
+            particles inside mask rank when given """
+        if 'WEIGHT' in self.sir_options['update_method']:
+            source = sir_w
+        elif 'SCORE' in self.sir_options['update_method']:
+            source = score
+        elif 'CORRELATION' in self.sir_options['update_method']:
+            source = corr
+        else:
+            raise ValueError('unknown update method {}'.format(
+                self.sir_options['update_method']))
+        if mask is not None:
+            source = tf.where(
+                mask, source, tf.fill(tf.shape(source), -np.inf))
+        return source
+
+    def _historical_template(self, history_state):
+        """ template chosen from the history by the update method """
+        if 'SVD' in self.sir_options['update_method']:
+            return self.template_history.svd(history_state)
+        return self.template_history.best(history_state)
+
+    def _weigh(self, sir_p, sir_w, history, frame, mean_shifted_template,
+               e_template, active, origin=None, coarse=None):
+        """ predict, score and reweight particles, with adaptive_particles
+            only the particles up to the largest active count are
+            interpolated; also returns the pyramid correlation error """
+        sir_p = self._predict(sir_p)
+        if self.adaptive:
+            scored = tf.reduce_max(active)
+            e_ss, e_template_ss, pyramid_error = self._scored_energies(
+                sir_p[:, 0:scored], frame, mean_shifted_template,
+                e_template, origin, coarse)
+            # unscored particles are inactive, their score is masked
+            padding = [[0, 0],
+                       [0, self.sir_options['particle_count'] - scored]]
+            e_ss = tf.pad(e_ss, padding, constant_values=1)
+            e_template_ss = tf.pad(e_template_ss, padding)
+        else:
+            e_ss, e_template_ss, pyramid_error = self._scored_energies(
+                sir_p, frame, mean_shifted_template, e_template, origin,
+                coarse)
+        history = self._with_current(history, {
+            'template': e_template,
+            'ss': e_ss,
+            'template_ss': e_template_ss})
+        score = self._score(self._correlation(history),
+                            self._active_mask(active))
+        sir_w = self._normalize(score * sir_w)
+        return sir_p, sir_w, history, score, pyramid_error
+
+    def _step(self, sir_p, sir_w, history, frame, template, active,
+              origin=None):
+        """ one frame of the configured filter mode on state tensors,
+            returns the new state along with the score, the auxiliary
+            particles, the resample indices (None if unused), the
+            active particle counts and the pyramid correlation error """
+        filter_mode = self.sir_options['filter_mode']
+        mean_shifted_template, e_template = self._template_energy(
+            template, self._template_mask())
+        coarse = self._coarse(frame, template)
+
+        p_aux = None
+        ridx = None
+        # weights before the look-ahead score, kept by runs that are not
+        # resampled so the frame's score weighs them only once
+        w_prev = sir_w
+        if filter_mode in ('NONE', 'AUX'):
+            history = self._shift_history(history)
+        if filter_mode == 'AUX':
+            p_aux = sir_p
+            _, sir_w, history, _, _ = self._weigh(
+                sir_p, sir_w, history, frame,
+                mean_shifted_template, e_template, active, origin, coarse)
+            # resample the auxiliary particles by their predicted weight
+            sir_p = p_aux
+        if filter_mode in ('RESAMPLE', 'AUX'):
+            sir_p, sir_w, history, ridx, active = self._resample(
+                sir_p, sir_w, history, active, w_prev)
+        sir_p, sir_w, history, score, pyramid_error = self._weigh(
+            sir_p, sir_w, history, frame, mean_shifted_template, e_template,
+            active, origin, coarse)
+        return (sir_p, sir_w, history, score, p_aux, ridx, active,
+                pyramid_error)
+
+    def _history_updates(self, history):
+        """ (variable, value) pairs storing an energy history """
+        return [(self.energy_history[name], history[name])
+                for name in ENERGY_NAMES]
+
+    @staticmethod
+    def _assign_in_order(updates, outputs):
+        """ assign (variable, value) pairs one after another once every
+            value and output is computed, returns outputs that wait for
+            the assignments """
+        assigned = tf.group(*(list(outputs.values()) +
+                              [v for _, v in updates]))
+        for variable, value in updates:
+            with tf.control_dependencies([assigned]):
+                assigned = variable.assign(value).op
+
+        with tf.control_dependencies([assigned]):
+            return {key: tf.identity(value, name=key)
+                    for key, value in outputs.items()}
+
+    def _build_fused_step(self, score_out, resample_indices, frame,
+                          origin=None):
+        """ one frame of the configured filter mode on frame (a window at
+            origin when given) as a single fetch, returns the estimate,
+            neff, active count and, with pyramid scoring, pyramid error
+            tensors that trigger it """
+
+        # snapshot state once so every stage sees consistent values
+        sir_p = tf.identity(self.sir_p)
+        sir_w = tf.identity(self.sir_w)
+        history = {name: tf.identity(energies)
+                   for name, energies in self.energy_history.items()}
+
+        sir_p, sir_w, history, score, p_aux, ridx, active, \
+            pyramid_error = self._step(
+                sir_p, sir_w, history, frame, self.template,
+                tf.identity(self.active_count), origin)
+
+        updates = []
+        if p_aux is not None:
+            updates.append((self.p_aux, p_aux))
+        if ridx is not None:
+            updates.append((resample_indices, ridx))
+        updates += self._history_updates(history)
+        updates += [(score_out, score), (self.sir_p, sir_p),
+                    (self.sir_w, sir_w), (self.active_count, active)]
+        if self.stateless:
+            updates.append((self.step_count, self.step_count + 1))
+
+        # estimate reweights by the stored score like self.estimate
+        outputs = {
+            'estimate': self._estimate(
+                self._normalize(score * sir_w), sir_p),
+            'neff': self._neff(sir_w),
+            'active': active}
+        if pyramid_error is not None:
+            outputs['pyramid_error'] = pyramid_error
+        return self._assign_in_order(updates, outputs)
+
+    def _build_multi_step(self, score_out):
+        """ advance the filter over every frame of frames_input in a
+            device-side loop, maintaining the template at update_interval
+            boundaries, returns per-frame estimate, error, neff,
+            active, template_updated and, with pyramid scoring,
+            pyramid_error tensors """
+        update_interval = self.sir_options['update_interval']
+        use_history = 'ESTIMATE' not in self.sir_options['update_method']
+        frame_count = tf.shape(self.frames_input)[0]
+
+        def body(k, sir_p, sir_w, active, history, template, history_state,
+                 outputs):
+            frame = self.frames_input[k]
+            if self.stateless:
+                self._draw_step = self.step_count + tf.to_int64(k)
+            if update_interval > 0:
+                do_update = tf.equal(
+                    tf.mod(self.frame_numbers_input[k], update_interval), 0)
+            else:
+                do_update = tf.constant(False)
+
+            # maintain template, scores are those of the previous frame
+            mask = self._active_mask(active)
+            corr = self._correlation(history)
+            score = self._score(corr, mask)
+            if use_history:
+                max_source = self._max_source(sir_w, score, corr, mask)
+                max_idx = tf.expand_dims(tf.argmax(max_source, axis=-1), 1)
+                best_current_template = self._masked(self._sample(
+                    self._gather_particles(sir_p, max_idx), frame)[:, 0])
+                history_state = self.template_history.pushed(
+                    history_state, best_current_template,
+                    self._gather_particles(max_source, max_idx)[:, 0])
+
+                def candidate():
+                    return self._historical_template(history_state)
+            else:
+                def candidate():
+                    est = self._estimate(
+                        self._normalize(score * sir_w), sir_p)
+                    return self._sample_roi(
+                        tf.gather(est, [0, 1, 4, 5], axis=1), frame)
+            previous = template
+            template = tf.cond(do_update, candidate, lambda: previous)
+
+            sir_p, sir_w, history, score, _, _, active, \
+                pyramid_error = self._step(
+                    sir_p, sir_w, history, frame, template, active)
+            estimate = self._estimate(self._normalize(score * sir_w), sir_p)
+            written = [
+                outputs[0].write(k, estimate),
+                outputs[1].write(k, estimate[:, 0:2] - self.gt_input[k]),
+                outputs[2].write(k, self._neff(sir_w)),
+                outputs[3].write(k, do_update),
+                outputs[4].write(k, active)]
+            if pyramid_error is not None:
+                written.append(outputs[5].write(k, pyramid_error))
+            outputs = written
+            return (k+1, sir_p, sir_w, active, history, template,
+                    history_state, outputs)
+
+        if use_history:
+            history_state = {
+                name: tf.identity(variable)
+                for name, variable in self.template_history.state.items()}
+        else:
+            # placeholders carried through the loop untouched
+            history_state = {'seeded': tf.constant(False)}
+
+        loop_vars = (
+            tf.constant(0),
+            tf.identity(self.sir_p),
+            tf.identity(self.sir_w),
+            tf.identity(self.active_count),
+            {name: tf.identity(energies)
+             for name, energies in self.energy_history.items()},
+            tf.identity(self.template),
+            history_state,
+            [tf.TensorArray(tf.float32, size=frame_count),
+             tf.TensorArray(tf.float32, size=frame_count),
+             tf.TensorArray(tf.float32, size=frame_count),
+             tf.TensorArray(tf.bool, size=frame_count),
+             tf.TensorArray(tf.int32, size=frame_count)] +
+            ([tf.TensorArray(tf.float32, size=frame_count)]
+             if self.pyramid else []))
+        _, sir_p, sir_w, active, history, template, \
+            history_state, outputs = tf.while_loop(
+                lambda k, *_: k < frame_count, body, loop_vars)
+        if self.stateless:
+            self._draw_step = self.step_count
+
+        updates = self._history_updates(history)
+        updates += [
+            (score_out, self._score(self._correlation(history),
+                                    self._active_mask(active))),
+            (self.sir_p, sir_p),
+            (self.sir_w, sir_w),
+            (self.active_count, active),
+            (self.template, template),
+            (self.frame, self.frames_input[frame_count-1])]
+        if self.stateless:
+            updates.append((self.step_count, self.step_count +
+                            tf.to_int64(frame_count)))
+        if use_history:
+            updates += [
+                (self.template_history.state[name], value)
+                for name, value in history_state.items()]
+
+        stacked = {
+            'estimate': outputs[0].stack(),
+            'error': outputs[1].stack(),
+            'neff': outputs[2].stack(),
+            'template_updated': outputs[3].stack(),
+            'active': outputs[4].stack()}
+        if self.pyramid:
+            stacked['pyramid_error'] = outputs[5].stack()
+        return self._assign_in_order(updates, stacked)
+
+    def _crop_size(self):
+        """ (height, width) of the frame window uploaded with roi_crop,
+            roi_crop_size or four template sizes, within the frame """
+        height, width = self.sir_options.get(
+            'roi_crop_size', (4 * self.template_options['height'],
+                              4 * self.template_options['width']))
+        return (max(2, min(height, self.video_options['height'])),
+                max(2, min(width, self.video_options['width'])))
+
+    def _build_crop(self):
+        """ window variable, its upload op and the box the particle cloud
+            samples in the next step """
+        crop_height, crop_width = self._crop_size()
+        self.crop = tf.get_variable(
+            'crop', [crop_height, crop_width], dtype=tf.float32,
+            initializer=tf.zeros_initializer)
+        self.crop_origin = tf.get_variable(
+            'crop_origin', [2], dtype=tf.float32,
+            initializer=tf.zeros_initializer)
+        self.crop_input = tf.placeholder(
+            dtype=tf.float32, shape=[crop_height, crop_width])
+        self.crop_origin_input = tf.placeholder(dtype=tf.int32, shape=[2])
+
+        # the window of the full frame is refreshed too, so ops reading
+        # the frame near the particles see the current one
+        row, col = self.crop_origin_input[0], self.crop_origin_input[1]
+        self.set_crop = tf.group(
+            self.crop.assign(self.crop_input),
+            self.crop_origin.assign(tf.to_float(self.crop_origin_input)),
+            self.frame[row:row + crop_height,
+                       col:col + crop_width].assign(self.crop_input))
+
+        # predicted positions padded by the magnified template's half
+        # diagonal, four deviations of the dynamics noise and the
+        # bilinear neighbours
+        noise = self.system_u[:, 0]
+        positions = self.sir_p[..., 0:2] + self.sir_p[..., 2:4]
+        half_diagonal = 0.5 * np.hypot(self.template_options['height'],
+                                       self.template_options['width'])
+        support = (tf.reduce_max(tf.abs(self.sir_p[..., 4])) +
+                   4 * noise[4]) * half_diagonal + 4 * noise[0:2] + 2
+        self.cloud_box = tf.concat(
+            [tf.reduce_min(positions, axis=[0, 1]) - support,
+             tf.reduce_max(positions, axis=[0, 1]) + support], axis=0)
+
+    def _build_redetect(self):
+        """ normalized cross-correlation of each run's template over a
+            search window of the frame by batched FFT, and the frame
+            positions and correlations of its best local maxima """
+        options = dict(REDETECT_DEFAULTS, **self.sir_options)
+        frame_shape = (self.video_options['height'],
+                       self.video_options['width'])
+        b_h = self.template_options['height']
+        b_w = self.template_options['width']
+        size, _ = search_window(np.zeros([1, 2]),
+                                options.get('redetect_window'),
+                                frame_shape, (b_h, b_w))
+        w_h, w_w = int(size[0]), int(size[1])
+        # a bucketed template is correlated at its own size
+        if self.bucketed:
+            t_h, t_w = self.template_size[0], self.template_size[1]
+        else:
+            t_h, t_w = b_h, b_w
+
+        # per-run windows centred on the fed centres, inside the frame
+        self.redetect_centers = tf.placeholder(
+            dtype=tf.float32, shape=[self.run_count, 2])
+        origins = tf.to_int32(tf.clip_by_value(
+            tf.round(self.redetect_centers - [w_h / 2, w_w / 2]), 0,
+            [frame_shape[0] - w_h, frame_shape[1] - w_w]))
+        rows = tf.expand_dims(origins[:, 0], 1) + tf.range(w_h)
+        cols = tf.expand_dims(origins[:, 1], 1) + tf.range(w_w)
+        windows = tf.gather_nd(self.frame, tf.stack(
+            [tf.tile(tf.expand_dims(rows, 2), [1, 1, w_w]),
+             tf.tile(tf.expand_dims(cols, 1), [1, w_h, 1])], axis=3))
+        windows -= tf.reduce_mean(windows, axis=[1, 2], keepdims=True)
+
+        mean_shifted, e_template = self._template_energy(
+            self.template, self._template_mask())
+        cross = tf.spectral.irfft2d(
+            tf.spectral.rfft2d(windows) * tf.conj(tf.spectral.rfft2d(
+                tf.pad(mean_shifted, [[0, 0], [0, w_h - b_h],
+                                      [0, w_w - b_w]]))),
+            fft_length=[w_h, w_w])
+        valid_h, valid_w = w_h - t_h + 1, w_w - t_w + 1
+        cross = cross[:, 0:valid_h, 0:valid_w]
+
+        def box_sums(images):
+            integral = tf.cumsum(tf.cumsum(
+                tf.pad(images, [[0, 0], [1, 0], [1, 0]]), axis=1), axis=2)
+            return (integral[:, t_h:, t_w:] - integral[:, :-t_h, t_w:] -
+                    integral[:, t_h:, :-t_w] + integral[:, :-t_h, :-t_w])
+
+        sums = box_sums(windows)
+        energy = tf.maximum(
+            box_sums(tf.square(windows)) -
+            tf.square(sums) / tf.to_float(t_h * t_w), 0)
+        ncc = cross / (tf.sqrt(
+            energy * tf.reshape(e_template, [-1, 1, 1])) + 1e-12)
+
+        # local maxima within radius, best first
+        extent = 2 * options['redetect_radius'] + 1
+        local_max = tf.nn.max_pool(
+            tf.expand_dims(ncc, -1), [1, extent, extent, 1],
+            [1, 1, 1, 1], 'SAME')[..., 0]
+        maxima = tf.where(tf.equal(ncc, local_max), ncc,
+                          tf.fill(tf.shape(ncc), -np.inf))
+        values, flat = tf.nn.top_k(
+            tf.reshape(maxima, [self.run_count, -1]),
+            k=min(options['redetect_peaks'],
+                  (w_h - b_h + 1) * (w_w - b_w + 1)))
+        self.redetect_values = values
+        self.redetect_peaks = tf.to_float(
+            tf.stack([flat // valid_w, flat % valid_w], axis=2) +
+            tf.expand_dims(origins, 1)) + \
+            tf.to_float(tf.stack([t_h - 1, t_w - 1])) / 2
+
+    def _build_precision_report(self):
+        """ per-run differences between score_precision and float32
+            scoring of the current particles against the loaded frame:
+            largest correlation difference, total variation distance of
+            the scores and distance of the score weighted positions """
+        mean_shifted_template, e_template = self._template_energy(
+            self.template, self._template_mask())
+        active_mask = self._active_mask(self.active_count)
+        scored = []
+        for dtype in (self._score_dtype(), tf.float32):
+            e_ss, e_template_ss = self._particle_energies(
+                self.sir_p, self.frame, mean_shifted_template, dtype=dtype)
+            corr = e_template_ss / tf.sqrt(e_template * e_ss)
+            score = self._score(corr, active_mask)
+            scored.append((corr, score, self._estimate(score, self.sir_p)))
+        (corr, score, estimate), (corr_32, score_32, estimate_32) = scored
+
+        corr_error = tf.abs(corr - corr_32)
+        if active_mask is not None:
+            corr_error = tf.where(
+                active_mask, corr_error, tf.zeros_like(corr_error))
+        self.precision_errors = {
+            'corr_error': tf.reduce_max(corr_error, axis=1),
+            'score_error': tf.reduce_sum(
+                tf.abs(score - score_32), axis=1) / 2,
+            'estimate_error': tf.norm(
+                estimate[:, 0:2] - estimate_32[:, 0:2], axis=1)}
+
+    def session(self):
+        """ new session on the graph with every variable initialized """
+        session = tf.Session(graph=self.graph)
+        self._initialize(session)
+        return session
+
+    def _initialize(self, session):
+        """ initialize every variable, feeding the seeds and template size
+            a graph shared by other options was built without """
+        session.run(self.init_op)
+        if self.stateless:
+            session.run(self.set_seeds,
+                        feed_dict={self.seeds_input: self.seeds})
+        if self.bucketed and 'template_size' in self.sir_options:
+            self.set_template_size(
+                session, *self.sir_options['template_size'])
+
+    def reset(self, session, sir_options):
+        """ reinitialize every variable of the graph in an open session,
+            reseed its stateless draws with the seeds of sir_options and
+            take its template_size, as a freshly built graph for
+            sir_options would start """
+        if not self.stateless:
+            raise ValueError('reseeding an open session needs graph_pool')
+        seeds = list(sir_options.get('seeds') or
+                     [sir_options['seed']])
+        if len(seeds) != self.run_count:
+            raise ValueError(
+                f"expected {self.run_count} seeds, got {len(seeds)}")
+        self.sir_options = sir_options
+        self.seeds = seeds
+        self._cropped = False
+        self._initialize(session)
+
+    def load_frame(self, session, frame):
+        session.run(self.set_frame, feed_dict={self.frame_input: frame})
+        self._cropped = False
+
+    def load_frame_crop(self, session, frame):
+        """ upload only the roi_crop window of frame around the particle
+            cloud, the whole frame when the cloud outgrows the window """
+        box = session.run(self.cloud_box)
+        low, high = np.floor(box[0:2]), np.ceil(box[2:4])
+        size = np.array(self.crop.shape.as_list())
+        if np.any(high - low + 1 > size):
+            self.load_frame(session, frame)
+            return
+
+        # centered on the cloud, kept inside the frame so the window
+        # borders clamp like the frame borders
+        origin = np.clip(np.round((low + high - size) / 2), 0,
+                         np.array(frame.shape) - size).astype(np.int32)
+        session.run(self.set_crop, feed_dict={
+            self.crop_input: frame[origin[0]:origin[0] + size[0],
+                                   origin[1]:origin[1] + size[1]],
+            self.crop_origin_input: origin})
+        self._cropped = True
+
+    def read_template(self, session):
+        """ [runs, height, width] templates, without bucket padding """
+        if not self.bucketed:
+            return session.run(self.template)
+        template, size = session.run([self.template, self.template_size])
+        return template[:, 0:size[0], 0:size[1]]
+
+    def set_template_size(self, session, height, width):
+        """ size of the template within its bucket """
+        session.run(self.set_size,
+                    feed_dict={self.template_size_input: [height, width]})
+
+    def filter_step(self, session):
+        """ advance one frame with the fused step, returns a dictionary
+            with the [runs, 6] estimate, [runs] neff and [runs] active
+            particle count """
+        if self._cropped:
+            return session.run(self.fused_crop_step)
+        return session.run(self.fused_step)
+
+    def filter_frames(self, session, frames, frame_numbers, gt_centers):
+        """ advance over a stack of frames in one call, returns a
+            dictionary of per-frame estimate, error, neff, active and
+            template_updated arrays, all but template_updated have a
+            run dimension after the frame dimension """
+        return session.run(
+            self.multi_step,
+            feed_dict={self.frames_input: frames,
+                       self.frame_numbers_input: frame_numbers,
+                       self.gt_input: gt_centers})
+
+    def seed_particles(self, session, seed_x):
+        """ seed every run with the same [particles, 6] state and uniform
+            weights over every particle """
+        session.run(self.seed_p, feed_dict={self.p_seed: np.broadcast_to(
+            seed_x, self.sir_p.shape.as_list())})
+        session.run(self.reset_w)
+
+    def best_correlation(self, session):
+        """ [runs] best correlation among the active particles of the
+            stored energy history """
+        return session.run(self.best_corr)
+
+    def precision_report(self, session):
+        """ dictionary of [runs] corr_error, score_error and
+            estimate_error of score_precision scoring against float32
+            for the current particles and loaded frame """
+        return session.run(self.precision_errors)
+
+    def redetect(self, session, centers, runs):
+        """ reseed the particles of runs at the best correlation peaks of
+            their template in the loaded frame, searched in a
+            redetect_window around the [runs, 2] centers or the whole
+            frame, returns the [runs, peaks, 2] peaks """
+        peaks, values, sir_p, sir_w, active = session.run(
+            [self.redetect_peaks, self.redetect_values, self.sir_p,
+             self.sir_w, self.active_count],
+            feed_dict={self.redetect_centers: centers})
+        sir_p, sir_w = reseeded(sir_p, sir_w, active, peaks, values, runs)
+        session.run([self.seed_p, self.seed_w],
+                    feed_dict={self.p_seed: sir_p, self.w_seed: sir_w})
+        return peaks
 
     def set_template_roi(self, session, row, col, mag, rot):
-        est_feed = {self.roi_x: [row, col, mag, rot]}
+        """ template of every run from a region of interest, values are
+            scalars shared by the runs or per-run arrays """
+        roi = np.stack(np.broadcast_arrays(row, col, mag, rot), axis=-1)
+        est_feed = {self.roi_x: np.broadcast_to(roi, [self.run_count, 4])}
         session.run(self.set_roi_to_template, feed_dict=est_feed)
 
     def maintain_template(self, session, do_update):
@@ -462,26 +1577,78 @@ class SIRGraph:
 
         if 'ESTIMATE' in self.sir_options['update_method']:
             est = session.run(self.estimate)
-            self.set_template_roi(session, est[0], est[1], est[4], est[5])
+            self.set_template_roi(
+                session, est[:, 0], est[:, 1], est[:, 4], est[:, 5])
         else:
             session.run(self.update_from_best)
 
     def store_energies(self, session):
-        session.run(self.store_e0_template_ss)
-        session.run(self.store_e0_template)
-        session.run(self.store_e0_ss)
+        session.run(self._store_energies)
 
     def shift_energies(self, session):
-        if self.sir_options['score_type'] == 'NCC':
-            pass
-        elif self.sir_options['score_type'] == 'ASV':
-            session.run(self.shift_e1_template_ss)
-            session.run(self.shift_e1_template)
-            session.run(self.shift_e1_ss)
-        if self.sir_options['score_type'] == 'ASVHO':
-            session.run(self.shift_e1_template_ss)
-            session.run(self.shift_e1_template)
-            session.run(self.shift_e1_ss)
-            session.run(self.shift_e2_template_ss)
-            session.run(self.shift_e2_template)
-            session.run(self.shift_e2_ss)
+        session.run(self._shift_energies)
+
+    def resample_energies(self, session):
+        session.run(self._resample_energies)
+
+
+def _compare_xla(frame_count, particle_count, run_count, score_type):
+    """ track a synthetic target with and without the xla option, returns
+        the largest estimate difference in pixels and the mean seconds per
+        frame of each, the first (compiling) frame untimed """
+    rows, cols = np.mgrid[0:240, 0:320]
+    texture = 60 * np.sin(cols / 9.) * np.cos(rows / 13.)
+
+    def synthetic_frame(k):
+        row, col = 100 + k, 120 + 1.5 * k
+        target = 150 * np.exp(-((rows - row)**2 / 90. + (cols - col)**2 / 40.))
+        return np.clip(100 + texture + target, 0, 255).astype(np.float32)
+
+    estimates = {}
+    seconds = {}
+    for xla in (False, True):
+        sir_graph = SIRGraph(
+            {'seeds': list(range(run_count)), 'particle_count': particle_count,
+             'score_type': score_type, 'filter_mode': 'RESAMPLE',
+             'update_interval': 10, 'update_method': 'SCORE',
+             'historical_length': 10, 'xla': xla},
+            {'height': 240, 'width': 320}, {'height': 31, 'width': 25})
+        with sir_graph.session() as session:
+            sir_graph.load_frame(session, synthetic_frame(0))
+            sir_graph.set_template_roi(session, 100, 120, 1, 0)
+            sir_graph.seed_particles(session, [100, 120, 0, 0, 1, 0])
+            estimates[xla] = []
+            seconds[xla] = 0
+            for k in range(frame_count):
+                sir_graph.load_frame(session, synthetic_frame(k))
+                sir_graph.maintain_template(session, k % 10 == 0)
+                start = time.perf_counter()
+                estimates[xla].append(
+                    sir_graph.filter_step(session)['estimate'])
+                if k:
+                    seconds[xla] += time.perf_counter() - start
+            seconds[xla] /= max(frame_count - 1, 1)
+
+    difference = np.abs(np.array(estimates[True])[..., 0:2] -
+                        np.array(estimates[False])[..., 0:2]).max()
+    return float(difference), seconds[False], seconds[True]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    PARSER = argparse.ArgumentParser(
+        description='compare the xla compiled filter step with the '
+                    'unfused graph on a synthetic sequence')
+    PARSER.add_argument('--frames', type=int, default=50)
+    PARSER.add_argument('--particles', type=int, default=300)
+    PARSER.add_argument('--runs', type=int, default=2)
+    PARSER.add_argument('--score-type', default='NCC',
+                        choices=sorted(SCORE_ORDERS))
+    ARGS = PARSER.parse_args()
+
+    DIFFERENCE, UNFUSED, COMPILED = _compare_xla(
+        ARGS.frames, ARGS.particles, ARGS.runs, ARGS.score_type)
+    print('largest estimate difference {:.4f} px'.format(DIFFERENCE))
+    print('per frame: graph {:.2f} ms, xla {:.2f} ms, speedup {:.2f}x'.format(
+        UNFUSED * 1e3, COMPILED * 1e3, UNFUSED / COMPILED))
@@ -0,0 +1,706 @@
+""" sir particle filter tracking job and batch expansion, free of the gui
+    so jobs also run headless in worker processes """
+from contextlib import contextmanager
+from os import path, makedirs, environ
+import json
+import gc
+import numpy as np
+from mcvideo import MCVideo
+from frame_prefetch import FramePrefetcher
+from sequence_store import store_path_for
+from sequence_cache import get_cache
+from graph_pool import get_pool, stateless_draws
+from sequence_catalog import get_catalog
+from sir_energy import (
+    KLD_DEFAULTS, PRECISION_REPORT_INTERVAL, PYRAMID_DEFAULTS,
+    REDETECT_DEFAULTS, SCORE_ORDERS, TEMPLATE_BUCKETS)
+
+environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+# results of energy histories deeper than one frame, from the rolling
+# history shift on
+HISTORY_VERSION = 'v2'
+
+
+class JobSignal(object):
+    """ callbacks run in the emitting thread, the connect, disconnect and
+        emit of a qt signal without qt """
+
+    def __init__(self):
+        self._slots = []
+
+    def connect(self, slot):
+        self._slots.append(slot)
+
+    def disconnect(self, slot):
+        self._slots.remove(slot)
+
+    def emit(self, *args):
+        for slot in list(self._slots):
+            slot(*args)
+
+
+class JobSignals(object):
+    """ the signals a job emits, see SIRTrackerSignals """
+
+    def __init__(self):
+        self.status_changed = JobSignal()
+        self.frame_changed = JobSignal()
+        self.template_changed = JobSignal()
+        self.finished = JobSignal()
+
+
+# batch options copied into every job when given: a score history depth
+# other than the score type's, resampler choices, the adaptive particle
+# count bounds, the scoring chunk size, the frame window, the coarse-to-fine
+# scoring, the re-detection of lost tracks, the scoring precision with its
+# report interval, the template sampler, xla compilation, graph pooling,
+# template size buckets, the on-disk graph cache, the frames tracked per
+# filter call, the fused step, the prefetch depth and memory mapped reads
+BATCH_OPTIONS = (
+    'score_order', 'resampler', 'resample_threshold', 'adaptive_particles',
+    'score_chunk', 'score_memory_mb', 'roi_crop', 'roi_crop_size',
+    'pyramid', 'pyramid_threshold', 'redetect_neff', 'redetect_corr',
+    'redetect_window', 'score_precision', 'precision_report_interval',
+    'sampler', 'xla', 'graph_pool', 'template_buckets', 'graph_cache',
+    'frames_per_call', 'fused_step', 'prefetch_depth', 'use_mmap') + \
+    tuple(KLD_DEFAULTS) + tuple(PYRAMID_DEFAULTS) + tuple(REDETECT_DEFAULTS)
+
+
+def expand_jobs(batch_options):
+    """ job options of every configuration, sequence and group of runs
+        of a batch, numbered by job_id """
+    # jobs on the same sequence share decoded frames
+    cache_frames = batch_options.get('cache_frames', True)
+
+    # filter engine, 'tensorflow' or the cpu-only 'numpy'
+    backend = batch_options.get('backend', 'tensorflow')
+
+    # runs of a configuration tracked together in one batched graph
+    number_runs = batch_options['number_runs']
+    runs_per_job = batch_options.get('runs_per_job', 1)
+
+    jobs = [
+        {
+            'name': sequence['name'],
+            'start_frame': sequence['start_frame'],
+            'end_frame': sequence['end_frame'],
+            'particle_count': particle_count,
+            'score_type': score_type,
+            'filter_mode': filter_mode,
+            'update_interval': update_interval,
+            'update_method': update_method,
+            'historical_length': historical_length,
+            'run': run,
+            'runs': list(range(run, min(run + runs_per_job, number_runs))),
+            'root_path': batch_options['root_path'],
+            'save_path': batch_options['save_path'],
+            'cache_frames': cache_frames,
+            'backend': backend,
+            'svd_mode': batch_options.get('svd_mode', 'full'),
+            'svd_rank': batch_options.get('svd_rank', 1),
+        }
+        for sequence in batch_options['sequences']
+        for particle_count in batch_options['particle_counts']
+        for score_type in batch_options['score_types']
+        for filter_mode in batch_options['filter_modes']
+        for update_interval in batch_options['update_intervals']
+        for update_method in batch_options['update_methods']
+        for historical_length in batch_options['historical_lengths']
+        for run in range(0, number_runs, runs_per_job)
+    ]
+
+    for index, job_options in enumerate(jobs):
+        for option in BATCH_OPTIONS:
+            if option in batch_options:
+                job_options[option] = batch_options[option]
+        job_options['job_id'] = index
+        job_options['seed'] = job_options['run']
+        job_options['seeds'] = list(job_options['runs'])
+    return jobs
+
+
+def redetecting(job_options):
+    """ whether a job re-detects lost tracks """
+    return job_options.get('redetect_neff') is not None or \
+        job_options.get('redetect_corr') is not None
+
+
+def result_path(job_options):
+    """ directory of the results_<run>.json files of a job, whose
+        end_frame is already resolved against the sequence length """
+    score_dir = job_options['score_type']
+    if 'score_order' in job_options:
+        score_dir += '_k' + str(job_options['score_order'])
+    # the rolling energy history changed the scores of orders above one,
+    # kept apart from results of the earlier shift
+    if job_options.get('score_order',
+                       SCORE_ORDERS[job_options['score_type']]) > 1:
+        score_dir += '_' + HISTORY_VERSION
+    if job_options.get('pyramid', False):
+        pyramid = dict(PYRAMID_DEFAULTS, **job_options)
+        score_dir += '_pyr' + str(pyramid['pyramid_factor'])
+        if pyramid.get('pyramid_threshold') is not None:
+            score_dir += '_t' + str(pyramid['pyramid_threshold'])
+        else:
+            score_dir += '_' + str(pyramid['pyramid_keep'])
+    if job_options.get('score_precision', 'float32') != 'float32':
+        score_dir += '_' + job_options['score_precision']
+    filter_dir = job_options['filter_mode']
+    if job_options.get('resampler', 'multinomial') != 'multinomial':
+        filter_dir += '_' + job_options['resampler']
+    if job_options.get('resample_threshold'):
+        filter_dir += '_t' + str(job_options['resample_threshold'])
+    if redetecting(job_options):
+        filter_dir += '_rd'
+    particle_dir = 'pc_' + str(job_options['particle_count'])
+    if job_options.get('adaptive_particles', False):
+        particle_dir += '_kld'
+    return path.join(
+        job_options['save_path'],
+        job_options['name'],
+        (str(job_options['start_frame']) +
+            '_' + str(job_options['end_frame'])),
+        particle_dir,
+        score_dir,
+        filter_dir,
+        'ui_' + str(job_options['update_interval']),
+        job_options['update_method'],
+        'hl_' + str(job_options['historical_length'])
+    )
+
+
+def configure_process(batch_options):
+    """ size the process-wide frame cache and graph pool for a batch """
+    if 'cache_budget_mb' in batch_options:
+        get_cache().set_budget(batch_options['cache_budget_mb'] * 2**20)
+
+    # jobs with the same shapes and options reuse built graphs
+    if 'graph_pool_size' in batch_options:
+        get_pool().set_size(batch_options['graph_pool_size'])
+
+
+class SIRJob(object):
+    """ a tracking job, the runs of one filter configuration on one
+        sequence """
+
+    def __init__(
+            self,
+            job_options):
+        super(SIRJob, self).__init__()
+        self.job_options = job_options
+        self.paused = False
+        self._graph = None
+        # session of a graph lent by the graph pool, None otherwise
+        self._session = None
+        self._video = None
+        self._frames = None
+        self._cache_key = None
+        self._result_files = None
+        self.signals = JobSignals()
+        self.template_width = None
+        self.template_height = None
+        # runs tracked together, each with its own seed and results
+        self.runs = job_options.get('runs') or [job_options['run']]
+        self.seeds = job_options.get('seeds') or [job_options['seed']]
+
+    def init_results(self):
+        """ initialize memory and file save path for results of every
+            run """
+        result_dir = result_path(self.job_options)
+
+        # concurrent jobs of a configuration create the same directory
+        makedirs(result_dir, exist_ok=True)
+
+        self._result_files = [
+            path.join(result_dir, 'results_' + str(run) + '.json')
+            for run in self.runs]
+
+        self.results = []
+        for run, seed in zip(self.runs, self.seeds):
+            run_options = {k: v for k, v in self.job_options.items()
+                           if k not in ('runs', 'seeds')}
+            run_options['run'] = run
+            run_options['seed'] = seed
+            self.results.append({
+                'job_options': run_options,
+                'frame_number': [],
+                'estimate': [],
+                'error': [],
+                'neff': [],
+                'template_updated': []
+            })
+            if run_options.get('adaptive_particles', False):
+                self.results[-1]['active'] = []
+            if run_options.get('pyramid', False):
+                self.results[-1]['pyramid_error'] = []
+            if self._redetecting():
+                self.results[-1]['redetected'] = []
+            if self._precision_interval() is not None:
+                self.results[-1]['precision_report'] = []
+
+    def do_pause(self):
+        """ pause/unpause thread """
+        if not self.paused:
+            self.paused = True
+            self.signals.status_changed.emit(
+                self.job_options['job_id'], 'Paused')
+        else:
+            self.paused = False
+            self.signals.status_changed.emit(
+                self.job_options['job_id'], 'Running')
+
+    def run(self):
+        """ main execution method for tracker """
+
+        self.signals.status_changed.emit(
+            self.job_options['job_id'], 'Loading sequence')
+        self.load_sequence()
+        try:
+            if not self._track():
+                return
+        finally:
+            self.close_sources()
+
+        self.signals.status_changed.emit(
+            self.job_options['job_id'], 'Complete')
+        self.signals.finished.emit(self.job_options['job_id'])
+
+    def _track(self):
+        """ track the loaded sequence, False when the job was skipped """
+        if self.job_options['save_path'] is not None:
+            self.init_results()
+            self.signals.frame_changed.connect(self.on_frame_change)
+            self.signals.finished.connect(self.on_finished)
+
+        # skip if results for every run of the job exist
+        if self._result_files is not None and \
+                all(path.exists(f) for f in self._result_files):
+            # prevent overwriting existing results
+            self.signals.finished.disconnect(self.on_finished)
+            self.signals.status_changed.emit(
+                self.job_options['job_id'],
+                'Skipped')
+            self.signals.finished.emit(self.job_options['job_id'])
+            return False
+
+        # start decoding frames while the graph is generated
+        self.load_frame_source()
+
+        self.signals.status_changed.emit(
+            self.job_options['job_id'], 'Generating Graph')
+        self.load_graph()
+
+        self.signals.status_changed.emit(
+            self.job_options['job_id'], 'Running')
+
+        with self.job_session() as sess:
+
+            # seed particles
+            self.seed_particles(sess)
+
+            # main tracker loop
+            frames_per_call = self.job_options.get('frames_per_call', 1)
+            if frames_per_call > 1:
+                self.track_frame_stacks(sess, frames_per_call)
+            else:
+                self.track_frames(sess)
+
+            # create tensorboard graphs
+            # writer = tf.summary.FileWriter('./graphs', sess.graph)
+
+        if isinstance(self._frames, FramePrefetcher) and \
+                self._result_files is not None:
+            for results in self.results:
+                results['prefetch'] = self._frames.stats()
+        return True
+
+    def close_sources(self):
+        """ stop the prefetcher, release the cached frames and close the
+            video and graph of a job, whether or not it completed """
+        if isinstance(self._frames, FramePrefetcher):
+            self._frames.close()
+        self._frames = None
+        if self._cache_key is not None:
+            get_cache().release(self._cache_key)
+            self._cache_key = None
+        if self._video is not None:
+            self._video.close()
+        self._graph = None
+        self._video = None
+        # force garbage collect to remove unused tensorflow graphs
+        gc.collect()
+
+    @contextmanager
+    def job_session(self):
+        """ the session of a pooled graph, returned to the pool when the
+            job ends, or a new session closed with the job """
+        if self._session is None:
+            with self._graph.session() as session:
+                yield session
+            return
+        try:
+            yield self._session
+        finally:
+            get_pool().release(self._graph, self._session)
+            self._session = None
+
+    def seed_particles(self, session):
+        """ seed particles and template of every run at the ground-truth
+            of the start frame """
+        gtc = self._video.get_gt_center(self.job_options['start_frame'])
+        seed_x = np.tile(
+            np.array([gtc[0], gtc[1], 0., 0., 1., 0.]),
+            [self.job_options['particle_count'], 1])
+        self._graph.seed_particles(session, seed_x)
+        self._graph.set_template_roi(session, gtc[0], gtc[1], 1, 0)
+
+    def track_frames(self, sess):
+        """ track one frame per filter call """
+        if self.job_options['filter_mode'] == 'AUX':
+            filter_fn = self.fn_filter_aux
+        elif self.job_options['filter_mode'] == 'RESAMPLE':
+            filter_fn = self.fn_filter_resample
+        else:
+            filter_fn = self.fn_filter_none
+
+        for frame_num in range(
+                self.job_options['start_frame'],
+                self.job_options['end_frame']):
+            while self.paused:
+                pass
+
+            gtc = self._video.get_gt_center(frame_num)
+
+            frame_details = {}
+            frame_details['frame_number'] = frame_num
+
+            pix_frame = self._frames.get_pix_frame(frame_num)
+            if self.job_options.get('roi_crop', False):
+                self._graph.load_frame_crop(sess, pix_frame)
+            else:
+                self._graph.load_frame(sess, pix_frame)
+            frame_details['frame'] = pix_frame
+
+            do_update = \
+                self.job_options['update_interval'] > 0 and \
+                frame_num % self.job_options['update_interval'] == 0
+            frame_details['template_updated'] = do_update
+
+            self._graph.maintain_template(sess, do_update)
+            if do_update or frame_num == 0:
+                extracted_template = self._graph.read_template(sess)[0]
+                self.template_height = extracted_template.shape[0]
+                self.template_width = extracted_template.shape[1]
+                self.signals.template_changed.emit(extracted_template)
+
+            # the op by op filters only exist on the tensorflow backend,
+            # score every particle at full resolution, are not compiled and
+            # draw statefully
+            if self.job_options.get('fused_step', True) or \
+                    self.job_options.get('backend') == 'numpy' or \
+                    self.job_options.get('adaptive_particles', False) or \
+                    self.job_options.get('pyramid', False) or \
+                    self.job_options.get('xla', False) or \
+                    stateless_draws(self.job_options):
+                step = self._graph.filter_step(sess)
+                np_estimate = step['estimate']
+                np_neff = step['neff']
+                frame_details['active'] = step['active']
+                if 'pyramid_error' in step:
+                    frame_details['pyramid_error'] = step['pyramid_error']
+            else:
+                filter_fn(sess)
+                np_estimate = sess.run(self._graph.estimate)
+                np_neff = sess.run(self._graph.neff)
+            frame_details['estimate'] = np_estimate
+            frame_details['error'] = \
+                np_estimate[:, 0:2] - [gtc[0], gtc[1]]
+            frame_details['neff'] = np_neff
+            frame_details['gt'] = self._video.get_gt(frame_num)
+
+            # reseed lost runs for the next frame
+            lost = self._lost_runs(sess, np_neff)
+            if lost.size:
+                if self.job_options.get('roi_crop', False):
+                    self._graph.load_frame(sess, pix_frame)
+                self._graph.redetect(sess, np_estimate[:, 0:2], lost)
+            frame_details['redetected'] = lost
+
+            # reduced precision scoring against float32 every so often
+            if self._precision_due(frame_num):
+                frame_details['precision_report'] = \
+                    self._graph.precision_report(sess)
+
+            self.signals.frame_changed.emit(frame_details)
+
+    def _precision_interval(self):
+        """ frames between precision reports of the per-frame loop, None
+            without reduced precision scoring """
+        if self.job_options.get('score_precision', 'float32') == 'float32':
+            return None
+        return self.job_options.get(
+            'precision_report_interval', PRECISION_REPORT_INTERVAL)
+
+    def _precision_due(self, frame_num):
+        """ whether to report reduced precision accuracy at frame_num, the
+            start frame always and every interval frames after, an
+            interval of 0 reports the start frame only """
+        interval = self._precision_interval()
+        if interval is None:
+            return False
+        return frame_num == self.job_options['start_frame'] or \
+            (interval > 0 and frame_num % interval == 0)
+
+    def _redetecting(self):
+        return redetecting(self.job_options)
+
+    def _lost_runs(self, sess, neff):
+        """ indices of the runs whose neff or best particle correlation
+            fell below redetect_neff or redetect_corr """
+        lost = np.zeros(len(self.runs), dtype=bool)
+        if self.job_options.get('redetect_neff') is not None:
+            lost |= np.asarray(neff) < self.job_options['redetect_neff']
+        if self.job_options.get('redetect_corr') is not None:
+            lost |= self._graph.best_correlation(sess) < \
+                self.job_options['redetect_corr']
+        return np.flatnonzero(lost)
+
+    def track_frame_stacks(self, sess, frames_per_call):
+        """ track a stack of frames per call with the on-device loop """
+        for stack_start in range(
+                self.job_options['start_frame'],
+                self.job_options['end_frame'],
+                frames_per_call):
+            while self.paused:
+                pass
+
+            frame_numbers = np.arange(
+                stack_start,
+                min(stack_start + frames_per_call,
+                    self.job_options['end_frame']))
+            pix_frames = [self._frames.get_pix_frame(f)
+                          for f in frame_numbers]
+            gt_centers = np.array(
+                [self._video.get_gt_center(f) for f in frame_numbers])
+
+            stack = self._graph.filter_frames(
+                sess, np.stack(pix_frames), frame_numbers, gt_centers)
+
+            if np.any(stack['template_updated']) or 0 in frame_numbers:
+                extracted_template = self._graph.read_template(sess)[0]
+                self.template_height = extracted_template.shape[0]
+                self.template_width = extracted_template.shape[1]
+                self.signals.template_changed.emit(extracted_template)
+
+            for idx, frame_num in enumerate(frame_numbers):
+                frame_details = {
+                    'frame_number': int(frame_num),
+                    'frame': pix_frames[idx],
+                    'template_updated': bool(stack['template_updated'][idx]),
+                    'estimate': stack['estimate'][idx],
+                    'error': stack['error'][idx],
+                    'neff': stack['neff'][idx],
+                    'active': stack['active'][idx],
+                    'gt': self._video.get_gt(frame_num)
+                }
+                if 'pyramid_error' in stack:
+                    frame_details['pyramid_error'] = \
+                        stack['pyramid_error'][idx]
+                self.signals.frame_changed.emit(frame_details)
+
+    def load_sequence(self):
+        """ load video sequence and ground truth source """
+
+        seq_name = self.job_options['name']
+        root_path = self.job_options['root_path']
+
+        seq_path = path.join(root_path, seq_name)
+        pix_path = path.join(seq_path, 'frames_' + seq_name + '.bin')
+        mod_path = path.join(seq_path, 'amfm_' + seq_name + '.bin')
+        gt_path = path.join(seq_path, 'video_params_' + seq_name + '.mat')
+        store_path = store_path_for(seq_path, seq_name)
+        if not path.exists(store_path):
+            store_path = None
+        self._video = MCVideo(
+            pix_path, mod_path, gt_path,
+            use_mmap=self.job_options.get('use_mmap', True),
+            store_path=store_path,
+            metadata=get_catalog(root_path).get(seq_name))
+
+        # generate actual end frame and replace if necessary
+        end_frame = self.job_options['end_frame']
+        if end_frame < 0 or end_frame > self._video.length:
+            self.job_options['end_frame'] = self._video.length-1
+
+    def load_frame_source(self):
+        """ serve frames from the shared sequence cache, or wrap the video
+            in a background prefetcher, as requested """
+        if self.job_options.get('cache_frames', False):
+            self._cache_key = path.join(
+                self.job_options['root_path'], self.job_options['name'])
+            self._video.attach_frames(
+                get_cache().acquire(self._cache_key, self._video))
+            self._frames = self._video
+            return
+
+        prefetch_depth = self.job_options.get('prefetch_depth', 4)
+        if prefetch_depth > 0:
+            self._frames = FramePrefetcher(
+                self._video,
+                self.job_options['start_frame'],
+                self.job_options['end_frame'],
+                prefetch_depth)
+        else:
+            self._frames = self._video
+
+    def load_graph(self):
+        """ build the filter engine for the job's backend, 'tensorflow'
+            (default) or 'numpy' """
+        # pylint: disable=C0415
+        if self.job_options.get('backend', 'tensorflow') == 'numpy':
+            from sir_numpy import NumpySIRGraph as SIRGraph
+        else:
+            from sir_graph import SIRGraph
+
+        sir_options = {s: self.job_options[s] for s in
+                       ('particle_count', 'score_type', 'filter_mode',
+                        'update_interval', 'update_method',
+                        'historical_length', 'seed')}
+        sir_options['seeds'] = self.seeds
+        if 'score_order' in self.job_options:
+            sir_options['score_order'] = self.job_options['score_order']
+        sir_options['resampler'] = \
+            self.job_options.get('resampler', 'multinomial')
+        sir_options['resample_threshold'] = \
+            self.job_options.get('resample_threshold')
+        sir_options['adaptive_particles'] = \
+            self.job_options.get('adaptive_particles', False)
+        # adaptive particle count bounds, the scoring chunk size, the
+        # frame window, the coarse-to-fine scoring, the re-detection, the
+        # scoring precision, the template sampler, xla compilation, the
+        # stateless draws of pooled graphs and the on-disk graph cache
+        for option in tuple(KLD_DEFAULTS) + tuple(PYRAMID_DEFAULTS) + \
+                tuple(REDETECT_DEFAULTS) + (
+                    'score_chunk', 'score_memory_mb', 'roi_crop',
+                    'roi_crop_size', 'pyramid', 'pyramid_threshold',
+                    'redetect_neff', 'redetect_corr', 'redetect_window',
+                    'score_precision', 'sampler', 'xla', 'graph_pool',
+                    'graph_cache'):
+            if option in self.job_options:
+                sir_options[option] = self.job_options[option]
+        sir_options['svd_mode'] = self.job_options.get('svd_mode', 'full')
+        sir_options['svd_rank'] = self.job_options.get('svd_rank', 1)
+        sir_options['frames_per_call'] = \
+            self.job_options.get('frames_per_call', 1)
+
+        video_options = {}
+        video_options['height'] = self._video.height
+        video_options['width'] = self._video.width
+
+        template_options = {}
+        # pylint: disable=E0633
+        template_options['width'], template_options['height'] = \
+            np.int32(
+                self._video.get_gt_tsize(
+                    self.job_options['start_frame']))
+
+        # pad the template up to a bucket size shared by other sequences
+        if self.job_options.get('template_buckets', False):
+            sir_options['template_buckets'] = \
+                self.job_options['template_buckets']
+            sir_options['template_size'] = [
+                int(template_options['height']),
+                int(template_options['width'])]
+            template_options = {
+                name: self._bucket(int(template_options[name]))
+                for name in ('height', 'width')}
+
+        # jobs with the same shapes and options share built graphs
+        if self.job_options.get('graph_pool', False):
+            self._graph, self._session = get_pool().acquire(
+                SIRGraph, sir_options, video_options, template_options)
+        else:
+            self._graph = SIRGraph(
+                sir_options, video_options, template_options)
+        return sir_options, video_options, template_options
+
+    def _bucket(self, side):
+        """ smallest template_buckets side that holds side, side itself
+            beyond the largest """
+        buckets = self.job_options['template_buckets']
+        if buckets is True:
+            buckets = TEMPLATE_BUCKETS
+        return min([b for b in buckets if b >= side] or [side])
+
+    def on_frame_change(self, frame_details):
+        """ save results of every run to memory """
+        for idx, results in enumerate(self.results):
+            results['frame_number'].append(frame_details['frame_number'])
+            results['estimate'].append(
+                frame_details['estimate'][idx].tolist())
+            results['error'].append(frame_details['error'][idx].tolist())
+            results['neff'].append(frame_details['neff'][idx].tolist())
+            if 'active' in results:
+                results['active'].append(
+                    int(frame_details['active'][idx]))
+            if 'pyramid_error' in results:
+                results['pyramid_error'].append(
+                    float(frame_details['pyramid_error'][idx]))
+            if 'redetected' in results and \
+                    idx in frame_details.get('redetected', ()):
+                results['redetected'].append(frame_details['frame_number'])
+            if 'precision_report' in frame_details and \
+                    'precision_report' in results:
+                report = {name: float(errors[idx]) for name, errors in
+                          frame_details['precision_report'].items()}
+                report['frame_number'] = frame_details['frame_number']
+                results['precision_report'].append(report)
+            results['template_updated'].append(
+                frame_details['template_updated'])
+
+    def on_finished(self, job_id=None):
+        """ save results, runs with existing results are not overwritten """
+        for result_file, results in zip(self._result_files, self.results):
+            if path.exists(result_file):
+                continue
+            with open(result_file, 'w') as f:
+                json.dump(results, f)
+
+    #  The filters, these are the SIR tracking algorithm routinesfunctions
+    #  that utilize the tensorflow graph
+    # to perform the
+
+    def fn_filter_none(self, session):
+        self._graph.shift_energies(session)
+        session.run(self._graph.predict_from_p)
+        self._graph.store_energies(session)
+        session.run(self._graph.store_score)
+        session.run(self._graph.update_w)
+
+    def fn_filter_resample(self, session):
+        session.run(self._graph.store_ridx)
+        session.run(self._graph.resample_p)
+        self._graph.resample_energies(session)
+        session.run(self._graph.reset_w)
+        session.run(self._graph.predict_from_p)
+        self._graph.store_energies(session)
+        session.run(self._graph.store_score)
+        session.run(self._graph.update_w)
+
+    def fn_filter_aux(self, session):
+        self._graph.shift_energies(session)
+        session.run(self._graph.store_aux_p)
+        session.run(self._graph.predict_from_p)
+        self._graph.store_energies(session)
+        session.run(self._graph.store_score)
+        session.run(self._graph.update_w)
+        session.run(self._graph.store_ridx)
+        session.run(self._graph.restore_p_from_aux)
+        session.run(self._graph.resample_p)
+        self._graph.resample_energies(session)
+        session.run(self._graph.reset_w)
+        session.run(self._graph.predict_from_p)
+        self._graph.store_energies(session)
+        session.run(self._graph.store_score)
+        session.run(self._graph.update_w)
@@ -0,0 +1,1034 @@
+""" numpy sir filter engine with the SIRGraph interface, for cpu-only
+    nodes where tensorflow import and session cost outweighs the work """
+import numpy as np
+from redetect import ncc_peaks, reseeded
+from sir_energy import (
+    ENERGY_NAMES, KLD_DEFAULTS, PRECISION_SCALE, PYRAMID_DEFAULTS,
+    REDETECT_DEFAULTS, SAMPLE_BYTES, SCORE_MEMORY_MB, SCORE_ORDERS,
+    SCORE_PRECISIONS, SVD_OVERSAMPLING)
+
+# floor on residual norms of the incremental SVD updates
+_EPSILON = 1e-12
+
+
+def interpolate_bilinear(grid, query_points):
+    """ bilinear interpolation of a [height, width] grid at [count, 2]
+        (row, column) query points, clamped at the borders the way
+        _interpolate_bilinear is, in the dtype of grid """
+    query_points = query_points.astype(np.float32)
+    floors = []
+    alphas = []
+    for dim in (0, 1):
+        queries = query_points[:, dim]
+        max_floor = np.float32(grid.shape[dim] - 2)
+        floor = np.minimum(np.maximum(np.float32(0), np.floor(queries)),
+                           max_floor)
+        floors.append(floor.astype(np.int32))
+        alphas.append(np.clip(queries - floor, 0, 1).astype(grid.dtype))
+
+    top_left = grid[floors[0], floors[1]]
+    top_right = grid[floors[0], floors[1] + 1]
+    bottom_left = grid[floors[0] + 1, floors[1]]
+    bottom_right = grid[floors[0] + 1, floors[1] + 1]
+
+    interp_top = alphas[1] * (top_right - top_left) + top_left
+    interp_bottom = alphas[1] * (bottom_right - bottom_left) + bottom_left
+    return alphas[0] * (interp_bottom - interp_top) + interp_top
+
+
+def warp_bilinear(grid, rows, cols, transform, translation):
+    """ bilinear interpolation of a [height, width] grid at the lattice of
+        rows and cols mapped by [count, 2, 2] transforms and [count, 2]
+        translations, returns [count, rows, cols] as SIRGraph._warp does,
+        separably for the transforms that do not rotate """
+    unrotated = (transform[:, 0, 1] == 0) & (transform[:, 1, 0] == 0)
+    if unrotated.all() or not unrotated.any():
+        return _warp_part(grid, rows, cols, transform, translation,
+                          unrotated.all())
+    interpolations = np.empty(
+        (transform.shape[0], rows.size, cols.size), dtype=grid.dtype)
+    for mask, separable in ((unrotated, True), (~unrotated, False)):
+        interpolations[mask] = _warp_part(
+            grid, rows, cols, transform[mask], translation[mask], separable)
+    return interpolations
+
+
+def _warp_part(grid, rows, cols, transform, translation, separable):
+    """ warp_bilinear of transforms that all rotate or, separable, none
+        of which do """
+    rows = rows.reshape(1, -1, 1)
+    cols = cols.reshape(1, 1, -1)
+    translation = translation[:, :, None, None]
+    transform = transform[..., None, None]
+    if separable:
+        row_queries = transform[:, 0, 0] * rows + translation[:, 0]
+        col_queries = transform[:, 1, 1] * cols + translation[:, 1]
+    else:
+        row_queries = transform[:, 0, 0] * rows + \
+            transform[:, 1, 0] * cols + translation[:, 0]
+        col_queries = transform[:, 0, 1] * rows + \
+            transform[:, 1, 1] * cols + translation[:, 1]
+
+    def corner(queries, size):
+        floor = np.clip(np.floor(queries), 0, size - 2).astype(np.float32)
+        alpha = np.clip(queries - floor, 0, 1).astype(grid.dtype)
+        return floor.astype(np.int32), alpha
+
+    row_floor, row_alpha = corner(row_queries, grid.shape[0])
+    col_floor, col_alpha = corner(col_queries, grid.shape[1])
+    flat_grid = grid.reshape(-1)
+    index = row_floor * grid.shape[1] + col_floor
+    top_left = flat_grid[index]
+    top_right = flat_grid[index + 1]
+    bottom_left = flat_grid[index + grid.shape[1]]
+    bottom_right = flat_grid[index + grid.shape[1] + 1]
+
+    interp_top = col_alpha * (top_right - top_left) + top_left
+    interp_bottom = col_alpha * (bottom_right - bottom_left) + bottom_left
+    return row_alpha * (interp_bottom - interp_top) + interp_top
+
+
+class NumpyTemplateHistory(object):
+    """ per-run ring buffer template history with the TemplateHistory
+        semantics, write_index is the slot the next push writes """
+
+    def __init__(self, runs, history_length, t_h, t_w, rank=1,
+                 incremental=False):
+        self.history_length = history_length
+        self.rank = min(rank, history_length)
+        self.incremental = incremental
+        self._factor_rank = min(rank + SVD_OVERSAMPLING, history_length)
+        self.template_history = np.zeros(
+            [runs, history_length, t_h, t_w], dtype=np.float32)
+        self.value_history = np.zeros(
+            [runs, history_length], dtype=np.float32)
+        self.write_index = 0
+        self.seeded = False
+        if incremental:
+            self.svd_u = np.zeros(
+                [runs, t_h * t_w, self._factor_rank], dtype=np.float32)
+            self.svd_s = np.zeros([runs, self._factor_rank],
+                                  dtype=np.float32)
+            self.svd_v = np.zeros(
+                [runs, history_length, self._factor_rank], dtype=np.float32)
+
+    def push(self, template, value):
+        """ write [runs, h, w] templates and [runs] values into the write
+            slot, the first push fills every slot """
+        if self.seeded:
+            if self.incremental:
+                self._replace_factors(template)
+            self.template_history[:, self.write_index] = template
+            self.value_history[:, self.write_index] = value
+            self.write_index = (self.write_index + 1) % self.history_length
+        else:
+            self.template_history[:] = template[:, None]
+            self.value_history[:] = value[:, None]
+            self.write_index = 1 % self.history_length
+            if self.incremental:
+                self._seed_factors(template)
+        self.seeded = True
+
+    def _seed_factors(self, template):
+        """ factors of a history of identical columns """
+        flat = template.reshape(template.shape[0], -1)
+        norm = np.linalg.norm(flat, axis=1, keepdims=True)
+        self.svd_u[:] = 0
+        self.svd_s[:] = 0
+        self.svd_v[:] = 0
+        self.svd_u[:, :, 0] = flat / np.maximum(norm, _EPSILON)
+        self.svd_s[:, 0:1] = norm * self.history_length ** 0.5
+        self.svd_v[:, :, 0] = self.history_length ** -0.5
+
+    def _replace_factors(self, template):
+        """ rank-one modification of the factors replacing the write
+            slot's template, see TemplateHistory._replaced_factors """
+        # pylint: disable=C0103
+        runs = template.shape[0]
+        a = (template - self.template_history[:, self.write_index]
+             ).reshape(runs, -1)
+        b = np.zeros([runs, self.history_length], dtype=np.float32)
+        b[:, self.write_index] = 1
+
+        def split(basis, vector):
+            coeffs = np.einsum('rdk,rd->rk', basis, vector)
+            residual = vector - np.einsum('rdk,rk->rd', basis, coeffs)
+            correction = np.einsum('rdk,rd->rk', basis, residual)
+            residual -= np.einsum('rdk,rk->rd', basis, correction)
+            norm = np.linalg.norm(residual, axis=1, keepdims=True)
+            return (coeffs + correction, norm,
+                    (residual / np.maximum(norm, _EPSILON))[:, :, None])
+
+        m, r_a, p = split(self.svd_u, a)
+        n, r_b, q = split(self.svd_v, b)
+
+        core = np.einsum(
+            'ri,rj->rij', np.concatenate([m, r_a], axis=1),
+            np.concatenate([n, r_b], axis=1))
+        diagonal = np.arange(self._factor_rank)
+        core[:, diagonal, diagonal] += self.svd_s
+        core_u, core_s, core_vh = np.linalg.svd(core)
+
+        rank = self._factor_rank
+        self.svd_u = np.einsum(
+            'rdi,rik->rdk', np.concatenate([self.svd_u, p], axis=2),
+            core_u[:, :, 0:rank]).astype(np.float32)
+        self.svd_s = core_s[:, 0:rank].astype(np.float32)
+        self.svd_v = np.einsum(
+            'rli,rki->rlk', np.concatenate([self.svd_v, q], axis=2),
+            core_vh[:, 0:rank]).astype(np.float32)
+
+    def _newest_first(self):
+        """ slots ordered from the newest push to the oldest """
+        return (self.write_index - 1 - np.arange(self.history_length)) % \
+            self.history_length
+
+    def best(self):
+        """ template of each run with the highest associated value, ties
+            go to the newest """
+        order = self._newest_first()
+        slots = order[np.argmax(self.value_history[:, order], axis=1)]
+        return self.template_history[np.arange(len(slots)), slots]
+
+    def svd(self):
+        """ rank-k SVD composite of each run's history, the newest
+            template's column of the rank-k approximation """
+        runs, _, t_h, t_w = self.template_history.shape
+        if self.incremental:
+            u, s, v = self.svd_u, self.svd_s, self.svd_v
+        else:
+            # templates in columns
+            spaghettified = self.template_history.reshape(
+                runs, self.history_length, -1).transpose(0, 2, 1)
+            u, s, vh = np.linalg.svd(  # pylint: disable=C0103
+                spaghettified, full_matrices=False)
+            v = vh.transpose(0, 2, 1)
+        newest = self._newest_first()[0]
+        composite = np.einsum(
+            'rdk,rk->rd', u[:, :, 0:self.rank],
+            s[:, 0:self.rank] * v[:, newest, 0:self.rank])
+        return composite.reshape(runs, t_h, t_w).astype(np.float32)
+
+
+class NumpySession(object):
+    """ stand-in for the tf.Session of a SIRGraph, running an op attribute
+        of a NumpySIRGraph calls it """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def close(self):
+        pass
+
+    def run(self, fetches, feed_dict=None):  # pylint: disable=W0613
+        if isinstance(fetches, (list, tuple)):
+            return [self.run(fetch) for fetch in fetches]
+        if isinstance(fetches, dict):
+            return {key: self.run(fetch) for key, fetch in fetches.items()}
+        return fetches()
+
+
+class NumpySIRGraph(object):
+    """ sir filter state and steps in vectorized numpy, interchangeable
+        with SIRGraph; session arguments are accepted and ignored """
+
+    def __init__(self, sir_options, video_options, template_options):
+        self.sir_options = sir_options
+        self.video_options = video_options
+        self.template_options = template_options
+        self.seeds = list(
+            sir_options.get('seeds') or [sir_options['seed']])
+        self.run_count = len(self.seeds)
+        self.adaptive = sir_options.get('adaptive_particles', False)
+        self.pyramid = sir_options.get('pyramid', False)
+        self.bucketed = bool(sir_options.get('template_buckets', False))
+        self.graph = None
+        # fail on an unsupported score_precision before any frame
+        self._score_dtype()
+        # op attribute of SIRGraph, run through session.run
+        self.store_score = self._store_score
+        self.build_graph()
+
+    def build_graph(self):
+        """ allocate filter state """
+        run_count = self.run_count
+        particle_count = self.sir_options['particle_count']
+        score_order = self.sir_options.get(
+            'score_order', SCORE_ORDERS[self.sir_options['score_type']])
+        t_h = self.template_options['height']
+        t_w = self.template_options['width']
+
+        self._rngs = [np.random.RandomState(seed) for seed in self.seeds]
+
+        self.frame = np.zeros(
+            [self.video_options['height'], self.video_options['width']],
+            dtype=np.float32)
+        self.template = np.zeros([run_count, t_h, t_w], dtype=np.float32)
+
+        self._build_lattice(self.sir_options.get('template_size'))
+
+        # system dynamics
+        self.system_a = np.array(
+            [[1, 0, 1, 0, 0, 0],
+             [0, 1, 0, 1, 0, 0],
+             [0, 0, 1, 0, 0, 0],
+             [0, 0, 0, 1, 0, 0],
+             [0, 0, 0, 0, 1, 0],
+             [0, 0, 0, 0, 0, 1]], dtype=np.float32)
+        self.system_u = np.array(
+            [0, 0, 2, 2, 0.05, 0.02], dtype=np.float32)
+
+        self.sir_p = np.zeros([run_count, particle_count, 6],
+                              dtype=np.float32)
+        self.p_aux = np.zeros_like(self.sir_p)
+        self.sir_w = np.ones([run_count, particle_count], dtype=np.float32)
+        self.active_count = np.full([run_count], particle_count,
+                                    dtype=np.int32)
+        self.score_out = np.ones_like(self.sir_w)
+
+        # energy history stacked over the last dimension, order 0 holds
+        # the current frame
+        self.energy_history = {
+            name: np.ones(
+                [run_count, 1 if name == 'template' else particle_count,
+                 score_order], dtype=np.float32)
+            for name in ENERGY_NAMES}
+
+        if 'ESTIMATE' not in self.sir_options['update_method']:
+            self.template_history = NumpyTemplateHistory(
+                run_count, self.sir_options['historical_length'], t_h, t_w,
+                rank=self.sir_options.get('svd_rank', 1),
+                incremental=self.sir_options.get(
+                    'svd_mode', 'full') == 'incremental')
+
+    def _build_lattice(self, template_size=None):
+        """ template grid, its pyramid level and, with template_buckets,
+            the template's own lattice continued over its bucket """
+        t_h = self.template_options['height']
+        t_w = self.template_options['width']
+        if self.bucketed:
+            self.template_size = np.array(
+                template_size or [t_h, t_w], dtype=np.int32)
+            size_h, size_w = self.template_size.astype(np.float64)
+            rspace = (-size_h/2.0 + np.arange(t_h) * size_h/(size_h - 1)
+                      ).astype(np.float32)
+            cspace = (-size_w/2.0 + np.arange(t_w) * size_w/(size_w - 1)
+                      ).astype(np.float32)
+        else:
+            rspace = np.linspace(-t_h/2.0, t_h/2.0, t_h, dtype=np.float32)
+            cspace = np.linspace(-t_w/2.0, t_w/2.0, t_w, dtype=np.float32)
+        self.tgrid = np.stack(
+            np.meshgrid(rspace, cspace, indexing='ij'), axis=2)
+        if self.pyramid:
+            self.coarse_tgrid = self._pooled(
+                self.tgrid.transpose(2, 0, 1)).transpose(1, 2, 0)
+
+    def _uniform_weights(self, active=None):
+        """ equal weights for every particle, or for the active particles
+            of each run when given with adaptive_particles """
+        particle_count = self.sir_options['particle_count']
+        if not self.adaptive or active is None:
+            return np.full([self.run_count, particle_count],
+                           1/particle_count, dtype=np.float32)
+        return (self._active_mask(active) /
+                active[:, None]).astype(np.float32)
+
+    def _active_mask(self, active):
+        """ [runs, particles] mask of the active particles, None with a
+            fixed particle count """
+        if not self.adaptive:
+            return None
+        return np.arange(self.sir_options['particle_count']) < \
+            active[:, None]
+
+    def _predict(self, sir_p):
+        """ propagate particles through the system dynamics """
+        noise_p = np.stack(
+            [rng.standard_normal(sir_p.shape[1:]) for rng in self._rngs]
+        ).astype(np.float32) * self.system_u
+        return np.einsum('rpj,kj->rpk', sir_p, self.system_a) + noise_p
+
+    @staticmethod
+    def _gather_particles(values, indices):
+        """ gather [runs, particles, ...] values by per-run indices """
+        return values[np.arange(values.shape[0])[:, None], indices]
+
+    def _affine_sampler(self):
+        sampler = self.sir_options.get('sampler', 'grid')
+        if sampler not in ('grid', 'affine'):
+            raise ValueError("sampler must be 'grid' or 'affine'")
+        return sampler == 'affine'
+
+    def _sample(self, sir_p, frame, level=0):
+        """ bilinear interpolate the template grid transformed by each
+            particle of every run, returns [runs, particles, height, width]
+            at level 1 frame is pooled by _pooled and the coarse grid is
+            sampled """
+        grid = self.tgrid if level == 0 else self.coarse_tgrid
+        flat_p = sir_p.reshape(-1, 6)
+
+        # build magnification and rotation transformations
+        transform_c = np.cos(flat_p[:, 5])
+        transform_s = np.sin(flat_p[:, 5])
+        transform_rot = np.stack(
+            [np.stack([transform_c, -transform_s], axis=1),
+             np.stack([transform_s, transform_c], axis=1)], axis=2)
+        transform_rot_mag = transform_rot * flat_p[:, 4, None, None]
+
+        if self._affine_sampler():
+            translation = flat_p[:, 0:2]
+            if level:
+                factor = self._pyramid_option('pyramid_factor')
+                transform_rot_mag = transform_rot_mag / factor
+                translation = (translation - (factor - 1) / 2) / factor
+            return warp_bilinear(
+                frame, grid[:, 0, 0], grid[0, :, 1], transform_rot_mag,
+                translation).reshape(sir_p.shape[0], sir_p.shape[1],
+                                     grid.shape[0], grid.shape[1])
+
+        # transform and translate
+        transform_grid = np.einsum(
+            'mnz,pzk->pmnk', grid, transform_rot_mag)
+        transform_grid += flat_p[:, None, None, 0:2]
+        if level:
+            factor = self._pyramid_option('pyramid_factor')
+            transform_grid = (transform_grid - (factor - 1) / 2) / factor
+
+        interpolations = interpolate_bilinear(
+            frame, transform_grid.reshape(-1, 2))
+        return interpolations.reshape(
+            sir_p.shape[0], sir_p.shape[1], grid.shape[0], grid.shape[1])
+
+    def _sample_roi(self, roi_x, frame):
+        """ bilinear interpolate the template grid at a [runs, 4] region
+            of interest, returns [runs, height, width] """
+        roi_c = np.cos(roi_x[:, 3])
+        roi_s = np.sin(roi_x[:, 3])
+        roi_rot = np.stack(
+            [np.stack([roi_c, -roi_s], axis=1),
+             np.stack([roi_s, roi_c], axis=1)], axis=1)
+        roi_rot_mag = roi_rot * roi_x[:, 2, None, None]
+
+        if self._affine_sampler():
+            return warp_bilinear(
+                frame, self.tgrid[:, 0, 0], self.tgrid[0, :, 1],
+                roi_rot_mag, roi_x[:, 0:2])
+
+        roi_grid = np.einsum('mnz,rzk->rmnk', self.tgrid, roi_rot_mag)
+        roi_grid += roi_x[:, None, None, 0:2]
+
+        roi_out = interpolate_bilinear(frame, roi_grid.reshape(-1, 2))
+        return roi_out.reshape(
+            -1,
+            self.template_options['height'],
+            self.template_options['width'])
+
+    def _template_mask(self, level=0):
+        """ [height, width] mask of the template within its bucket at the
+            pyramid level, None without template_buckets """
+        if not self.bucketed:
+            return None
+        grid = self.tgrid if level == 0 else self.coarse_tgrid
+        size = self.template_size
+        if level:
+            size = size // self._pyramid_option('pyramid_factor')
+        return ((np.arange(grid.shape[0]) < size[0])[:, None] &
+                (np.arange(grid.shape[1]) < size[1])[None, :]).astype(
+                    np.float32)
+
+    def _masked(self, template):
+        """ templates zeroed outside the mask, as SIRGraph pushes them """
+        if not self.bucketed:
+            return template
+        return template * self._template_mask()
+
+    @staticmethod
+    def _template_energy(template, mask=None):
+        """ mean shifted template and its [runs, 1] energy, over mask
+            when given """
+        if mask is None:
+            mean_shifted_template = \
+                template - template.mean(axis=(1, 2), keepdims=True)
+        else:
+            mean_shifted_template = (template - (template * mask).sum(
+                axis=(1, 2), keepdims=True) / mask.sum()) * mask
+        e_template = np.einsum(
+            'rmn,rmn->r', mean_shifted_template, mean_shifted_template)
+        return mean_shifted_template, e_template[:, None]
+
+    @staticmethod
+    def _energies(interpolations, mean_shifted_template, mask=None):
+        """ spatial-support energy and template cross energy per particle,
+            over mask when given, reduced precision products are summed
+            in float32 """
+        if mask is not None:
+            ss_mean = (interpolations.astype(np.float32) * mask).sum(
+                axis=(2, 3), keepdims=True) / mask.sum()
+            mean_shifted_ss = (
+                interpolations - ss_mean.astype(interpolations.dtype)) * \
+                mask.astype(interpolations.dtype)
+        elif interpolations.dtype != np.float32:
+            mean_shifted_ss = interpolations - interpolations.mean(
+                axis=(2, 3), keepdims=True, dtype=np.float32).astype(
+                    interpolations.dtype)
+        else:
+            mean_shifted_ss = interpolations - \
+                interpolations.mean(axis=(2, 3), keepdims=True)
+
+        if interpolations.dtype != np.float32:
+            e_ss = np.square(mean_shifted_ss).sum(
+                axis=(2, 3), dtype=np.float32)
+            e_template_ss = (
+                mean_shifted_ss * mean_shifted_template[:, None]).sum(
+                    axis=(2, 3), dtype=np.float32)
+            return e_ss, e_template_ss
+
+        e_ss = np.einsum('rpmn,rpmn->rp', mean_shifted_ss, mean_shifted_ss)
+        e_template_ss = np.einsum(
+            'rpmn,rmn->rp', mean_shifted_ss, mean_shifted_template)
+        return e_ss, e_template_ss
+
+    def _chunk_size(self):
+        """ particles interpolated at once, None for all of them """
+        chunk = self.sir_options.get('score_chunk')
+        if chunk == 'auto':
+            budget = self.sir_options.get(
+                'score_memory_mb', SCORE_MEMORY_MB) * 2**20
+            sample_bytes = self.run_count * SAMPLE_BYTES * \
+                self.template_options['height'] * \
+                self.template_options['width']
+            chunk = max(1, int(budget // sample_bytes))
+        return chunk
+
+    def _score_dtype(self):
+        """ dtype of the interpolation and energy products, numpy has no
+            bfloat16 """
+        precision = self.sir_options.get('score_precision', 'float32')
+        if precision not in SCORE_PRECISIONS:
+            raise ValueError(
+                f"score_precision must be one of {SCORE_PRECISIONS}")
+        if precision == 'bfloat16':
+            raise ValueError(
+                "bfloat16 scoring needs the tensorflow backend")
+        return np.dtype(precision)
+
+    def _particle_energies(self, sir_p, frame, mean_shifted_template,
+                           level=0, dtype=None):
+        """ energies of [runs, particles, 6] particles, interpolated a
+            score_chunk of particles at a time when set, in the
+            score_precision dtype (or dtype) as SIRGraph scores them """
+        dtype = dtype or self._score_dtype()
+        mask = self._template_mask(level)
+        if dtype != np.float32:
+            frame = (frame * PRECISION_SCALE).astype(dtype)
+            mean_shifted_template = (
+                mean_shifted_template * PRECISION_SCALE).astype(dtype)
+
+        def energies(particles):
+            e_ss, e_template_ss = self._energies(
+                self._sample(particles, frame, level),
+                mean_shifted_template, mask)
+            if dtype == np.float32:
+                return e_ss, e_template_ss
+            return (e_ss / np.float32(PRECISION_SCALE**2),
+                    e_template_ss / np.float32(PRECISION_SCALE**2))
+
+        chunk = self._chunk_size()
+        if not chunk or chunk >= sir_p.shape[1]:
+            return energies(sir_p)
+        parts = [energies(sir_p[:, start:start + chunk])
+                 for start in range(0, sir_p.shape[1], chunk)]
+        return tuple(np.concatenate(part, axis=1) for part in zip(*parts))
+
+    def _pyramid_option(self, name):
+        return self.sir_options.get(name, PYRAMID_DEFAULTS.get(name))
+
+    def _pooled(self, images):
+        """ [batch, height, width] images averaged over blocks of
+            pyramid_factor pixels, partial blocks are dropped """
+        factor = self._pyramid_option('pyramid_factor')
+        batch, height, width = images.shape
+        height, width = height // factor, width // factor
+        blocks = images[:, 0:height * factor, 0:width * factor].reshape(
+            batch, height, factor, width, factor)
+        return blocks.mean(axis=(2, 4), dtype=np.float32)
+
+    def _coarse(self, frame, template):
+        """ pyramid level of the frame and the mean shifted template with
+            its energy, None without pyramid scoring """
+        if not self.pyramid:
+            return None
+        mean_shifted_template, e_template = self._template_energy(
+            self._pooled(template), self._template_mask(level=1))
+        return (self._pooled(frame[None])[0],
+                mean_shifted_template, e_template)
+
+    def _scored_energies(self, sir_p, frame, mean_shifted_template,
+                         e_template, coarse=None):
+        """ particle energies refined at full resolution only for the best
+            particles by coarse correlation when coarse is given, as
+            SIRGraph scores them, along with the pyramid correlation
+            error """
+        if coarse is None:
+            return self._particle_energies(
+                sir_p, frame, mean_shifted_template) + (None,)
+
+        coarse_frame, coarse_template, coarse_e_template = coarse
+        coarse_ss, coarse_template_ss = self._particle_energies(
+            sir_p, coarse_frame, coarse_template, level=1)
+        coarse_corr = coarse_template_ss / np.sqrt(
+            coarse_e_template * coarse_ss)
+
+        count = sir_p.shape[1]
+        threshold = self._pyramid_option('pyramid_threshold')
+        if threshold is None:
+            refined = int(np.ceil(
+                self._pyramid_option('pyramid_keep') * count))
+        else:
+            refined = max(int((coarse_corr >= threshold).sum(axis=1).max()),
+                          1)
+        top = np.argsort(-coarse_corr, axis=1, kind='stable')[:, 0:refined]
+        full_ss, full_template_ss = self._particle_energies(
+            self._gather_particles(sir_p, top), frame, mean_shifted_template)
+
+        ratio = e_template / coarse_e_template
+        e_ss = coarse_ss * ratio
+        e_template_ss = coarse_template_ss * ratio
+        runs = np.arange(self.run_count)[:, None]
+        e_ss[runs, top] = full_ss
+        e_template_ss[runs, top] = full_template_ss
+
+        error = np.abs(
+            self._gather_particles(coarse_corr, top) -
+            full_template_ss / np.sqrt(e_template * full_ss)).mean(axis=1)
+        return e_ss, e_template_ss, error
+
+    @staticmethod
+    def _with_current(history, current):
+        """ energy history with order 0 replaced by the current energies """
+        return {name: np.concatenate([current[name][..., None],
+                                      history[name][..., 1:]], axis=-1)
+                for name in ENERGY_NAMES}
+
+    @staticmethod
+    def _shift_history(history):
+        """ roll the energy history back one frame as SIRGraph does """
+        return {name: np.concatenate([energies[..., 0:1],
+                                      energies[..., 0:-1]], axis=-1)
+                for name, energies in history.items()}
+
+    def _resample_history(self, history, indices):
+        """ gather the particle energies of every order at once """
+        return {
+            'template': history['template'],
+            'ss': self._gather_particles(history['ss'], indices),
+            'template_ss': self._gather_particles(
+                history['template_ss'], indices)}
+
+    @staticmethod
+    def _correlation(history):
+        """ accumulated normalized correlation over the energy history """
+        return (history['template_ss'].sum(axis=-1) /
+                (np.sqrt(history['template'].sum(axis=-1)) *
+                 np.sqrt(history['ss'].sum(axis=-1))))
+
+    @staticmethod
+    def _score(corr, mask=None):
+        """ normalized exponential score from correlation, zero outside
+            mask when given """
+        score = np.exp(-100*(1.0-corr))
+        if mask is not None:
+            score = np.where(mask, score, 0).astype(score.dtype)
+        return score / score.sum(axis=-1, keepdims=True)
+
+    @staticmethod
+    def _normalize(weights):
+        """ scale the weights of each run to sum to one """
+        return weights / weights.sum(axis=-1, keepdims=True)
+
+    @staticmethod
+    def _estimate(weights, sir_p):
+        """ weighted particle mean of each run """
+        return np.einsum('rp,rpk->rk', weights, sir_p)
+
+    @staticmethod
+    def _neff(weights):
+        """ number of effective particles of each run """
+        return 1.0/np.einsum('rp,rp->r', weights, weights)
+
+    def _resample_indices(self, weights, runs=None):
+        """ draw particle indices proportional to weight for the given runs
+            (default all) with the configured resampler """
+        runs = range(self.run_count) if runs is None else runs
+        particle_count = weights.shape[1]
+        resampler = self.sir_options.get('resampler', 'multinomial')
+        if resampler not in ('multinomial', 'systematic', 'stratified'):
+            raise ValueError('unknown resampler {}'.format(resampler))
+
+        indices = []
+        for run in runs:
+            rng = self._rngs[run]
+            cdf = np.cumsum(weights[run], dtype=np.float64)
+            cdf /= cdf[-1]
+            if resampler == 'multinomial':
+                positions = rng.random_sample(particle_count)
+            else:
+                offsets = rng.random_sample(
+                    1 if resampler == 'systematic' else particle_count)
+                positions = (np.arange(particle_count) + offsets) / \
+                    particle_count
+            indices.append(np.minimum(
+                np.searchsorted(cdf, positions, side='right'),
+                particle_count - 1))
+        return np.array(indices, dtype=np.int64).reshape(
+            len(indices), particle_count)
+
+    def _kld_count(self, particles):
+        """ KLD-sampling particle count of each run over the (row, column)
+            bins its particles occupy, as SIRGraph computes it """
+        options = dict(KLD_DEFAULTS, **self.sir_options)
+        particle_count = options['particle_count']
+
+        bins = np.floor(particles[..., 0:2] / options['kld_bin_size'])
+        occupied = np.array([len(np.unique(run_bins, axis=0))
+                             for run_bins in bins])
+
+        # wilson-hilferty approximation of the chi-square quantile
+        dof = np.maximum(occupied - 1, 1).astype(np.float32)
+        spread = 2.0 / (9.0 * dof)
+        bound = dof / (2.0 * options['kld_epsilon']) * (
+            1.0 - spread + np.sqrt(spread) * options['kld_z']) ** 3
+        count = np.where(occupied > 1, np.ceil(bound), 0)
+        return np.clip(
+            count, min(options['min_particle_count'], particle_count),
+            particle_count).astype(np.int32)
+
+    def _draw(self, sir_p, sir_w, active, runs):
+        """ resample indices and active particle counts of the given runs,
+            with adaptive_particles the draws are shuffled so that their
+            active prefix is a fair sample of the weights """
+        ridx = self._resample_indices(sir_w, runs)
+        if not self.adaptive:
+            return ridx, active[runs]
+        ridx = np.array([self._rngs[run].permutation(run_ridx)
+                         for run, run_ridx in zip(runs, ridx)])
+        return ridx, self._kld_count(
+            self._gather_particles(sir_p[runs], ridx))
+
+    def _resample(self, sir_p, sir_w, history, active, kept_w=None):
+        """ resample particles, weights and particle energies, only the
+            runs whose neff fell below resample_threshold of their active
+            particles when set, the others keep kept_w (default sir_w),
+            returns them with the active counts """
+        kept_w = sir_w if kept_w is None else kept_w
+        threshold = self.sir_options.get('resample_threshold')
+        if not threshold:
+            needed = np.arange(self.run_count)
+        else:
+            needed = np.flatnonzero(self._neff(sir_w) < threshold * active)
+            if needed.size == 0:
+                return sir_p, kept_w, history, active
+
+        ridx = np.tile(np.arange(sir_w.shape[1]), [self.run_count, 1])
+        active = active.copy()
+        ridx[needed], active[needed] = self._draw(
+            sir_p, sir_w, active, needed)
+        sir_w = kept_w.copy()
+        sir_w[needed] = self._uniform_weights(active)[needed]
+        return (self._gather_particles(sir_p, ridx), sir_w,
+                self._resample_history(history, ridx), active)
+
+    def _max_source(self, sir_w, score, corr, mask=None):
+        """ per-particle value ranking templates for the history, only
+            particles inside mask rank when given """
+        if 'WEIGHT' in self.sir_options['update_method']:
+            source = sir_w
+        elif 'SCORE' in self.sir_options['update_method']:
+            source = score
+        elif 'CORRELATION' in self.sir_options['update_method']:
+            source = corr
+        else:
+            raise ValueError('unknown update method {}'.format(
+                self.sir_options['update_method']))
+        if mask is not None:
+            source = np.where(mask, source, -np.inf)
+        return source
+
+    def _historical_template(self):
+        """ template chosen from the history by the update method """
+        if 'SVD' in self.sir_options['update_method']:
+            return self.template_history.svd()
+        return self.template_history.best()
+
+    def _weigh(self, sir_p, sir_w, history, frame, mean_shifted_template,
+               e_template, active, coarse=None):
+        """ predict, score and reweight particles, with adaptive_particles
+            only the particles up to the largest active count are
+            interpolated; also returns the pyramid correlation error """
+        sir_p = self._predict(sir_p)
+        if self.adaptive:
+            scored = active.max()
+            e_ss = np.ones(sir_w.shape, dtype=np.float32)
+            e_template_ss = np.zeros_like(e_ss)
+            e_ss[:, 0:scored], e_template_ss[:, 0:scored], pyramid_error = \
+                self._scored_energies(
+                    sir_p[:, 0:scored], frame, mean_shifted_template,
+                    e_template, coarse)
+        else:
+            e_ss, e_template_ss, pyramid_error = self._scored_energies(
+                sir_p, frame, mean_shifted_template, e_template, coarse)
+        history = self._with_current(history, {
+            'template': e_template,
+            'ss': e_ss,
+            'template_ss': e_template_ss})
+        score = self._score(self._correlation(history),
+                            self._active_mask(active))
+        sir_w = self._normalize(score * sir_w)
+        return sir_p, sir_w, history, score, pyramid_error
+
+    def _step(self, sir_p, sir_w, history, frame, template, active):
+        """ one frame of the configured filter mode, returns the new state
+            along with the score, the auxiliary particles, the active
+            particle counts and the pyramid correlation error """
+        filter_mode = self.sir_options['filter_mode']
+        mean_shifted_template, e_template = self._template_energy(
+            template, self._template_mask())
+        coarse = self._coarse(frame, template)
+
+        p_aux = None
+        # weights before the look-ahead score, kept by runs that are not
+        # resampled so the frame's score weighs them only once
+        w_prev = sir_w
+        if filter_mode in ('NONE', 'AUX'):
+            history = self._shift_history(history)
+        if filter_mode == 'AUX':
+            p_aux = sir_p
+            _, sir_w, history, _, _ = self._weigh(
+                sir_p, sir_w, history, frame,
+                mean_shifted_template, e_template, active, coarse)
+            sir_p = p_aux
+        if filter_mode in ('RESAMPLE', 'AUX'):
+            sir_p, sir_w, history, active = self._resample(
+                sir_p, sir_w, history, active, w_prev)
+        sir_p, sir_w, history, score, pyramid_error = self._weigh(
+            sir_p, sir_w, history, frame, mean_shifted_template, e_template,
+            active, coarse)
+        return sir_p, sir_w, history, score, p_aux, active, pyramid_error
+
+    def session(self):
+        """ stand-in for SIRGraph.session, state lives in this object """
+        return NumpySession()
+
+    def reset(self, session, sir_options):  # pylint: disable=W0613
+        """ fresh filter state, random streams and template size for
+            sir_options, as SIRGraph.reset gives a pooled graph """
+        seeds = list(sir_options.get('seeds') or
+                     [sir_options['seed']])
+        if len(seeds) != self.run_count:
+            raise ValueError(
+                f"expected {self.run_count} seeds, got {len(seeds)}")
+        self.sir_options = sir_options
+        self.seeds = seeds
+        self.build_graph()
+
+    def load_frame(self, session, frame):  # pylint: disable=W0613
+        self.frame = np.asarray(frame, dtype=np.float32)
+
+    def load_frame_crop(self, session, frame):
+        """ frames are read in place, there is no upload to crop """
+        self.load_frame(session, frame)
+
+    def read_template(self, session):  # pylint: disable=W0613
+        """ [runs, height, width] templates, without bucket padding """
+        if not self.bucketed:
+            return self.template.copy()
+        return self.template[:, 0:self.template_size[0],
+                             0:self.template_size[1]].copy()
+
+    def set_template_size(self, session, height, width):
+        """ size of the template within its bucket """
+        # pylint: disable=W0613
+        self._build_lattice([height, width])
+
+    def filter_step(self, session):  # pylint: disable=W0613
+        """ advance one frame, returns a dictionary with the [runs, 6]
+            estimate, [runs] neff, [runs] active particle count and, with
+            pyramid scoring, [runs] pyramid error """
+        sir_p, sir_w, history, score, p_aux, active, pyramid_error = \
+            self._step(self.sir_p, self.sir_w, self.energy_history,
+                       self.frame, self.template, self.active_count)
+        if p_aux is not None:
+            self.p_aux = p_aux
+        self.sir_p = sir_p
+        self.sir_w = sir_w
+        self.active_count = active
+        self.energy_history = history
+        self.score_out = score
+        outputs = {
+            'estimate': self._estimate(self._normalize(score * sir_w), sir_p),
+            'neff': self._neff(sir_w),
+            'active': active}
+        if pyramid_error is not None:
+            outputs['pyramid_error'] = pyramid_error
+        return outputs
+
+    def filter_frames(self, session, frames, frame_numbers, gt_centers):
+        """ advance over a stack of frames, returns a dictionary of
+            per-frame estimate, error, neff, active, template_updated and,
+            with pyramid scoring, pyramid_error arrays """
+        update_interval = self.sir_options['update_interval']
+        outputs = {'estimate': [], 'error': [], 'neff': [], 'active': [],
+                   'template_updated': []}
+        for frame, frame_num, gtc in zip(frames, frame_numbers, gt_centers):
+            self.load_frame(session, frame)
+            do_update = update_interval > 0 and \
+                frame_num % update_interval == 0
+            self.maintain_template(session, do_update)
+            step = self.filter_step(session)
+            outputs['estimate'].append(step['estimate'])
+            outputs['error'].append(step['estimate'][:, 0:2] - gtc)
+            outputs['neff'].append(step['neff'])
+            outputs['active'].append(step['active'])
+            outputs['template_updated'].append(do_update)
+            if 'pyramid_error' in step:
+                outputs.setdefault('pyramid_error', []).append(
+                    step['pyramid_error'])
+        return {key: np.array(value) for key, value in outputs.items()}
+
+    def seed_particles(self, session, seed_x):  # pylint: disable=W0613
+        """ seed every run with the same [particles, 6] state and uniform
+            weights over every particle """
+        self.sir_p = np.array(
+            np.broadcast_to(seed_x, self.sir_p.shape), dtype=np.float32)
+        self.sir_w = self._uniform_weights()
+        self.active_count = np.full_like(
+            self.active_count, self.sir_options['particle_count'])
+
+    def best_correlation(self, session):  # pylint: disable=W0613
+        """ [runs] best correlation among the active particles of the
+            stored energy history """
+        corr = self._correlation(self.energy_history)
+        mask = self._active_mask(self.active_count)
+        if mask is not None:
+            corr = np.where(mask, corr, -np.inf)
+        return corr.max(axis=-1)
+
+    def precision_report(self, session):  # pylint: disable=W0613
+        """ dictionary of [runs] corr_error, score_error and
+            estimate_error of score_precision scoring against float32, as
+            SIRGraph reports them """
+        mean_shifted_template, e_template = \
+            self._template_energy(self.template, self._template_mask())
+        mask = self._active_mask(self.active_count)
+        scored = []
+        for dtype in (self._score_dtype(), np.dtype(np.float32)):
+            e_ss, e_template_ss = self._particle_energies(
+                self.sir_p, self.frame, mean_shifted_template, dtype=dtype)
+            corr = e_template_ss / np.sqrt(e_template * e_ss)
+            score = self._score(corr, mask)
+            scored.append((corr, score, self._estimate(score, self.sir_p)))
+        (corr, score, estimate), (corr_32, score_32, estimate_32) = scored
+
+        corr_error = np.abs(corr - corr_32)
+        if mask is not None:
+            corr_error = np.where(mask, corr_error, 0)
+        return {
+            'corr_error': corr_error.max(axis=1),
+            'score_error': np.abs(score - score_32).sum(axis=1) / 2,
+            'estimate_error': np.linalg.norm(
+                estimate[:, 0:2] - estimate_32[:, 0:2], axis=1)}
+
+    def redetect(self, session, centers, runs):  # pylint: disable=W0613
+        """ reseed the particles of runs at the best correlation peaks of
+            their template in the loaded frame, as SIRGraph does """
+        options = dict(REDETECT_DEFAULTS, **self.sir_options)
+        peaks, values = ncc_peaks(
+            self.frame, self.read_template(session), centers,
+            options.get('redetect_window'), options['redetect_peaks'],
+            options['redetect_radius'])
+        self.sir_p, self.sir_w = reseeded(
+            self.sir_p, self.sir_w, self.active_count, peaks, values, runs)
+        return peaks
+
+    def set_template_roi(self, session, row, col, mag, rot):
+        """ template of every run from a region of interest, values are
+            scalars shared by the runs or per-run arrays """
+        # pylint: disable=W0613
+        roi = np.stack(np.broadcast_arrays(row, col, mag, rot), axis=-1)
+        self.template = self._sample_roi(
+            np.broadcast_to(roi, [self.run_count, 4]).astype(np.float32),
+            self.frame)
+
+    def maintain_template(self, session, do_update):
+        mask = self._active_mask(self.active_count)
+        corr = self._correlation(self.energy_history)
+        if 'ESTIMATE' not in self.sir_options['update_method']:
+            max_source = self._max_source(
+                self.sir_w, self._score(corr, mask), corr, mask)
+            max_idx = np.argmax(max_source, axis=-1)[:, None]
+            self.template_history.push(
+                self._masked(self._sample(
+                    self._gather_particles(self.sir_p, max_idx),
+                    self.frame)[:, 0]),
+                self._gather_particles(max_source, max_idx)[:, 0])
+
+        if not do_update:
+            return
+
+        if 'ESTIMATE' in self.sir_options['update_method']:
+            est = self._estimate(
+                self._normalize(self.score_out * self.sir_w), self.sir_p)
+            self.set_template_roi(
+                session, est[:, 0], est[:, 1], est[:, 4], est[:, 5])
+        else:
+            self.template = self._historical_template()
+
+    def store_energies(self, session):  # pylint: disable=W0613
+        """ energies of the current particles into history order 0 """
+        mean_shifted_template, e_template = \
+            self._template_energy(self.template, self._template_mask())
+        e_ss, e_template_ss = self._particle_energies(
+            self.sir_p, self.frame, mean_shifted_template)
+        self.energy_history = self._with_current(self.energy_history, {
+            'template': e_template,
+            'ss': e_ss,
+            'template_ss': e_template_ss})
+
+    def _store_score(self):
+        """ score of the energy history, kept like SIRGraph.store_score """
+        self.score_out = self._score(
+            self._correlation(self.energy_history),
+            self._active_mask(self.active_count))
+        return self.score_out
+
+    def load_state(self, sir_graph, session):
+        """ copy every state variable from a SIRGraph session """
+        names = ['frame', 'template', 'sir_p', 'p_aux', 'sir_w',
+                 'active_count']
+        values = session.run([getattr(sir_graph, n) for n in names])
+        for name, value in zip(names, values):
+            setattr(self, name, value)
+        self.energy_history = session.run(sir_graph.energy_history)
+        if 'ESTIMATE' not in self.sir_options['update_method']:
+            state = session.run(sir_graph.template_history.state)
+            history = self.template_history
+            history.template_history = state.pop('templates')
+            history.value_history = state.pop('values')
+            for name, value in state.items():
+                setattr(history, name, value)
+
+
+def score_difference(sir_graph, session, numpy_graph):
+    """ largest absolute difference between the particle scores of a
+        SIRGraph session and a NumpySIRGraph loaded with the same state,
+        the two are expected to agree to float32 tolerance """
+    numpy_graph.load_state(sir_graph, session)
+    sir_graph.store_energies(session)
+    tf_score = session.run(sir_graph.store_score)
+    with numpy_graph.session() as numpy_session:
+        numpy_graph.store_energies(numpy_session)
+        numpy_score = numpy_session.run(numpy_graph.store_score)
+    return float(np.max(np.abs(tf_score - numpy_score)))
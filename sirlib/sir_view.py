@@ -27,9 +27,9 @@ class SIRView(QWidget, SIR_VIEW):
 
     @pyqtSlot(dict)
     def change_frame(self, frame_details):
-        """ slot called when frame changes """
+        """ slot called when frame changes, showing the first run """
 
-        estimate = frame_details['estimate']
+        estimate = frame_details['estimate'][0]
 
         # plot over frame and display
         colorized = cvtColor(frame_details['frame'], COLOR_GRAY2BGR)
@@ -62,8 +62,8 @@ class SIRView(QWidget, SIR_VIEW):
             f"{estimate[3]:6.1f}, "
             f"{estimate[4]:6.1f}, "
             f"{estimate[5]:6.1f})\n"
-            f"Error: {np.linalg.norm(frame_details['error'])}\n"
-            f"Neff: {frame_details['neff']}"
+            f"Error: {np.linalg.norm(frame_details['error'][0])}\n"
+            f"Neff: {frame_details['neff'][0]}"
         )
         self.lbl_frame_details.setText(frame_details)
 
@@ -1,19 +1,34 @@
 """ class and methods for template updating """
 import tensorflow as tf
+from sir_energy import SVD_OVERSAMPLING
+
+# floor on residual norms of the rank-one updates
+_EPSILON = 1e-12
 
 
 class TemplateHistory():
-    """ container for template history """
+    """ container for template history, every tensor has a leading run
+        dimension and each run keeps its own history
+
+        the history is a ring buffer: write_index is the slot the next
+        push writes, so the newest template sits one slot before it
+
+        with incremental set, a truncated SVD of the history (templates
+        in columns) is kept up to date by a rank-one modification per
+        push instead of decomposing the whole history on every update """
 
     def __init__(self, graph, history_length,
-                 template_source, value_source):
+                 template_source, value_source, rank=1, incremental=False):
         self.graph = graph
         self.history_length = history_length
+        self.rank = min(rank, history_length)
+        self.incremental = incremental
+        self._factor_rank = min(rank + SVD_OVERSAMPLING, history_length)
         self._template_source = template_source
-        self._t_h = template_source.shape[0]
-        self._t_w = template_source.shape[1]
+        self._runs = template_source.shape[0]
+        self._t_h = template_source.shape[1]
+        self._t_w = template_source.shape[2]
         self._value_source = value_source
-        self._seeded_count = history_length-1
         self.build_graph()
 
     def build_graph(self):
@@ -22,56 +37,229 @@ class TemplateHistory():
             with tf.variable_scope('template_history'):
                 self.template_history = tf.get_variable(
                     'template_history',
-                    [self.history_length, self._t_h, self._t_w],
+                    [self._runs, self.history_length,
+                     self._t_h, self._t_w],
                     dtype=tf.float32,
                     initializer=tf.zeros_initializer
                 )
                 self.value_history = tf.get_variable(
                     'value_history',
-                    [self.history_length],
+                    [self._runs, self.history_length],
                     dtype=tf.float32,
                     initializer=tf.zeros_initializer
                 )
-                self._push_template_assign = self.template_history.assign(
-                    tf.concat(
-                        [tf.expand_dims(self._template_source, 0),
-                         self.template_history[0:-1]],
-                        axis=0
-                    )
+                self.write_index = tf.get_variable(
+                    'write_index',
+                    [],
+                    dtype=tf.int32,
+                    initializer=tf.zeros_initializer
                 )
-                self._push_value_assign = self.value_history.assign(
-                    tf.concat(
-                        [tf.expand_dims(self._value_source, 0),
-                         self.value_history[0:-1]],
-                        axis=0
-                    )
+                # the first push seeds every slot of the history
+                self.seeded = tf.get_variable(
+                    'seeded',
+                    [],
+                    dtype=tf.bool,
+                    initializer=tf.zeros_initializer
                 )
+                self.state = {
+                    'templates': self.template_history,
+                    'values': self.value_history,
+                    'write_index': self.write_index,
+                    'seeded': self.seeded}
+
+                if self.incremental:
+                    # truncated factors of the history, templates are
+                    # approximately svd_u * svd_s * svd_v^T
+                    factor_shapes = {
+                        'svd_u': [self._runs, self._t_h * self._t_w,
+                                  self._factor_rank],
+                        'svd_s': [self._runs, self._factor_rank],
+                        'svd_v': [self._runs, self.history_length,
+                                  self._factor_rank]}
+                    for name, shape in factor_shapes.items():
+                        self.state[name] = tf.get_variable(
+                            name, shape, dtype=tf.float32,
+                            initializer=tf.zeros_initializer)
+
+                self._push = self._build_push()
+
                 # best template retrieval graph
-                self._max_index = tf.argmax(self.value_history)
-                self._best_template = self.template_history[self._max_index]
-                self._best_value = self.value_history[self._max_index]
+                self._best_template = self.best(self.state)
+                self._best_value = tf.reduce_max(self.value_history, axis=1)
 
                 # SVD generated template graph
-                # reshape into rows and transpose so templates are in columns
-                spaghettified = tf.reshape(
-                    self.template_history, [self.history_length, -1])
-                spaghettified = tf.transpose(spaghettified)
-                s, u, v = tf.svd(spaghettified)  # pylint: disable=C0103
                 # pylint: disable=C0103
-                self._SVD_composite = u[:, 0] * s[0] * v[0, 0]
-                self._SVD_composite = tf.reshape(
-                    self._SVD_composite, [self._t_h, self._t_w])
+                self._SVD_composite = self.svd(self.state)
+
+    def _build_push(self):
+        """ write the sources into one slot of the history variables, or
+            broadcast them into every slot while not yet seeded """
+        def push():
+            state = {name: tf.identity(variable)
+                     for name, variable in self.state.items()}
+            factors = {}
+            if self.incremental:
+                factors = self._replaced_factors(
+                    state, self._template_source)
+            indices = tf.stack(
+                [tf.range(self._runs),
+                 tf.fill([self._runs], state['write_index'])], axis=1)
+            # the replaced slot is read before it is written
+            with tf.control_dependencies(list(factors.values())):
+                assigns = [
+                    tf.scatter_nd_update(self.template_history, indices,
+                                         self._template_source),
+                    tf.scatter_nd_update(self.value_history, indices,
+                                         self._value_source)]
+            assigns += [self.state[name].assign(value)
+                        for name, value in factors.items()]
+            with tf.control_dependencies(assigns):
+                return (state['write_index'] + 1) % self.history_length
+
+        def seed():
+            seeded = self.seeded_history(
+                self._template_source, self._value_source)
+            with tf.control_dependencies([
+                    self.state[name].assign(seeded[name])
+                    for name in seeded
+                    if name not in ('write_index', 'seeded')]):
+                return tf.identity(seeded['write_index'])
+
+        next_index = tf.cond(self.seeded, push, seed)
+        with tf.control_dependencies([self.write_index.assign(next_index)]):
+            return self.seeded.assign(True)
+
+    def seeded_history(self, template, value):
+        """ history state with every slot holding template and value """
+        state = {
+            'templates': tf.tile(tf.expand_dims(template, 1),
+                                 [1, self.history_length, 1, 1]),
+            'values': tf.tile(tf.expand_dims(value, 1),
+                              [1, self.history_length]),
+            'write_index': tf.constant(1 % self.history_length),
+            'seeded': tf.constant(True)}
+
+        if self.incremental:
+            # identical columns have a single nonzero singular value
+            flat = tf.reshape(template, [self._runs, -1])
+            norm = tf.norm(flat, axis=1, keepdims=True)
+            padding = [[0, 0], [0, 0], [0, self._factor_rank - 1]]
+            state['svd_u'] = tf.pad(
+                tf.expand_dims(flat / tf.maximum(norm, _EPSILON), 2),
+                padding)
+            state['svd_s'] = tf.pad(
+                norm * self.history_length ** 0.5,
+                [[0, 0], [0, self._factor_rank - 1]])
+            state['svd_v'] = tf.pad(
+                tf.fill([self._runs, self.history_length, 1],
+                        self.history_length ** -0.5),
+                padding)
+        return state
+
+    def pushed(self, state, template, value):
+        """ history state after writing template and value into the write
+            slot, every slot is filled with them while not yet seeded """
+        def push():
+            write_index = state['write_index']
+            # only the write slot of each run is written, as _build_push
+            indices = tf.stack(
+                [tf.range(self._runs),
+                 tf.fill([self._runs], write_index)], axis=1)
+            new_state = {
+                'templates': tf.tensor_scatter_nd_update(
+                    state['templates'], indices, template),
+                'values': tf.tensor_scatter_nd_update(
+                    state['values'], indices, value),
+                'write_index': (write_index + 1) % self.history_length,
+                'seeded': tf.constant(True)}
+            if self.incremental:
+                new_state.update(self._replaced_factors(state, template))
+            return new_state
+
+        return tf.cond(state['seeded'], push,
+                       lambda: self.seeded_history(template, value))
+
+    def _replaced_factors(self, state, template):
+        """ truncated factors after replacing the write slot's template,
+            a rank-one downdate of the dropped template and update with
+            the new one applied as the single modification a * b^T with
+            a = template - dropped and b = e_write_index """
+        # pylint: disable=C0103
+        u, s, v = state['svd_u'], state['svd_s'], state['svd_v']
+        write_index = state['write_index']
+        runs = tf.shape(s)[0]
+
+        dropped = tf.gather(state['templates'], write_index, axis=1)
+        a = tf.reshape(template - dropped, [runs, -1])
+        b = tf.tile(tf.expand_dims(
+            tf.one_hot(write_index, self.history_length), 0), [runs, 1])
+
+        # components of a and b in and orthogonal to the factor spans,
+        # projected twice to keep the bases orthogonal in float32
+        def split(basis, vector):
+            coeffs = tf.einsum('rdk,rd->rk', basis, vector)
+            residual = vector - tf.einsum('rdk,rk->rd', basis, coeffs)
+            correction = tf.einsum('rdk,rd->rk', basis, residual)
+            residual -= tf.einsum('rdk,rk->rd', basis, correction)
+            norm = tf.norm(residual, axis=1, keepdims=True)
+            return (coeffs + correction, norm,
+                    tf.expand_dims(residual / tf.maximum(norm, _EPSILON), 2))
+
+        m, r_a, p = split(u, a)
+        n, r_b, q = split(v, b)
+
+        # small core matrix whose SVD rotates the extended bases
+        core = tf.matrix_diag(tf.pad(s, [[0, 0], [0, 1]])) + tf.einsum(
+            'ri,rj->rij', tf.concat([m, r_a], axis=1),
+            tf.concat([n, r_b], axis=1))
+        core_s, core_u, core_v = tf.svd(core)
+
+        rank = self._factor_rank
+        return {
+            'svd_u': tf.einsum('rdi,rik->rdk',
+                               tf.concat([u, p], axis=2),
+                               core_u[:, :, 0:rank]),
+            'svd_s': core_s[:, 0:rank],
+            'svd_v': tf.einsum('rli,rik->rlk',
+                               tf.concat([v, q], axis=2),
+                               core_v[:, :, 0:rank])}
+
+    def _newest_first(self, write_index):
+        """ slots ordered from the newest push to the oldest """
+        return tf.floormod(
+            write_index - 1 - tf.range(self.history_length),
+            self.history_length)
+
+    def best(self, state):
+        """ template of each run with the highest associated value, ties
+            go to the newest """
+        values = state['values']
+        order = self._newest_first(state['write_index'])
+        slots = tf.gather(
+            order, tf.argmax(tf.gather(values, order, axis=1), axis=1))
+        return tf.gather_nd(state['templates'], tf.stack(
+            [tf.range(tf.shape(values)[0]), slots], axis=1))
+
+    def svd(self, state):
+        """ rank-k SVD composite of a template history: the newest
+            template's column of the rank-k approximation """
+        newest = self._newest_first(state['write_index'])[0]
+        if self.incremental:
+            u, s, v = state['svd_u'], state['svd_s'], state['svd_v']
+        else:
+            # reshape into rows and transpose so templates are in columns
+            spaghettified = tf.reshape(
+                state['templates'], [self._runs, self.history_length, -1])
+            spaghettified = tf.transpose(spaghettified, [0, 2, 1])
+            s, u, v = tf.svd(spaghettified)  # pylint: disable=C0103
+        composite = tf.einsum(
+            'rdk,rk->rd', u[:, :, 0:self.rank],
+            s[:, 0:self.rank] * v[:, newest, 0:self.rank])
+        return tf.reshape(composite, [self._runs, self._t_h, self._t_w])
 
     def push_template(self, session):
         """ push template and value into history queue """
-
-        while True:
-            session.run(self._push_template_assign)
-            session.run(self._push_value_assign)
-            if self._seeded_count == 0:
-                break
-            else:
-                self._seeded_count -= 1
+        session.run(self._push)
 
     def get_best(self):
         """ retrieve best template tensor given associated value """
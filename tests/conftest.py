@@ -0,0 +1,5 @@
+""" the sirlib modules import each other by name, as the scripts run """
+from os import path
+import sys
+
+sys.path.insert(0, path.join(path.dirname(__file__), '..', 'sirlib'))
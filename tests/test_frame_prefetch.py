@@ -0,0 +1,57 @@
+""" the background frame reader of the tracker loop """
+import threading
+import numpy as np
+import pytest
+
+from frame_prefetch import FramePrefetcher
+
+
+class FakeVideo(object):
+    """ frames filled with their number, raising from fail_at on """
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+
+    def get_pix_frame(self, frame_num):
+        if self.fail_at is not None and frame_num >= self.fail_at:
+            raise IOError('truncated frame {}'.format(frame_num))
+        return np.full((4, 4), frame_num, dtype=np.uint8)
+
+
+def test_frames_served_in_order():
+    prefetcher = FramePrefetcher(FakeVideo(), 0, 10, depth=3)
+    try:
+        for frame_num in range(10):
+            assert prefetcher.get_pix_frame(frame_num)[0, 0] == frame_num
+    finally:
+        prefetcher.close()
+    assert prefetcher.stats()['frames_served'] == 10
+
+
+def test_decode_error_raised_to_consumer():
+    prefetcher = FramePrefetcher(FakeVideo(fail_at=2), 0, 10, depth=4)
+    served = []
+    raised = []
+
+    def consume():
+        try:
+            for frame_num in range(10):
+                served.append(prefetcher.get_pix_frame(frame_num)[0, 0])
+        except IOError as error:
+            raised.append(error)
+
+    consumer = threading.Thread(target=consume, daemon=True)
+    consumer.start()
+    consumer.join(timeout=10)
+    prefetcher.close()
+
+    assert not consumer.is_alive(), 'consumer blocked on a failed read'
+    assert served == [0, 1]
+    assert len(raised) == 1 and 'frame 2' in str(raised[0])
+
+
+def test_decode_error_on_first_frame():
+    prefetcher = FramePrefetcher(FakeVideo(fail_at=0), 0, 10)
+    with pytest.raises(IOError):
+        prefetcher.get_pix_frame(0)
+    prefetcher.close()
@@ -0,0 +1,56 @@
+""" the numpy engine against SIRGraph on the same particles """
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+# pylint: disable=C0413
+from sir_graph import SIRGraph  # noqa: E402
+from sir_numpy import NumpySIRGraph, score_difference  # noqa: E402
+
+# both engines score in float32, they differ by summation order only
+SCORE_TOLERANCE = 1e-4
+ESTIMATE_TOLERANCE_PX = 1e-2
+
+
+def synthetic_frame(k):
+    """ textured 120x160 frame with a blob drifting down and right """
+    rows, cols = np.mgrid[0:120, 0:160]
+    texture = 60 * np.sin(cols / 9.) * np.cos(rows / 13.)
+    target = 150 * np.exp(-((rows - 50 - k)**2 / 90. +
+                            (cols - 60 - 1.5 * k)**2 / 40.))
+    return np.clip(100 + texture + target, 0, 255).astype(np.float32)
+
+
+@pytest.mark.parametrize('score_type', ['NCC', 'ASVHO'])
+def test_numpy_engine_matches_sir_graph(score_type):
+    sir_options = {'seeds': [3, 4], 'particle_count': 64,
+                   'score_type': score_type, 'filter_mode': 'NONE',
+                   'update_interval': 0, 'update_method': 'SCORE',
+                   'historical_length': 4}
+    video_options = {'height': 120, 'width': 160}
+    template_options = {'height': 21, 'width': 17}
+    sir_graph = SIRGraph(sir_options, video_options, template_options)
+    numpy_graph = NumpySIRGraph(
+        sir_options, video_options, template_options)
+
+    with sir_graph.session() as session:
+        sir_graph.load_frame(session, synthetic_frame(0))
+        sir_graph.set_template_roi(session, 50, 60, 1, 0)
+        sir_graph.seed_particles(session, [50, 60, 0, 0, 1, 0])
+        for k in range(6):
+            sir_graph.load_frame(session, synthetic_frame(k))
+            sir_graph.shift_energies(session)
+            session.run(sir_graph.predict_from_p)
+
+            # both engines score the particles the graph predicted
+            assert score_difference(
+                sir_graph, session, numpy_graph) <= SCORE_TOLERANCE
+            estimate = session.run(sir_graph.estimate)
+            numpy_estimate = numpy_graph._estimate(  # pylint: disable=W0212
+                numpy_graph._normalize(  # pylint: disable=W0212
+                    numpy_graph.score_out * numpy_graph.sir_w),
+                numpy_graph.sir_p)
+            assert np.abs(estimate[:, 0:2] - numpy_estimate[:, 0:2]).max() \
+                <= ESTIMATE_TOLERANCE_PX
+            session.run(sir_graph.update_w)
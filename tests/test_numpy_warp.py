@@ -0,0 +1,25 @@
+""" the affine sampler of the numpy engine """
+import numpy as np
+
+from sir_numpy import warp_bilinear, _warp_part  # pylint: disable=W0212
+
+
+def test_mixed_rotations_match_dense_warp():
+    """ unrotated transforms warped separably match the dense warp """
+    rng = np.random.RandomState(0)
+    frame = rng.uniform(0, 255, (60, 80)).astype(np.float32)
+    rows = np.linspace(-5, 5, 11, dtype=np.float32)
+    cols = np.linspace(-4, 4, 9, dtype=np.float32)
+    count = 20
+    rotation = np.where(np.arange(count) % 2, 0, rng.normal(0, .1, count))
+    scale = 1 + rng.normal(0, .05, count)
+    transform = (np.stack([
+        np.stack([np.cos(rotation), -np.sin(rotation)], axis=1),
+        np.stack([np.sin(rotation), np.cos(rotation)], axis=1)], axis=2) *
+                 scale[:, None, None]).astype(np.float32)
+    translation = rng.uniform(5, 55, (count, 2)).astype(np.float32)
+
+    warped = warp_bilinear(frame, rows, cols, transform, translation)
+    dense = _warp_part(frame, rows, cols, transform, translation, False)
+    assert warped.shape == (count, 11, 9)
+    np.testing.assert_array_equal(warped, dense)
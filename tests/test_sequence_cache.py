@@ -0,0 +1,67 @@
+""" decoded frames shared between jobs and processes """
+from os import path
+import numpy as np
+import pytest
+
+import sequence_cache
+from sequence_cache import SequenceCache
+
+pytestmark = pytest.mark.skipif(
+    sequence_cache.shared_memory is None, reason='no shared memory')
+
+
+class FakeVideo(object):
+    """ frames filled with their number, raising from fail_at on """
+
+    def __init__(self, fail_at=None, length=5, height=6, width=8):
+        self.fail_at = fail_at
+        self.length, self.height, self.width = length, height, width
+        self.decoded = 0
+
+    def get_pix_frame(self, frame_num):
+        if self.fail_at is not None and frame_num >= self.fail_at:
+            raise IOError('truncated frame {}'.format(frame_num))
+        self.decoded += 1
+        return np.full((self.height, self.width), frame_num, np.uint8)
+
+
+def segment_exists(key):
+    """ whether the shared segment of key is still linked """
+    try:
+        segment = sequence_cache._attach(  # pylint: disable=W0212
+            sequence_cache._segment_name(key))  # pylint: disable=W0212
+    except FileNotFoundError:
+        return False
+    segment.close()
+    return True
+
+
+def test_last_holder_unlinks(tmp_path):
+    """ caches standing in for two processes share one decoded segment,
+        which outlives the decoding one until the other lets go """
+    key = path.join(str(tmp_path), 'seq')
+    first, second = SequenceCache(), SequenceCache()
+    video = FakeVideo()
+
+    frames = first.acquire(key, video)
+    assert second.acquire(key, FakeVideo(fail_at=0))[3, 0, 0] == 3
+    assert video.decoded == 5
+    del frames
+
+    first.clear()
+    assert segment_exists(key)
+    second.clear()
+    assert not segment_exists(key)
+
+
+def test_failed_decode_unlinks(tmp_path):
+    key = path.join(str(tmp_path), 'seq')
+    cache = SequenceCache()
+    with pytest.raises(IOError):
+        cache.acquire(key, FakeVideo(fail_at=2))
+    assert not segment_exists(key)
+
+    # a later acquire decodes it afresh
+    assert cache.acquire(key, FakeVideo())[4, 0, 0] == 4
+    cache.clear()
+    assert not segment_exists(key)
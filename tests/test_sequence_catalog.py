@@ -0,0 +1,35 @@
+""" the on-disk index of sequence metadata """
+import os
+import threading
+import numpy as np
+
+from sequence_catalog import SequenceCatalog
+
+
+def test_concurrent_saves_publish_a_whole_index(tmp_path):
+    """ catalogs of one root saving at once leave a readable index and no
+        temporary files """
+    catalogs = [SequenceCatalog(str(tmp_path)) for _ in range(8)]
+    for k, catalog in enumerate(catalogs):
+        catalog._entries = {  # pylint: disable=W0212
+            'seq{}'.format(n): {'g_t': np.full((4, 100), k, np.float64)}
+            for n in range(50)}
+
+    barrier = threading.Barrier(len(catalogs))
+
+    def save(catalog):
+        barrier.wait()
+        for _ in range(5):
+            catalog.save()
+
+    threads = [threading.Thread(target=save, args=(c,)) for c in catalogs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert os.listdir(str(tmp_path)) == ['sequence_catalog.pkl']
+    entries = SequenceCatalog(str(tmp_path))._entries  # pylint: disable=W0212
+    assert len(entries) == 50
+    values = {float(e['g_t'][0, 0]) for e in entries.values()}
+    assert len(values) == 1
@@ -0,0 +1,21 @@
+""" the xla compiled filter step against the unfused graph """
+import pytest
+
+pytest.importorskip('tensorflow')
+
+# pylint: disable=C0413
+from sir_graph import _compare_xla  # noqa: E402
+
+# the random draws are not compiled, so both graphs see the same noise and
+# differ only by float reassociation inside the fused kernels
+TOLERANCE_PX = 0.5
+
+
+def test_xla_matches_unfused_graph(record_property):
+    difference, unfused, compiled = _compare_xla(
+        frame_count=12, particle_count=100, run_count=2, score_type='NCC')
+    record_property('graph_ms_per_frame', unfused * 1e3)
+    record_property('xla_ms_per_frame', compiled * 1e3)
+    print('per frame: graph {:.2f} ms, xla {:.2f} ms'.format(
+        unfused * 1e3, compiled * 1e3))
+    assert difference <= TOLERANCE_PX